@@ -0,0 +1,121 @@
+"""
+Rows/s of the raw AIS filters before and after the vectorized numeric validation and
+memoized destination cleanup, on synthetic AIS-DK and AIS-US days
+
+    python benchmarks/bench_ais_data_filter.py --rows 1000000
+
+The "before" run swaps the per-row implementations back into ais_data_filter, so both runs
+go through the same filter functions; their outputs are checked to be identical.
+"""
+import sys, os, time, argparse, contextlib
+import numpy as np
+import pandas as pd
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_path)
+
+from src.data.utils import ais_data_filter
+
+
+def legacy_is_unsigned_decimal(series):
+    return series.apply(lambda x: str(x).replace('.', '', 1).isdigit())
+
+
+def legacy_normalize_destinations(destinations):
+    return destinations.apply(ais_data_filter.process_destination)
+
+
+@contextlib.contextmanager
+def legacy_filters():
+    current = ais_data_filter.is_unsigned_decimal, ais_data_filter.normalize_destinations
+    ais_data_filter.is_unsigned_decimal = legacy_is_unsigned_decimal
+    ais_data_filter.normalize_destinations = legacy_normalize_destinations
+    try:
+        yield
+    finally:
+        ais_data_filter.is_unsigned_decimal, ais_data_filter.normalize_destinations = current
+
+
+def numeric_column(rng, n, low, high, kind):
+    """Mostly valid values with NaN, negative and (for object columns) unparseable entries"""
+    values = np.round(rng.uniform(low, high, n), 1)
+    values[rng.random(n) < 0.02] = -1.0
+    if kind == "int":
+        return pd.Series(values.astype(np.int64))
+    values[rng.random(n) < 0.02] = np.nan
+    if kind == "float":
+        return pd.Series(values)
+    column = pd.Series(values.astype(object))
+    column[rng.random(n) < 0.02] = "n/a"
+    column[rng.random(n) < 0.02] = "1e5"
+    return column
+
+
+def denmark_frame(rng, n, kind):
+    destinations = np.array(["AARHUS", "DK CPH", "SE GOT>DK AAR", "ESBJERG.", "Unknown", "=HAMBURG", "?",
+                             "NLRTM", "FOR ORDERS", "GDANSK/POL"] + [f"PORT {i}" for i in range(2000)], dtype=object)
+    return pd.DataFrame({
+        "# Timestamp": "01/03/2024 00:00:00",
+        "MMSI": rng.integers(0, 5000, n) + 219000000,
+        "Latitude": rng.uniform(53, 59, n),
+        "Longitude": rng.uniform(5, 16, n),
+        "Heading": numeric_column(rng, n, 0, 360, kind),
+        "COG": numeric_column(rng, n, 0, 360, kind),
+        "ROT": numeric_column(rng, n, 0, 50, kind),
+        "SOG": numeric_column(rng, n, 0, 30, kind),
+        "Navigational status": rng.choice(["Under way using engine", "Moored", "Unknown value"], n),
+        "Cargo type": rng.choice(["Category X", "No additional information"], n),
+        "Destination": rng.choice(destinations, n),
+        "Draught": numeric_column(rng, n, 1, 15, kind),
+        "Length": numeric_column(rng, n, 5, 300, kind),
+        "Width": numeric_column(rng, n, 2, 50, kind),
+        "Ship type": rng.choice(["Cargo", "Tanker", "Undefined"], n),
+    })
+
+
+def american_frame(rng, n, kind):
+    return pd.DataFrame({
+        "MMSI": rng.integers(0, 5000, n) + 367000000,
+        "BaseDateTime": "2024-03-01T00:00:00",
+        "LAT": rng.uniform(20, 50, n),
+        "LON": rng.uniform(-130, -60, n),
+        "Heading": numeric_column(rng, n, 0, 360, kind),
+        "COG": numeric_column(rng, n, 0, 360, kind),
+        "SOG": numeric_column(rng, n, 0, 30, kind),
+        "Status": rng.integers(0, 16, n),
+        "Cargo": rng.integers(0, 100, n),
+        "Draft": numeric_column(rng, n, 1, 15, kind),
+        "Length": numeric_column(rng, n, 5, 300, kind),
+        "Width": numeric_column(rng, n, 2, 50, kind),
+        "VesselType": rng.integers(0, 100, n),
+    })
+
+
+def best_time(fn, df, repeat):
+    result, best = None, float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(df.copy())
+        best = min(best, time.perf_counter() - t0)
+    return result, best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the raw AIS filters before/after vectorization")
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows per synthetic day")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    cli_args = parser.parse_args()
+
+    rng = np.random.default_rng(cli_args.seed)
+    print(f"{'filter':26} {'columns':8} {'before rows/s':>14} {'after rows/s':>14} {'speedup':>8}")
+    for name, make_frame in [("denmark_ais_data_filter", denmark_frame), ("american_ais_data_filter", american_frame)]:
+        fn = getattr(ais_data_filter, name)
+        for kind in ("float", "int", "object"):
+            df = make_frame(rng, cli_args.rows, kind)
+            with legacy_filters():
+                before, before_sec = best_time(fn, df, cli_args.repeat)
+            after, after_sec = best_time(fn, df, cli_args.repeat)
+            pd.testing.assert_frame_equal(before, after)
+            print(f"{name:26} {kind:8} {len(df) / before_sec:>14,.0f} {len(df) / after_sec:>14,.0f} "
+                  f"{before_sec / after_sec:>7.1f}x")
@@ -0,0 +1,64 @@
+"""
+Latency of SparseWeights.top_k when single add() calls are interleaved with queries, as the SDKG
+updates and candidate selections of the scheduler are
+
+    python benchmarks/bench_sparse_weights.py --entries 300000
+
+The "before" run compacts on every query, as the weights did before pending triplets were read
+through an overlay; both runs answer every query identically.
+"""
+import sys, os, time, argparse
+import numpy as np
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_path)
+
+from src.utils.SparseWeights import SparseWeights
+
+
+def build(rng, entries, n_rows, n_cols):
+    weights = SparseWeights()
+    for row, col in zip(rng.integers(0, n_rows, entries), rng.integers(0, n_cols, entries)):
+        weights.add(f"r{row}", f"c{col}")
+    weights.top_k([["r0"]], 1)
+    return weights
+
+
+def interleave(weights, rng, rounds, n_rows, n_cols, query_rows, k):
+    """Returns: (per-query seconds, answers) of rounds of one add() followed by one top_k()"""
+    latencies, answers = [], []
+    for _ in range(rounds):
+        weights.add(f"r{rng.integers(n_rows)}", f"c{rng.integers(n_cols)}")
+        query = [f"r{row}" for row in rng.integers(0, n_rows, query_rows)]
+        t0 = time.perf_counter()
+        answers.append(weights.top_k([query], k))
+        latencies.append(time.perf_counter() - t0)
+    return np.asarray(latencies), answers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark interleaved SparseWeights updates and queries")
+    parser.add_argument("--entries", type=int, default=300000, help="Entries added before the interleaved rounds")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--cols", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=2000, help="Interleaved add/query rounds")
+    parser.add_argument("--query_rows", type=int, default=4, help="Rows per query")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    cli_args = parser.parse_args()
+
+    runs = {}
+    for label, compact_min in (("before", 0), ("after", SparseWeights.COMPACT_MIN_PENDING)):
+        weights = build(np.random.default_rng(cli_args.seed), cli_args.entries, cli_args.rows, cli_args.cols)
+        weights.COMPACT_MIN_PENDING = compact_min
+        if compact_min == 0:
+            weights.COMPACT_RATIO = np.iinfo(np.int64).max
+        runs[label] = interleave(weights, np.random.default_rng(cli_args.seed + 1), cli_args.rounds,
+                                 cli_args.rows, cli_args.cols, cli_args.query_rows, cli_args.k)
+    assert runs["before"][1] == runs["after"][1], "answers differ"
+
+    print(f"{cli_args.entries} entries, {cli_args.rounds} rounds of add() + top_k({cli_args.query_rows} rows, k={cli_args.k})")
+    for label, (latencies, _) in runs.items():
+        print(f"{label:>6}: mean {latencies.mean() * 1e3:.3f} ms, p50 {np.percentile(latencies, 50) * 1e3:.3f} ms, "
+              f"p99 {np.percentile(latencies, 99) * 1e3:.3f} ms")
+    print(f"speedup (mean): {runs['before'][0].mean() / runs['after'][0].mean():.1f}x")
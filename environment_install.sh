@@ -1,3 +1,3 @@
 conda create -n VISTA python=3.9.20
 conda activate VISTA
-pip install pandas requests openai pyyaml
\ No newline at end of file
+pip install pandas requests openai pyyaml pyarrow
\ No newline at end of file
@@ -4,18 +4,38 @@ import pandas as pd
 import numpy as np
 import os
 import logging
+from src.data.utils.ais_data_storage import save_ais_data, load_ais_data, ais_data_exists, get_storage_path
+
+def format_dynamic_info(segment):
+    """
+    Build the per-point trajectory lines used by the LLM prompts, only for the rows that need them
+
+    Args:
+        segment: DataFrame with timestamp, latitude, longitude, sog, cog and heading columns
+
+    Returns:
+        pd.Series: one "timestamp: ...,latitude: ..., ..." string per row
+    """
+    col = lambda name: segment[name].map(str).astype(object)
+    return ("timestamp: " + col('timestamp') + ",latitude: " + col('latitude') + ", longitude: " + col('longitude')
+            + ", sog: " + col('sog') + ", cog: " + col('cog') + ", heading: " + col('heading'))
+
 def get_standardized_data_with_SequenceId(args):
-    raw_data_file = args.raw_data_file
+    raw_data_file = get_storage_path(args.raw_data_file, "csv")
     #standardized_data_file = raw_data_file.replace(".csv", "_standardized_with_SequenceId_" + str(args.trajectory_len)+".csv").replace("RawData", "ProcessedData")
     standardized_data_file = raw_data_file.replace(".csv", "_standardized_with_SequenceId_SegementId_PointInfo_" + str(args.trajectory_len)+".csv").replace("CleanedFilteredData", "ProcessedData")
     logging.info(f"standardized_data_file:{standardized_data_file}")
-    if os.path.exists(standardized_data_file):
+    if ais_data_exists(standardized_data_file, args.storage_format):
         print("Load standardized data with SequenceId from file:", standardized_data_file)
-        df = pd.read_csv(standardized_data_file)
-        return df
+        df = load_ais_data(standardized_data_file, args.storage_format, sort_by=['sequence_id'])
+        # Files written before prompt text was built lazily still carry the 'dynamic_info' column
+        return df.drop(columns=['dynamic_info'], errors='ignore')
 
     print("Get standardized data with SequenceId!")
-    df = pd.read_csv(raw_data_file)
+    # Only the AIS attribute columns (under raw or standard names) are needed, e.g. not the filter's TrajID
+    ais_columns = (set(ColumnName_Standard_Mapping_US2DK) | set(ColumnName_Standard_Mapping_DK2Standard)
+                   | set(ColumnName_Standard_Mapping_DK2Standard.values()))
+    df = load_ais_data(raw_data_file, args.storage_format, columns=ais_columns, sort_by=['mmsi', 'timestamp'])
     # Step 1: Standardize Data Format
     print("Step 1: Standardize Data Format")
     df.rename(columns=ColumnName_Standard_Mapping_US2DK, inplace=True)
@@ -59,35 +79,14 @@ def get_standardized_data_with_SequenceId(args):
     print("Step 2: Create Segments and Save to CSV !")
     # Group by MMSI and sort by timestamp within each group
     standardized_data = df.sort_values(['mmsi', 'timestamp'])
-    
-    # Create segments based on trajectory_len
-    segments_list = []
-    sequence_id = 0
-    
-    for mmsi, group in standardized_data.groupby('mmsi'):
-        group = group.reset_index(drop=True)
-        
-        # Create segments of trajectory_len length
-        for start_idx in range(0, len(group), args.trajectory_len):
-            segment = group.iloc[start_idx:start_idx + args.trajectory_len].copy()
-            
-            # Only keep segments that have exactly trajectory_len rows
-            if len(segment) == args.trajectory_len:
-                segment.insert(0, 'sequence_id', sequence_id)
-                
-                segments_list.append(segment)
-                sequence_id += 1
-    
-    standardized_data = pd.concat(segments_list, ignore_index=True)
-    
+
+    # Cut every MMSI into consecutive windows of trajectory_len rows, dropping incomplete tails
+    standardized_data = split_into_sequences(standardized_data, args.trajectory_len, args.mini_segment_len)
+
     # Save the segmented data to a new CSV file
-    segmented_data_file = args.raw_data_file.replace(".csv", "_standardized_with_SequenceId_SegementId_PointInfo_" + str(args.trajectory_len)+".csv").replace("CleanedFilteredData", "ProcessedData")
-    segmented_data_dir = os.path.dirname(segmented_data_file)
-    if not os.path.exists(segmented_data_dir):
-        os.makedirs(segmented_data_dir)
-    
-    standardized_data['segment_id'] = (standardized_data.groupby('sequence_id').cumcount() // args.mini_segment_len).astype(int)
-    standardized_data['dynamic_info'] = standardized_data.apply(lambda row: f"timestamp: {row['timestamp']},latitude: {row['latitude']}, longitude: {row['longitude']}, sog: {row['sog']}, cog: {row['cog']}, heading: {row['heading']}", axis=1)
+    segmented_data_file = raw_data_file.replace(".csv", "_standardized_with_SequenceId_SegementId_PointInfo_" + str(args.trajectory_len)+".csv").replace("CleanedFilteredData", "ProcessedData")
+
+    # Prompt text ('dynamic_info') is built per segment by format_dynamic_info, so the saved file stays numeric
     
     # TODO: add spatial context information for each point 
     '''
@@ -110,11 +109,45 @@ def get_standardized_data_with_SequenceId(args):
             standardized_data.loc[mask, 'location_name'] = location_name
             standardized_data.loc[mask, 'shipping_lanes'] = shipping_lanes
     '''
-    standardized_data.to_csv(segmented_data_file, index=False)
+    save_ais_data(standardized_data, segmented_data_file, args.storage_format, args.partition_by, args.num_partitions)
     print(f"Segmented data saved to: {segmented_data_file}")
 
     return standardized_data
 
+def split_into_sequences(sorted_df, trajectory_len, mini_segment_len):
+    """
+    Assign sequence_id / segment_id in one pass over data sorted by MMSI
+
+    Args:
+        sorted_df: AIS records sorted by ['mmsi', 'timestamp']
+        trajectory_len: number of records per sequence
+        mini_segment_len: number of records per segment inside a sequence
+
+    Returns:
+        pd.DataFrame: complete sequences only, with 'sequence_id' first and 'segment_id' last
+    """
+    mmsi = sorted_df['mmsi'].to_numpy()
+    n = len(mmsi)
+    valid = ~pd.isna(mmsi)
+
+    # Group boundaries on the sorted MMSI array; rows without MMSI are not part of any group
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = mmsi[1:] != mmsi[:-1]
+    group_starts = np.flatnonzero(is_start)
+    group_lens = np.diff(np.append(group_starts, n))
+    group_idx = np.cumsum(is_start) - 1
+
+    # Keep the rows that fall in a complete trajectory_len window of their MMSI
+    position = np.arange(n) - group_starts[group_idx]
+    full_len = (group_lens // trajectory_len) * trajectory_len
+    keep = valid & (position < full_len[group_idx])
+
+    sequences = sorted_df[keep].reset_index(drop=True)
+    offsets = np.arange(len(sequences))
+    sequences.insert(0, 'sequence_id', offsets // trajectory_len)
+    sequences['segment_id'] = ((offsets % trajectory_len) // mini_segment_len).astype(int)
+    return sequences
+
 def get_missing_mark(args):
 
     trajectory_num = args.trajectory_num
@@ -134,9 +167,10 @@ def get_missing_mark(args):
 
 def get_training_test_data(args):
     np.random.seed(args.seed)
-    standardized_data_file = args.raw_data_file.replace(".csv", "_standardized_with_SequenceId_SegementId_PointInfo_" + str(args.trajectory_len)+"_" + str(args.trajectory_num)+".csv").replace("CleanedFilteredData", "ProcessedData")
-    if os.path.exists(standardized_data_file):
-        df = pd.read_csv(standardized_data_file)
+    standardized_data_file = get_storage_path(args.raw_data_file, "csv").replace(".csv", "_standardized_with_SequenceId_SegementId_PointInfo_" + str(args.trajectory_len)+"_" + str(args.trajectory_num)+".csv").replace("CleanedFilteredData", "ProcessedData")
+    if ais_data_exists(standardized_data_file, args.storage_format):
+        df = load_ais_data(standardized_data_file, args.storage_format, sort_by=['sequence_id'])
+        df = df.drop(columns=['dynamic_info'], errors='ignore')
     else:
         standardized_data_with_SequenceId = get_standardized_data_with_SequenceId(args)
         # Get total number of unique sequences
@@ -162,7 +196,7 @@ def get_training_test_data(args):
         print(f"Selected {len(selected_sequence_ids)} sequences for processing")
         print("standardized_data", standardized_data_with_SequenceId)
 
-        standardized_data_with_SequenceId.to_csv(standardized_data_file, index=False)
+        save_ais_data(standardized_data_with_SequenceId, standardized_data_file, args.storage_format, args.partition_by, args.num_partitions)
         df = standardized_data_with_SequenceId
 
     # Get unique sequence IDs from the dataframe
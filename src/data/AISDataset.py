@@ -1,6 +1,10 @@
-import argparse, os, sys
+import argparse, os, sys, shutil, time, math, heapq, pickle
+import concurrent.futures
+import numpy as np
 import pandas as pd
 from src.data.utils.ais_data_utils import download_ais_dataset
+from src.data.utils.ais_data_storage import hyperparameter_configure_ais_storage, save_ais_data, load_ais_data, remove_ais_data, iter_ais_data_chunks, ais_data_exists, get_storage_size_mb, mmsi_hash_bucket
+from src.data.utils.ais_data_filter import clean_and_standardize_ais_data, assign_trajectory_ids
 
 current_path = os.path.dirname(os.path.abspath(__file__))
 parent_current_path = os.path.dirname(current_path)
@@ -13,6 +17,139 @@ def hyperparameter_configure_ais_dataset(parser):
     dataset_group.add_argument("--datasets", type=str, default=['AIS_2024_04_02@02'], nargs="+")
     dataset_group.add_argument("--min_time_interval", type=int, default=360)
     dataset_group.add_argument("--max_time_interval", type=int, default=1e9)
+    dataset_group.add_argument("--ingest_chunk_size", type=int, default=0,
+                               help='Rows per chunk for streaming ingestion (0 loads each raw file at once)')
+    dataset_group.add_argument("--ingest_workers", type=int, default=1,
+                               help='Worker processes for cleaning raw files in parallel')
+    hyperparameter_configure_ais_storage(parser)
+
+def get_file_statistics(csv_file, raw_records, cleaned_records, unique_mmsi_count, elapsed_sec):
+    return {
+        'Dataset Identifier': os.path.basename(csv_file),
+        'Number of unique MMSI': unique_mmsi_count,
+        'Total number of records': cleaned_records,
+        'Raw records': raw_records,
+        'Cleaning time (s)': round(elapsed_sec, 2),
+        'Datasize': f"{os.path.getsize(csv_file) / (1024 * 1024):.2f} MB"
+    }
+
+# Worker: read, clean and standardize one raw AIS file
+def clean_ais_file(csv_file):
+    t0 = time.time()
+    print(f"Reading file: {csv_file}")
+    df = pd.read_csv(csv_file)
+    raw_records = len(df)
+    df = clean_and_standardize_ais_data(df, "aisdk" in csv_file)
+    return df, get_file_statistics(csv_file, raw_records, len(df), df['mmsi'].nunique(), time.time() - t0)
+
+# Upper bound of the spill partitions of one streaming ingestion
+MAX_SPILL_PARTITIONS = 1024
+
+# Estimate the number of rows of the raw files from their size and the line density of the first one
+def estimate_csv_rows(csv_file_list, sample_bytes=1 << 20):
+    if not csv_file_list:
+        return 0
+    with open(csv_file_list[0], 'rb') as f:
+        sample = f.read(sample_bytes)
+    bytes_per_row = len(sample) / max(1, sample.count(b"\n"))
+    return int(sum(os.path.getsize(csv_file) for csv_file in csv_file_list) / max(1.0, bytes_per_row))
+
+# Spill partitions of about chunk_size rows each, so that the runs merged per partition also add up to a chunk
+def spill_partition_count(csv_file_list, chunk_size):
+    return min(MAX_SPILL_PARTITIONS, max(1, math.ceil(estimate_csv_rows(csv_file_list) / chunk_size)))
+
+# A spill run is a file of consecutive pickled frames of at most block_rows rows, read back one block at a time
+def write_spill_run(run, run_file, block_rows):
+    with open(run_file, 'wb') as f:
+        for start in range(0, len(run), block_rows):
+            pickle.dump(run.iloc[start:start + block_rows], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_spill_run(run_file):
+    with open(run_file, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+def _merge_keys(df):
+    """(mmsi, timestamp) sort keys of a run as arrays; NaT sorts last, as in sort_values"""
+    timestamps = df['timestamp'].to_numpy().astype('datetime64[ns]')
+    ts = timestamps.view(np.int64).copy()
+    ts[np.isnat(timestamps)] = np.iinfo(np.int64).max
+    return df['mmsi'].to_numpy(dtype=np.float64), ts
+
+def merge_spill_runs(run_files):
+    """
+    k-way merge of runs sorted by (mmsi, timestamp), holding about one block per run in memory
+
+    A heap orders the runs by the last key they have loaded; rows below the smallest of these keys can
+    no longer be preceded by an unread row, so they are emitted, and that run loads its next block.
+    Rows with equal keys keep the run order, as a stable sort of the concatenated runs would.
+
+    Returns:
+        Iterator[pd.DataFrame]: consecutive sorted pieces of the merged runs
+    """
+    readers = [read_spill_run(run_file) for run_file in run_files]
+    pending, heap = [], []
+    for run_idx, reader in enumerate(readers):
+        block = next(reader, None)
+        pending.append((block, *_merge_keys(block)) if block is not None else None)
+        if block is not None:
+            heapq.heappush(heap, (pending[run_idx][1][-1], pending[run_idx][2][-1], run_idx))
+
+    while True:
+        wm_mmsi, wm_ts = (heap[0][0], heap[0][1]) if heap else (np.inf, np.iinfo(np.int64).max)
+        emitted = []
+        for run_idx, run in enumerate(pending):
+            if run is None:
+                continue
+            block, mmsi, ts = run
+            lo, hi = np.searchsorted(mmsi, wm_mmsi, 'left'), np.searchsorted(mmsi, wm_mmsi, 'right')
+            cut = lo + int(np.searchsorted(ts[lo:hi], wm_ts, 'left')) if heap else len(block)
+            if cut:
+                emitted.append(block.iloc[:cut])
+                pending[run_idx] = (block.iloc[cut:], mmsi[cut:], ts[cut:]) if cut < len(block) else None
+        if emitted:
+            yield pd.concat(emitted, ignore_index=True).sort_values(['mmsi', 'timestamp'], kind='mergesort')
+        if not heap:
+            return
+        _, _, run_idx = heapq.heappop(heap)
+        block = next(readers[run_idx], None)
+        if block is None:
+            continue
+        if pending[run_idx] is not None:
+            block = pd.concat([pending[run_idx][0], block])
+        pending[run_idx] = (block, *_merge_keys(block))
+        heapq.heappush(heap, (pending[run_idx][1][-1], pending[run_idx][2][-1], run_idx))
+
+# Worker: clean one raw AIS file chunk by chunk and spill sorted runs per MMSI hash partition
+def spill_ais_file(csv_file, file_idx, spill_dir, chunk_size, num_partitions, block_rows):
+    t0 = time.time()
+    print(f"Streaming file: {csv_file}")
+    raw_records, cleaned_records, missing_mmsi, mmsi_set = 0, 0, 0, set()
+    for chunk_idx, chunk in enumerate(pd.read_csv(csv_file, chunksize=chunk_size)):
+        raw_records += len(chunk)
+        chunk = clean_and_standardize_ais_data(chunk, "aisdk" in csv_file)
+        # Rows without MMSI belong to no trajectory; they are dropped here and counted in the statistics
+        has_mmsi = chunk['mmsi'].notna()
+        missing_mmsi += int((~has_mmsi).sum())
+        chunk = chunk[has_mmsi]
+        if chunk.empty:
+            continue
+        cleaned_records += len(chunk)
+        mmsi_set.update(chunk['mmsi'].unique().tolist())
+        for partition, run in chunk.groupby(mmsi_hash_bucket(chunk['mmsi'], num_partitions)):
+            run_dir = spill_dir + f"part_{int(partition):05d}/"
+            os.makedirs(run_dir, exist_ok=True)
+            # Run names sort by (file, chunk), so merging is deterministic whatever the worker order
+            write_spill_run(run.sort_values(['mmsi', 'timestamp'], kind='mergesort'),
+                            run_dir + f"run_{file_idx:05d}_{chunk_idx:06d}.pkl", block_rows)
+    file_statistics = get_file_statistics(csv_file, raw_records, cleaned_records, len(mmsi_set), time.time() - t0)
+    file_statistics['Records without MMSI (dropped)'] = missing_mmsi
+    if missing_mmsi:
+        print(f"Dropped {missing_mmsi} records without MMSI from {csv_file}")
+    return file_statistics
 
 class AISDataset():
     '''
@@ -35,6 +172,11 @@ class AISDataset():
             self.dataset_identifier = args.datasets[0] + args.datasets[-1]
         self.min_time_interval = args.min_time_interval
         self.max_time_interval = args.max_time_interval
+        self.storage_format = args.storage_format
+        self.partition_by = args.partition_by
+        self.num_partitions = args.num_partitions
+        self.ingest_chunk_size = args.ingest_chunk_size
+        self.ingest_workers = args.ingest_workers
 
         self.raw_data_dir = f'{root_path}/data/RawData/'
         self.CleanedFiltered_data_dir = f'{root_path}/data/CleanedFilteredData/'
@@ -44,16 +186,22 @@ class AISDataset():
         self.cleaned_data_statistics_file = self.CleanedFiltered_data_dir + "cleaned_data_statistics.csv"
         self.filtered_data_statistics_file = self.CleanedFiltered_data_dir + "filtered_data_statistics.csv"
 
-        if not os.path.exists(self.filtered_data_file):
+        if not ais_data_exists(self.filtered_data_file, self.storage_format):
             print("Do not find filtered data, begin prepare filtered data:", self.dataset_identifier)
-            if not os.path.exists(self.cleaned_data_file):
+            if not ais_data_exists(self.cleaned_data_file, self.storage_format):
                 print("Do not find cleaned data, begin prepare cleaned data:", self.dataset_identifier)
                 csv_file_list = self.prepare_raw_data(args.datasets)
                 self.prepare_clean_and_standardize_data(csv_file_list)
             self.prepare_filtered_data()
 
-    def load_cleaned_data(self):
-        return pd.read_csv(self.cleaned_data_file)
+    def load_cleaned_data(self, columns=None):
+        return load_ais_data(self.cleaned_data_file, self.storage_format, columns=columns)
+
+    def load_filtered_data(self, columns=None):
+        return load_ais_data(self.filtered_data_file, self.storage_format, columns=columns, sort_by=['mmsi', 'timestamp'])
+
+    def save_data(self, df, file_path, append=False):
+        return save_ais_data(df, file_path, self.storage_format, self.partition_by, self.num_partitions, append)
 
     # Prepare raw data: download raw AIS dataset from official AIS platforms
     def prepare_raw_data(self, datasets):
@@ -67,57 +215,110 @@ class AISDataset():
         csv_file_list = download_ais_dataset(file_name_list, self.raw_data_dir)
         return csv_file_list
 
+    # Run a worker over every raw file, in a process pool if ingest_workers > 1; results keep file order
+    def map_raw_files(self, worker, *worker_args):
+        if self.ingest_workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.ingest_workers) as executor:
+                return list(executor.map(worker, *worker_args))
+        return list(map(worker, *worker_args))
+
     # Prepare clean and standardize data
     def prepare_clean_and_standardize_data(self, csv_file_list):
+        if self.ingest_chunk_size > 0:
+            return self.prepare_clean_and_standardize_data_streaming(csv_file_list)
+
         # Step 1: Clean data & Standardize data columns
         print("begin clean and standardize ais_dataset:", self.dataset_identifier)
-        df_list = []
-        for csv_file in csv_file_list:
-            print(f"Reading file: {csv_file}")
-            df = pd.read_csv(csv_file)
-            from src.data.utils.ais_data_filter import denmark_ais_data_filter, american_ais_data_filter
-            if ("aisdk" in csv_file):
-                df = denmark_ais_data_filter(df)
-            else:
-                df = american_ais_data_filter(df)
-            df_list.append(df)
-        df = pd.concat(df_list, ignore_index=True)
-
-        from src.data.utils.AISDataMappingDicts import ColumnName_Standard_Mapping_US2DK, ColumnName_Standard_Mapping_DK2Standard
-        df.rename(columns=ColumnName_Standard_Mapping_US2DK, inplace=True)
-        df.rename(columns=ColumnName_Standard_Mapping_DK2Standard, inplace=True)
-        # Convert timestamp format for Danish (aisdk) datasets
-        if any("aisdk" in csv_file for csv_file in csv_file_list):
-            df["timestamp"] = pd.to_datetime(df["timestamp"], format="%d/%m/%Y %H:%M:%S", errors="coerce")
-        else:
-            df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y-%m-%dT%H:%M:%S", errors="coerce")
+        t0 = time.time()
+        results = self.map_raw_files(clean_ais_file, csv_file_list)
+        df = pd.concat([file_df for file_df, _ in results], ignore_index=True)
+        file_statistics = [file_stats for _, file_stats in results]
         
         if not os.path.exists(self.CleanedFiltered_data_dir):
             os.makedirs(self.CleanedFiltered_data_dir)
-        df.to_csv(self.cleaned_data_file, index=False)
+        self.save_data(df, self.cleaned_data_file)
 
         # Step 2: Statistical analysis of the dataset
-        unique_mmsi_count = df['mmsi'].nunique()
-        total_records = len(df)
-        data_size_mb = os.path.getsize(self.cleaned_data_file) / (1024 * 1024)
+        self.save_cleaned_statistics(df['mmsi'].nunique(), len(df), file_statistics, time.time() - t0)
+
+        print("end clean and standardize ais_dataset:", self.dataset_identifier)
+
+    # Prepare clean and standardize data in bounded memory: clean each raw file chunk by chunk,
+    # spill sorted runs per MMSI hash partition to disk, then k-way merge the runs partition by partition
+    # and append the merged rows in chunks of ingest_chunk_size
+    def prepare_clean_and_standardize_data_streaming(self, csv_file_list):
+        print("begin streaming clean and standardize ais_dataset:", self.dataset_identifier)
+        t0 = time.time()
+        spill_dir = self.CleanedFiltered_data_dir + self.dataset_identifier + "_spill/"
+        if os.path.exists(spill_dir):
+            shutil.rmtree(spill_dir)
+
+        # About as many chunks as partitions get spilled, so each partition merges ~spill_partitions runs;
+        # blocks of chunk_size / spill_partitions rows keep the merge at about one chunk of memory
+        spill_partitions = spill_partition_count(csv_file_list, self.ingest_chunk_size)
+        block_rows = max(1, self.ingest_chunk_size // spill_partitions)
+        print(f"Spilling to {spill_partitions} MMSI partitions in blocks of {block_rows} rows")
+        n_files = len(csv_file_list)
+        file_statistics = self.map_raw_files(spill_ais_file, csv_file_list, range(n_files), [spill_dir] * n_files,
+                                             [self.ingest_chunk_size] * n_files, [spill_partitions] * n_files,
+                                             [block_rows] * n_files)
+
+        unique_mmsi_count, total_records = 0, 0
+        remove_ais_data(self.cleaned_data_file, self.storage_format)
+
+        def append_merged(pieces):
+            nonlocal unique_mmsi_count, total_records, last_mmsi
+            df = pd.concat(pieces, ignore_index=True)
+            self.save_data(df, self.cleaned_data_file, append=True)
+            # merged rows are sorted by MMSI, so an MMSI continued from the previous chunk is its first one
+            unique_mmsi_count += df['mmsi'].nunique() - int(df['mmsi'].iloc[0] == last_mmsi)
+            total_records += len(df)
+            last_mmsi = df['mmsi'].iloc[-1]
+
+        partition_dirs = sorted(os.listdir(spill_dir)) if os.path.exists(spill_dir) else []
+        for partition_dir in partition_dirs:
+            run_files = [spill_dir + partition_dir + "/" + run_file for run_file in sorted(os.listdir(spill_dir + partition_dir))]
+            pieces, buffered, last_mmsi = [], 0, None
+            for piece in merge_spill_runs(run_files):
+                pieces.append(piece)
+                buffered += len(piece)
+                if buffered >= self.ingest_chunk_size:
+                    append_merged(pieces)
+                    pieces, buffered = [], 0
+            if pieces:
+                append_merged(pieces)
+        if os.path.exists(spill_dir):
+            shutil.rmtree(spill_dir)
+
+        self.save_cleaned_statistics(unique_mmsi_count, total_records, file_statistics, time.time() - t0)
+        print("end streaming clean and standardize ais_dataset:", self.dataset_identifier)
+
+    def save_cleaned_statistics(self, unique_mmsi_count, total_records, file_statistics, elapsed_sec):
+        data_size_mb = get_storage_size_mb(self.cleaned_data_file, self.storage_format)
         
-        # Save statistics to CSV file
+        # Save statistics to CSV file: one row per raw file, then the dataset summary
         stats_data = {
             'Dataset Identifier': [self.dataset_identifier + "_cleaned.csv"],
             'Number of unique MMSI': [unique_mmsi_count],
             'Total number of records': [total_records],
+            'Raw records': [sum(file_stats['Raw records'] for file_stats in file_statistics)],
+            'Cleaning time (s)': [round(elapsed_sec, 2)],
             'Datasize': [f"{data_size_mb:.2f} MB"]
         }
-        stats_df = pd.DataFrame(stats_data)
+        stats_df = pd.concat([pd.DataFrame(file_statistics), pd.DataFrame(stats_data)], ignore_index=True)
         if os.path.exists(self.cleaned_data_statistics_file):
             existing_df = pd.read_csv(self.cleaned_data_statistics_file)
             stats_df = pd.concat([existing_df, stats_df], ignore_index=True)
         stats_df.to_csv(self.cleaned_data_statistics_file, index=False)
 
-        print("end clean and standardize ais_dataset:", self.dataset_identifier)
-
     def prepare_filtered_data(self):
-        df = pd.read_csv(self.cleaned_data_file)
+        if self.ingest_chunk_size > 0:
+            try:
+                return self.prepare_filtered_data_streaming()
+            except ValueError as e:
+                print(f"Streaming filter not applicable ({e}), falling back to in-memory filtering")
+
+        df = self.load_cleaned_data()
         # Convert timestamp to datetime if it's not already
         if df['timestamp'].dtype == 'object':
             df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%d %H:%M:%S')
@@ -125,45 +326,83 @@ class AISDataset():
         # Sort by MMSI and timestamp
         df = df.sort_values(['mmsi', 'timestamp']).reset_index(drop=True)
         
-        # Initialize TrajID column
-        df['TrajID'] = -1
-        traj_id = 0
-        
-        for mmsi, group in df.groupby('mmsi'):
-            group_indices = group.index.tolist()
-            if len(group_indices) == 0:
-                continue
-                
-            current_traj_start_idx = group_indices[0]
-            df.loc[current_traj_start_idx, 'TrajID'] = traj_id
-            last_selected_time = df.loc[current_traj_start_idx, 'timestamp']
-            
-            for idx in group_indices[1:]:
-                current_time = df.loc[idx, 'timestamp']
-                time_diff = (current_time - last_selected_time).total_seconds()
-                
-                if time_diff > self.max_time_interval:
-                    traj_id += 1
-                    df.loc[idx, 'TrajID'] = traj_id
-                    last_selected_time = current_time
-                elif time_diff >= self.min_time_interval:
-                    df.loc[idx, 'TrajID'] = traj_id
-                    last_selected_time = current_time
-            
-            traj_id += 1
+        # Assign TrajID with the min/max time-interval rule (-1 marks thinned-out records)
+        df['TrajID'] = assign_trajectory_ids(df['mmsi'].to_numpy(), df['timestamp'].to_numpy(),
+                                             self.min_time_interval, self.max_time_interval)
         
         # Filter out records that weren't assigned to any trajectory
         df = df[df['TrajID'] != -1]
-        df.to_csv(self.filtered_data_file, index=False)
+        self.save_data(df, self.filtered_data_file)
         
         # Record statistics for filtered data
-        unique_mmsi = df['mmsi'].nunique()
-        total_records = len(df)
-        unique_trajectories = df['TrajID'].nunique()
-        
+        self.save_filtered_statistics(df['mmsi'].nunique(), len(df), df['TrajID'].nunique())
+
+    # Check, reading only the MMSI column, that the rows of each MMSI are stored contiguously
+    def cleaned_data_contiguous_by_mmsi(self):
+        seen, last = set(), None
+        for chunk in iter_ais_data_chunks(self.cleaned_data_file, self.storage_format, self.ingest_chunk_size, columns=['mmsi']):
+            mmsi = chunk['mmsi'].to_numpy()
+            if len(mmsi) == 0:
+                continue
+            if pd.isna(mmsi).any():
+                return False
+            run_values = mmsi[np.r_[True, mmsi[1:] != mmsi[:-1]]]
+            for value in run_values[1:] if run_values[0] == last else run_values:
+                if value in seen:
+                    return False
+                seen.add(value)
+            last = run_values[-1]
+        return True
+
+    # Filter the cleaned data chunk by chunk. Requires the rows of each MMSI to be stored
+    # contiguously, as written by the streaming ingestion; TrajIDs follow storage order.
+    # Raises ValueError before writing anything if the stored layout does not allow it.
+    def prepare_filtered_data_streaming(self):
+        # Date partitions split every MMSI across days
+        if self.storage_format == "parquet" and self.partition_by == "date":
+            raise ValueError("parquet data partitioned by date is not stored contiguously by MMSI")
+        if not self.cleaned_data_contiguous_by_mmsi():
+            raise ValueError("cleaned data is not stored contiguously by MMSI")
+
+        traj_offset = 0
+        unique_mmsi, total_records = 0, 0
+        remove_ais_data(self.filtered_data_file, self.storage_format)
+
+        def filter_complete_groups(df):
+            nonlocal traj_offset, unique_mmsi, total_records
+            df = df.sort_values(['mmsi', 'timestamp'], kind='mergesort').reset_index(drop=True)
+            traj_ids = assign_trajectory_ids(df['mmsi'].to_numpy(), df['timestamp'].to_numpy(),
+                                             self.min_time_interval, self.max_time_interval)
+            kept = traj_ids != -1
+            df = df[kept].copy()
+            df['TrajID'] = traj_ids[kept] + traj_offset
+            traj_offset += int(traj_ids.max()) + 1
+            self.save_data(df, self.filtered_data_file, append=True)
+            unique_mmsi += df['mmsi'].nunique()
+            total_records += len(df)
+
+        carry = None
+        for chunk in iter_ais_data_chunks(self.cleaned_data_file, self.storage_format, self.ingest_chunk_size):
+            if chunk['timestamp'].dtype == 'object':
+                chunk['timestamp'] = pd.to_datetime(chunk['timestamp'], format='%Y-%m-%d %H:%M:%S')
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            mmsi = chunk['mmsi'].to_numpy()
+
+            # The last MMSI of a chunk may continue in the next one
+            is_last = mmsi == mmsi[-1]
+            complete, carry = chunk[~is_last], chunk[is_last]
+            if not complete.empty:
+                filter_complete_groups(complete)
+
+        if carry is not None and not carry.empty:
+            filter_complete_groups(carry)
+
+        self.save_filtered_statistics(unique_mmsi, total_records, traj_offset)
+
+    def save_filtered_statistics(self, unique_mmsi, total_records, unique_trajectories):
         # Calculate file size
-        file_size_bytes = os.path.getsize(self.filtered_data_file)
-        data_size_mb = file_size_bytes / (1024 * 1024)
+        data_size_mb = get_storage_size_mb(self.filtered_data_file, self.storage_format)
         
         # Create statistics data
         stats_data = {
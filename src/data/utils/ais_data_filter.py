@@ -1,4 +1,9 @@
 import re
+import math
+import functools
+import numpy as np
+import pandas as pd
+from src.data.utils.AISDataMappingDicts import ColumnName_Standard_Mapping_US2DK, ColumnName_Standard_Mapping_DK2Standard
 
 def denmark_ais_data_filter(df):
     required_columns = [
@@ -13,7 +18,7 @@ def denmark_ais_data_filter(df):
 
     numeric_columns = ["Heading", "COG", "ROT", "SOG", "Draught", "Length", "Width"]
     for col in numeric_columns:
-        df = df[df[col].apply(lambda x: str(x).replace('.', '', 1).isdigit())]
+        df = df[is_unsigned_decimal(df[col])]
 
     df = df[((df['Latitude'] >= -90) & (df['Latitude'] <= 90)) &  ((df['Longitude'] >= -180) & (df['Longitude'] <= 180))]
 
@@ -27,7 +32,7 @@ def denmark_ais_data_filter(df):
     df = df[~df["Destination"].isin(invalid_destinations)]
     df = df[~df["Destination"].str.startswith("=", na=False)]
     df = df[~df["Destination"].str.startswith("?", na=False)]
-    df["Destination"] = df["Destination"].apply(process_destination)
+    df["Destination"] = normalize_destinations(df["Destination"])
     df = df[df["Destination"].notna()]
     # df = df[~df["Destination"].str.contains(r"[ /]", na=False)]
 
@@ -47,6 +52,29 @@ def denmark_ais_data_filter(df):
     df = df[df["MMSI"] != 0]
     return df
 
+def is_unsigned_decimal(series):
+    """
+    Vectorized form of `str(x).replace('.', '', 1).isdigit()` for every value of a column
+
+    Args:
+        series: column to validate
+
+    Returns:
+        pd.Series: boolean mask, True where the value is a non-negative plain decimal
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return pd.Series(False, index=series.index)
+    if pd.api.types.is_integer_dtype(series):
+        return series >= 0
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=float)
+        with np.errstate(invalid="ignore"):
+            # str() of a float switches to exponent notation outside [1e-4, 1e16), and keeps the sign of -0.0
+            plain = (values == 0) | ((values >= 1e-4) & (values < 1e16))
+            mask = ~np.signbit(values) & np.isfinite(values) & plain
+        return pd.Series(mask, index=series.index)
+    return series.astype(str).str.replace(".", "", n=1, regex=False).str.isdigit()
+
 def american_ais_data_filter(df):
     # Define the required columns that must be present in the dataset
     required_columns = [
@@ -65,7 +93,7 @@ def american_ais_data_filter(df):
     numeric_columns = ["Heading", "COG", "SOG", "Draft", "Length", "Width"]
     for col in numeric_columns:
         # Check if the value is numeric by removing at most one decimal point
-        df = df[df[col].apply(lambda x: str(x).replace('.', '', 1).isdigit())]
+        df = df[is_unsigned_decimal(df[col])]
 
     # Filter latitude and longitude to ensure they are within valid ranges
     df = df[((df['LAT'] >= -90) & (df['LAT'] <= 90)) & ((df['LON'] >= -180) & (df['LON'] <= 180))]
@@ -102,6 +130,32 @@ def american_ais_data_filter(df):
     # Return the filtered and processed DataFrame
     return df
 
+def clean_and_standardize_ais_data(df, is_aisdk):
+    """
+    Clean one raw AIS frame (or chunk) and map it to the standard column names
+
+    Args:
+        df: raw AIS DataFrame as read from an AIS-DK or AIS-US CSV
+        is_aisdk: True for AIS-DK files, False for AIS-US files
+
+    Returns:
+        pd.DataFrame: cleaned data with standard columns and parsed timestamps
+    """
+    df = denmark_ais_data_filter(df) if is_aisdk else american_ais_data_filter(df)
+    df = df.rename(columns=ColumnName_Standard_Mapping_US2DK)
+    df = df.rename(columns=ColumnName_Standard_Mapping_DK2Standard)
+    # Convert timestamp format for Danish (aisdk) datasets
+    if is_aisdk:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], format="%d/%m/%Y %H:%M:%S", errors="coerce")
+    else:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y-%m-%dT%H:%M:%S", errors="coerce")
+    return df
+
+def normalize_destinations(destinations):
+    """Apply process_destination once per unique destination string and map the results back"""
+    mapping = {value: _process_destination_cached(value) for value in destinations.unique()}
+    return destinations.map(mapping)
+
 def process_destination(value):
     value = value.strip().rstrip(".")
 
@@ -139,4 +193,69 @@ def process_destination(value):
     if parts:
         return parts[-1]
 
-    return value
\ No newline at end of file
+    return value
+
+def assign_trajectory_ids(mmsi, timestamps, min_time_interval, max_time_interval):
+    """
+    Vectorized min/max time-interval thinning and TrajID assignment
+
+    Args:
+        mmsi: MMSI array, sorted together with timestamps by (mmsi, timestamp)
+        timestamps: datetime64 array aligned with mmsi (NaT allowed)
+        min_time_interval: minimum seconds between two selected points of a trajectory
+        max_time_interval: gap in seconds above which a new trajectory is started
+
+    Returns:
+        np.ndarray: TrajID per row, -1 for rows that are thinned out
+    """
+    n = len(mmsi)
+    traj_ids = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return traj_ids
+
+    ts = np.asarray(timestamps, dtype="datetime64[ns]")
+    is_nat = np.isnat(ts)
+    ts = ts.view(np.int64)
+    # Thresholds in nanoseconds, equivalent to comparing Timedelta.total_seconds()
+    min_ns = int(math.ceil(float(min_time_interval) * 1e9))
+    max_ns = int(math.floor(float(max_time_interval) * 1e9))
+    select_ns = min(min_ns, max_ns + 1)
+
+    # NaN MMSIs sort last and are dropped by groupby, so only the valid prefix is grouped
+    mmsi = np.asarray(mmsi)
+    n_valid = n - int(np.count_nonzero(mmsi != mmsi)) if mmsi.dtype.kind == "f" else n
+    if n_valid == 0:
+        return traj_ids
+    group_starts = np.flatnonzero(np.r_[True, mmsi[1:n_valid] != mmsi[:n_valid - 1]])
+    group_ends = np.r_[group_starts[1:], n_valid]
+
+    # next_idx[i]: first row of the same group at least select_ns after row i (-1 if none)
+    next_idx = np.full(n, -1, dtype=np.int64)
+    for start, end in zip(group_starts.tolist(), group_ends.tolist()):
+        # NaT rows sort last within a group and are never selected after the first row
+        valid_end = start + int(np.searchsorted(is_nat[start:end], True))
+        if valid_end - start < 2:
+            continue
+        group_ts = ts[start:valid_end]
+        nxt = np.searchsorted(group_ts, group_ts + select_ns, side="left") + start
+        nxt = np.maximum(nxt, np.arange(start + 1, valid_end + 1))
+        nxt[nxt >= valid_end] = -1
+        next_idx[start:valid_end] = nxt
+
+    # Follow every group's selection chain in lock-step, one hop per iteration
+    selected = np.zeros(n, dtype=bool)
+    frontier = group_starts
+    while frontier.size:
+        selected[frontier] = True
+        frontier = next_idx[frontier]
+        frontier = frontier[frontier >= 0]
+
+    sel_idx = np.flatnonzero(selected)
+    group_of = np.searchsorted(group_starts, sel_idx, side="right") - 1
+    new_traj = np.ones(len(sel_idx), dtype=bool)
+    same_group = group_of[1:] == group_of[:-1]
+    new_traj[1:] = ~same_group | ((ts[sel_idx[1:]] - ts[sel_idx[:-1]]) > max_ns)
+    traj_ids[sel_idx] = np.cumsum(new_traj) - 1
+    return traj_ids
+
+_process_destination_cached = functools.lru_cache(maxsize=65536)(process_destination)
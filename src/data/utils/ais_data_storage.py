@@ -0,0 +1,207 @@
+import os, shutil, time
+import numpy as np
+import pandas as pd
+
+# Storage backends for the Cleaned / Filtered / Processed data tiers.
+# Paths are always built with a ".csv" suffix by the callers; the parquet backend
+# maps them to a ".parquet" dataset directory partitioned by MMSI hash or by date.
+STORAGE_FORMATS = ["csv", "parquet"]
+PARTITION_COLUMNS = {"mmsi_hash": "mmsi_bucket", "date": "date"}
+
+
+def hyperparameter_configure_ais_storage(parser):
+    storage_group = parser.add_argument_group('Storage Configuration')
+    storage_group.add_argument("--storage_format", type=str, default="csv", choices=STORAGE_FORMATS,
+                               help='Storage backend for cleaned, filtered and processed data')
+    storage_group.add_argument("--partition_by", type=str, default="mmsi_hash", choices=list(PARTITION_COLUMNS),
+                               help='Parquet partitioning scheme')
+    storage_group.add_argument("--num_partitions", type=int, default=16,
+                               help='Number of MMSI hash buckets for parquet partitioning')
+
+
+def mmsi_hash_bucket(mmsi, num_partitions):
+    """
+    Hash bucket of every MMSI; a plain modulo would follow the country prefix (MID) and skew the buckets
+
+    Returns:
+        np.ndarray: bucket in [0, num_partitions) per value, -1 where the MMSI is missing
+    """
+    values = pd.to_numeric(pd.Series(mmsi), errors="coerce")
+    valid = values.notna().to_numpy()
+    # hash the integer value, so int and float columns (float once a chunk holds a NaN) agree
+    hashed = pd.util.hash_array(values.fillna(0).astype("int64").to_numpy())
+    buckets = (hashed % np.uint64(num_partitions)).astype("int64")
+    buckets[~valid] = -1
+    return buckets
+
+
+def get_storage_path(file_path, storage_format="csv"):
+    """Map a logical '.csv' data path to the physical path of the given backend"""
+    base, ext = os.path.splitext(file_path)
+    if ext not in (".csv", ".parquet"):
+        base = file_path
+    return base + (".parquet" if storage_format == "parquet" else ".csv")
+
+
+def _locate(file_path, storage_format="csv"):
+    """Find the stored tier, preferring the requested backend and falling back to the other one"""
+    candidates = [storage_format] + [fmt for fmt in STORAGE_FORMATS if fmt != storage_format]
+    for fmt in candidates:
+        path = get_storage_path(file_path, fmt)
+        if os.path.exists(path):
+            return path, fmt
+    return None, None
+
+
+def ais_data_exists(file_path, storage_format="csv"):
+    return _locate(file_path, storage_format)[0] is not None
+
+
+def get_storage_size_mb(file_path, storage_format="csv"):
+    path, _ = _locate(file_path, storage_format)
+    if path is None:
+        return 0.0
+    if os.path.isfile(path):
+        return os.path.getsize(path) / (1024 * 1024)
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(dir_path, name)) for name in file_names)
+    return total / (1024 * 1024)
+
+
+def remove_ais_data(file_path, storage_format="csv"):
+    path = get_storage_path(file_path, storage_format)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _to_typed_frame(df, categorical_ratio=0.5):
+    """Encode low-cardinality string columns as categoricals (stored as parquet dictionaries)"""
+    df = df.copy()
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(dtype) or len(df) == 0:
+            continue
+        if df[col].nunique(dropna=True) <= categorical_ratio * len(df):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _from_typed_frame(df):
+    """Decode the categoricals of the on-disk schema, so callers see the dtypes that were saved"""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
+
+
+def save_ais_data(df, file_path, storage_format="csv", partition_by="mmsi_hash", num_partitions=16, append=False):
+    """
+    Save one data tier with the selected backend
+
+    Args:
+        df: DataFrame to store
+        file_path: logical '.csv' path of the tier
+        storage_format: 'csv' or 'parquet'
+        partition_by: 'mmsi_hash' or 'date' (parquet only)
+        num_partitions: number of MMSI hash buckets (parquet only)
+        append: add df to an existing tier instead of replacing it
+
+    Returns:
+        str: physical path that was written
+    """
+    path = get_storage_path(file_path, storage_format)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    if storage_format == "csv":
+        if append and os.path.exists(path):
+            df.to_csv(path, index=False, mode="a", header=False)
+        else:
+            df.to_csv(path, index=False)
+        return path
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("storage_format 'parquet' requires pyarrow, install it with: pip install pyarrow")
+
+    partition_col = PARTITION_COLUMNS[partition_by]
+    # Appended pieces keep plain string columns so that every file shares one schema
+    table = df.copy() if append else _to_typed_frame(df)
+    if partition_by == "mmsi_hash":
+        table[partition_col] = mmsi_hash_bucket(table["mmsi"], num_partitions)
+    else:
+        table[partition_col] = pd.to_datetime(table["timestamp"], errors="coerce").dt.strftime("%Y-%m-%d").fillna("unknown")
+
+    if os.path.isdir(path) and not append:
+        shutil.rmtree(path)
+    # Time-ordered file names, so that iter_ais_data_chunks reads the appended pieces of a partition in append order
+    table.to_parquet(path, engine="pyarrow", index=False, partition_cols=[partition_col],
+                     basename_template=f"{time.time_ns():020d}-{{i}}.parquet")
+    return path
+
+
+def load_ais_data(file_path, storage_format="csv", columns=None, sort_by=None):
+    """
+    Load one data tier, optionally reading only a subset of columns
+
+    Args:
+        file_path: logical '.csv' path of the tier
+        storage_format: preferred backend; the other one is used if only it exists
+        columns: columns to read, if stored (None reads all)
+        sort_by: columns to stably re-sort by, restoring row order across parquet partitions
+
+    Returns:
+        pd.DataFrame: stored data
+    """
+    path, fmt = _locate(file_path, storage_format)
+    if path is None:
+        raise FileNotFoundError(f"No stored data found for {file_path}")
+
+    if fmt == "csv":
+        df = pd.read_csv(path, usecols=None if columns is None else lambda col: col in columns)
+    else:
+        if columns is not None:
+            import pyarrow.parquet as pq
+            stored = set(pq.ParquetDataset(path).schema.names)
+            columns = [col for col in columns if col in stored]
+        df = pd.read_parquet(path, engine="pyarrow", columns=columns)
+        df = df.drop(columns=[c for c in PARTITION_COLUMNS.values() if c in df.columns and (columns is None or c not in columns)])
+        df = _from_typed_frame(df)
+
+    sort_by = [col for col in (sort_by or []) if col in df.columns]
+    if sort_by and fmt == "parquet":
+        df = df.sort_values(sort_by, kind="mergesort").reset_index(drop=True)
+    return df
+
+
+def iter_ais_data_chunks(file_path, storage_format="csv", chunk_size=1000000, columns=None):
+    """
+    Iterate over one data tier in bounded-size chunks, in storage order
+
+    Args:
+        file_path: logical '.csv' path of the tier
+        storage_format: preferred backend; the other one is used if only it exists
+        chunk_size: maximum number of rows per chunk
+        columns: columns to read (None reads all)
+
+    Returns:
+        Iterator[pd.DataFrame]: chunks of the stored data
+    """
+    path, fmt = _locate(file_path, storage_format)
+    if path is None:
+        raise FileNotFoundError(f"No stored data found for {file_path}")
+
+    if fmt == "csv":
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+            yield chunk
+        return
+
+    import pyarrow.parquet as pq
+    parquet_files = sorted(os.path.join(dir_path, name) for dir_path, _, file_names in os.walk(path)
+                           for name in file_names if name.endswith(".parquet"))
+    for parquet_file in parquet_files:
+        for batch in pq.ParquetFile(parquet_file).iter_batches(batch_size=chunk_size, columns=columns):
+            yield _from_typed_frame(batch.to_pandas())
@@ -1,8 +1,42 @@
 import os
 import json
 import re
+import hashlib
 import logging
+import threading
 from src.utils.HyperParameters import root_path
+from src.utils.Metrics import timed_stage
+from src.utils.ChangeLog import append_record, read_records, truncate_log, write_snapshot, read_snapshot
+from src.utils.SparseWeights import SparseWeights
+
+VB_CORE_ATTRIBUTES = ["speed_profile", "course_change", "heading_fluctuation", "intent", "duration"]
+# hex digits of the SHA-1 kept in node ids
+NODE_ID_DIGITS = 16
+# attributes written to SDKG snapshots
+PERSISTED_STATE = ["speed_dict", "course_dict", "heading_dict", "intent_dict",
+                   "SDK_graph_vs", "SDK_graph_vb", "SDK_graph_vb_node", "SDK_graph_vf", "SDK_graph_vf_node"]
+
+
+def vb_node_id(vb):
+    """
+    Content-addressed id of a movement behavior, identical across runs and experiments
+
+    Args:
+        vb: dict with the core attributes; text from '(' or ':' on is ignored and missing attributes count as "unknown"
+    """
+    content = {}
+    for attr in VB_CORE_ATTRIBUTES:
+        clean_value = re.split(r'[(:]', str(vb.get(attr, "unknown")), 1)[0]
+        content[attr] = " ".join(clean_value.split())
+    digest = hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"vb_{digest[:NODE_ID_DIGITS]}"
+
+
+def vf_node_id(code):
+    """Content-addressed id of a spatial function; surrounding and trailing whitespace and line endings are ignored"""
+    normalized = "\n".join(line.rstrip() for line in str(code).strip().splitlines())
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    return f"vf_{digest[:NODE_ID_DIGITS]}"
 class SDKG:
     def __init__(self, args):
         self.base_dir =  root_path + '/results/' + args.exp_name + '/SDKG/'
@@ -33,7 +67,76 @@ class SDKG:
         # }
         self.SDK_graph_vf = {}
         self.SDK_graph_vf_node = {}
-        
+        # sparse copies of the (vs attribute, value) -> vb and vb -> vf weights used to score candidates
+        self.vs_vb_weights = SparseWeights()
+        self.vb_vf_weights = SparseWeights()
+
+        # Persistence: every mutation is a change applied by _apply. Changes since the last checkpoint are
+        # appended to the log segment SDKG_log_<n>.bin, where n is the checkpoint of the snapshot the segment
+        # starts from (0: empty graph, None: a snapshot is due, e.g. after loading JSON checkpoints)
+        self.snapshot_every = args.sdkg_snapshot_every
+        self.change_lock = threading.Lock()
+        self.pending_changes = []
+        self.log_segment = 0
+        self.log_offset = 0
+        self.log_batches = 0
+
+    def _vocabulary_dict(self, attribute):
+        return {
+            "speed_profile": self.speed_dict,
+            "course_change": self.course_dict,
+            "heading_fluctuation": self.heading_dict,
+            "intent": self.intent_dict
+        }.get(attribute)
+
+    def _apply(self, change):
+        """Apply one mutation, either live (through _commit) or replayed from the change log"""
+        kind = change[0]
+        if kind == "add_term":
+            _, attribute, term = change
+            self._vocabulary_dict(attribute)[term] = True
+        elif kind == "clean_term":
+            _, attribute, redundant_term, primary_term = change
+            target_dict = self._vocabulary_dict(attribute)
+            if primary_term not in target_dict:
+                target_dict[primary_term] = True
+            del target_dict[redundant_term]
+        elif kind == "add_vb":
+            _, vb_id, vb_node = change
+            if vb_id not in self.SDK_graph_vb_node:
+                self.SDK_graph_vb_node[vb_id] = vb_node
+                self.SDK_graph_vb[vb_id] = {}
+        elif kind == "inc_vs":
+            _, attr_name, attr_value, vb_id = change
+            vb_weights = self.SDK_graph_vs.setdefault(attr_name, {}).setdefault(attr_value, {})
+            vb_weights[vb_id] = vb_weights.get(vb_id, 0) + 1
+            vs_key = f"vs_{attr_name}_{attr_value}"
+            self.SDK_graph_vb[vb_id][vs_key] = self.SDK_graph_vb[vb_id].get(vs_key, 0) + 1
+            self.vs_vb_weights.add((attr_name, attr_value), vb_id)
+        elif kind == "add_vf":
+            _, vf_id, vf_node = change
+            if vf_id not in self.SDK_graph_vf_node:
+                self.SDK_graph_vf_node[vf_id] = vf_node
+                self.SDK_graph_vf[vf_id] = {}
+        elif kind == "inc_vf":
+            _, vf_id, vb_id = change
+            self.SDK_graph_vf[vf_id][vb_id] = self.SDK_graph_vf[vf_id].get(vb_id, 0) + 1
+            self.SDK_graph_vb[vb_id][vf_id] = self.SDK_graph_vb[vb_id].get(vf_id, 0) + 1
+            self.vb_vf_weights.add(vb_id, vf_id)
+        elif kind == "merge_vf":
+            _, target_vf_id, source_vf_id = change
+            for vb_id, weight in self.SDK_graph_vf.get(source_vf_id, {}).items():
+                self.vb_vf_weights.add(vb_id, source_vf_id, -weight)
+                self.vb_vf_weights.add(vb_id, target_vf_id, weight)
+            self._merge_vf(target_vf_id, source_vf_id)
+        else:
+            raise ValueError(f"Unknown SDKG change {kind}")
+
+    def _commit(self, change):
+        with self.change_lock:
+            self._apply(change)
+            self.pending_changes.append(change)
+
     def update_dicts(self, v_b):
         new_flags = {
             "speed_profile": False,
@@ -45,23 +148,10 @@ class SDKG:
         for key, value in v_b.items():
             #clean_value = re.sub(r'\s*\(.*\)', '', value).strip()
             clean_value = re.split(r'[(:]', str(value), 1)[0].strip()
-            
-            if key == "speed_profile":
-                if clean_value not in self.speed_dict:
-                    self.speed_dict[clean_value] = True
-                    new_flags["speed_profile"] = True
-            elif key == "course_change":
-                if clean_value not in self.course_dict:
-                    self.course_dict[clean_value] = True
-                    new_flags["course_change"] = True
-            elif key == "heading_fluctuation":
-                if clean_value not in self.heading_dict:
-                    self.heading_dict[clean_value] = True
-                    new_flags["heading_fluctuation"] = True
-            elif key == "intent":
-                if clean_value not in self.intent_dict:
-                    self.intent_dict[clean_value] = True
-                    new_flags["intent"] = True
+            target_dict = self._vocabulary_dict(key)
+            if target_dict is not None and clean_value not in target_dict:
+                self._commit(("add_term", key, clean_value))
+                new_flags[key] = True
 
         updated_categories = [category for category, is_new in new_flags.items() if is_new]
         if updated_categories:
@@ -72,25 +162,14 @@ class SDKG:
     def clean_dicts(self, attribute_redundancy):
         total_cleaned = 0
 
-        dict_mapping = {
-            "speed_profile": self.speed_dict,
-            "course_change": self.course_dict,
-            "heading_fluctuation": self.heading_dict,
-            "intent": self.intent_dict
-        }
-
         for attribute, redundancy_mapping in attribute_redundancy.items():
-            if attribute in dict_mapping:
-                target_dict = dict_mapping[attribute]
+            target_dict = self._vocabulary_dict(attribute)
+            if target_dict is not None:
                 
                 for redundant_term, primary_term in redundancy_mapping.items():
                     
                     if redundant_term in target_dict:
-                        
-                        if primary_term not in target_dict:
-                            target_dict[primary_term] = True
-        
-                        del target_dict[redundant_term]
+                        self._commit(("clean_term", attribute, redundant_term, primary_term))
                         total_cleaned += 1
                         logging.info(f"SDKG cleaned {attribute}: '{redundant_term}' -> '{primary_term}'")
         
@@ -117,7 +196,11 @@ class SDKG:
             return False
         
         logging.info(f"Merging VF node {source_vf_id} into {target_vf_id}")
-        
+        self._commit(("merge_vf", target_vf_id, source_vf_id))
+        logging.info(f"Successfully merged {source_vf_id} into {target_vf_id}")
+        return True
+
+    def _merge_vf(self, target_vf_id, source_vf_id):
         if source_vf_id in self.SDK_graph_vf:
             source_vb_connections = self.SDK_graph_vf[source_vf_id]
             
@@ -142,104 +225,88 @@ class SDKG:
             del self.SDK_graph_vf[source_vf_id]
 
         del self.SDK_graph_vf_node[source_vf_id]
-        
-        logging.info(f"Successfully merged {source_vf_id} into {target_vf_id}")
-        return True
+    def _rebuild_weights(self):
+        """Refill the sparse weights from the graph dicts, after they were loaded"""
+        self.vs_vb_weights.reset()
+        self.vb_vf_weights.reset()
+        for attr_name, attr_values in self.SDK_graph_vs.items():
+            for attr_value, weight_map in attr_values.items():
+                for vb_id, weight in weight_map.items():
+                    self.vs_vb_weights.add((attr_name, attr_value), vb_id, weight)
+        # vb rows follow the order of SDK_graph_vb, which mirrors SDK_graph_vf and breaks ties between vf
+        for vb_id, weight_map in self.SDK_graph_vb.items():
+            for vf_id, weight in weight_map.items():
+                if vf_id in self.SDK_graph_vf:
+                    self.vb_vf_weights.add(vb_id, vf_id, weight)
+
     def select_Cb(self, args, Vs_list):
         """
         Returns:
             Cb: ([vb_id1, vb_id2, ...], [vb_node1, vb_node2, ...])
         """
-        all_attributes = {}
-        for vs in Vs_list:
-            if not vs:
-                continue
-            for attr_name, attr_value in vs.items():
-                if attr_name in ['block', 'seq', 'MMSI']:
-                    continue
-                if attr_name not in all_attributes:
-                    all_attributes[attr_name] = set()
-                all_attributes[attr_name].add(attr_value)
-        
-        candidate_vbs = {} 
-        
-        for attr_name, attr_values in all_attributes.items():
-            for attr_value in attr_values:
-                if (attr_name in self.SDK_graph_vs and 
-                    attr_value in self.SDK_graph_vs[attr_name]):
-                    weight_map = self.SDK_graph_vs[attr_name][attr_value]  
-                    for vb_id, weight in weight_map.items():
-                        if vb_id not in candidate_vbs:
-                            candidate_vbs[vb_id] = 1.0
-                        candidate_vbs[vb_id] *= (float(weight) + 1.0)
-        
-        if not candidate_vbs:
-            return ([], [])
-        
-        total_support = sum(candidate_vbs.values())
-        vb_scores = []
-        
-        for vb_id, product_support in candidate_vbs.items():
-            normalized_score = product_support / total_support
-            vb_scores.append((vb_id, normalized_score))
+        return self.select_Cb_batch(args, [Vs_list])[0]
+
+    def select_Cb_batch(self, args, Vs_lists):
+        """
+        Top-k vb of many segments in one vectorized pass; a vb scores the product of (weight + 1) over
+        the vs attribute values of the segment it is connected to
 
-        vb_scores.sort(key=lambda x: x[1], reverse=True)
-        top_vb_ids = [vb_id for vb_id, score in vb_scores[:args.top_k]]
+        Args:
+            Vs_lists: per segment, the list of its vs dicts
 
-        top_vb_nodes = []
-        for vb_id in top_vb_ids:
-            if vb_id in self.SDK_graph_vb_node:
-                top_vb_nodes.append(self.SDK_graph_vb_node[vb_id])
-            else:
-                top_vb_nodes.append({"vb_id": vb_id, "error": "node not found"})
+        Returns:
+            list: a Cb per segment, see select_Cb
+        """
+        queries = []
+        for Vs_list in Vs_lists:
+            attribute_values = []
+            for vs in Vs_list:
+                if not vs:
+                    continue
+                for attr_name, attr_value in vs.items():
+                    if attr_name in ['block', 'seq', 'MMSI']:
+                        continue
+                    attribute_values.append((attr_name, attr_value))
+            queries.append(attribute_values)
+
+        Cb_list = []
+        for scored in self.vs_vb_weights.top_k(queries, args.top_k):
+            top_vb_ids = [vb_id for vb_id, _ in scored]
+            top_vb_nodes = []
+            for vb_id in top_vb_ids:
+                if vb_id in self.SDK_graph_vb_node:
+                    top_vb_nodes.append(self.SDK_graph_vb_node[vb_id])
+                else:
+                    top_vb_nodes.append({"vb_id": vb_id, "error": "node not found"})
+            Cb_list.append((top_vb_ids, top_vb_nodes))
         #logging.info(f"Selected top {len(top_vb_ids)} vb_ids: {top_vb_ids}")
-        return (top_vb_ids, top_vb_nodes)
+        return Cb_list
     
     def select_Cf_Cb(self, args, Cb):
         """
         Returns:
             Cf: ([vf_id1, vf_id2, ...], [vf_node1, vf_node2, ...])
         """
-        vb_ids, _ = Cb  
-        
-        if not vb_ids:
-            return ([], [])
-        
-        candidate_vfs = {} 
-        
-        for vb_id in vb_ids:
-            if vb_id in self.SDK_graph_vb:
-                vf_weight_map = {}
-                for connected_id, weight in self.SDK_graph_vb[vb_id].items():
-                    if isinstance(connected_id, str) and connected_id.startswith('vf_'):
-                        vf_weight_map[connected_id] = weight
-                
-                for vf_id, weight in vf_weight_map.items():
-                    if vf_id not in candidate_vfs:
-                        candidate_vfs[vf_id] = 1.0
-                    candidate_vfs[vf_id] *= (float(weight) + 1.0)
+        return self.select_Cf_Cb_batch(args, [Cb])[0]
 
-        if not candidate_vfs:
-            return ([], [])
-        
-        total_support = sum(candidate_vfs.values())
-        vf_scores = []
-        
-        for vf_id, product_support in candidate_vfs.items():
-            normalized_score = product_support / total_support
-            vf_scores.append((vf_id, normalized_score))
-        
-        vf_scores.sort(key=lambda x: x[1], reverse=True)
-        top_vf_ids = [vf_id for vf_id, score in vf_scores[:args.top_k]]
-        
-        top_vf_nodes = []
-        for vf_id in top_vf_ids:
-            if vf_id in self.SDK_graph_vf_node:
-                top_vf_nodes.append(self.SDK_graph_vf_node[vf_id])
-            else:
-                top_vf_nodes.append({"vf_id": vf_id, "error": "node not found"})
-        
-        return (top_vf_ids, top_vf_nodes)
+    def select_Cf_Cb_batch(self, args, Cb_list):
+        """
+        Top-k vf of many Cb in one vectorized pass; a vf scores the product of (weight + 1) over the vb of Cb
+
+        Returns:
+            list: a Cf per Cb, see select_Cf_Cb
+        """
+        Cf_list = []
+        for scored in self.vb_vf_weights.top_k([vb_ids for vb_ids, _ in Cb_list], args.top_k):
+            top_vf_ids = [vf_id for vf_id, _ in scored]
+            top_vf_nodes = []
+            for vf_id in top_vf_ids:
+                if vf_id in self.SDK_graph_vf_node:
+                    top_vf_nodes.append(self.SDK_graph_vf_node[vf_id])
+                else:
+                    top_vf_nodes.append({"vf_id": vf_id, "error": "node not found"})
+            Cf_list.append((top_vf_ids, top_vf_nodes))
+        return Cf_list
 
     def generate_induce_graph(self, Vs, Cb, Cf):
         """
@@ -308,17 +375,7 @@ class SDKG:
         return "\n".join(dot_lines)
 
     def select_Cf_vb(self, vb):
-        core_attributes = ["speed_profile", "course_change", "heading_fluctuation", "intent", "duration"]
-        vb_hash_content = {}
-        
-        for attr in core_attributes:
-            if attr in vb:
-                clean_value = re.split(r'[(:]', str(vb[attr]), 1)[0].strip()
-                vb_hash_content[attr] = clean_value
-        
-        vb_content_str = json.dumps(vb_hash_content, sort_keys=True)
-        vb_hash = hash(vb_content_str)
-        vb_id = f"vb_{vb_hash}"
+        vb_id = vb_node_id(vb)
         
         if vb_id in self.SDK_graph_vb_node:
             vb_connections = self.SDK_graph_vb.get(vb_id, {})
@@ -347,83 +404,49 @@ class SDKG:
         if not v_b:
             return
             
-        core_attributes = ["speed_profile", "course_change", "heading_fluctuation", "intent", "duration"]
-        vb_hash_content = {}
         vb_storage_content = {}
-        
-        for attr in core_attributes:
+        for attr in VB_CORE_ATTRIBUTES:
             if attr in v_b:
-                clean_value = re.split(r'[(:]', str(v_b[attr]), 1)[0].strip()
-                vb_hash_content[attr] = clean_value
                 vb_storage_content[attr] = str(v_b[attr]).strip()
 
-        vb_content_str = json.dumps(vb_hash_content, sort_keys=True)
-        vb_hash = hash(vb_content_str)
-        vb_id = f"vb_{vb_hash}"
+        vb_id = vb_node_id(vb_storage_content)
 
         if vb_id not in self.SDK_graph_vb_node:
             storage_attributes = {}
-            for attr in core_attributes:
+            for attr in VB_CORE_ATTRIBUTES:
                 if attr in vb_storage_content:
                     storage_attributes[attr] = vb_storage_content[attr]
                 else:
                     storage_attributes[attr] = "unknown"
             
-            self.SDK_graph_vb_node[vb_id] = {
+            self._commit(("add_vb", vb_id, {
                 "speed_profile": storage_attributes["speed_profile"],
                 "course_change": storage_attributes["course_change"], 
                 "heading_fluctuation": storage_attributes["heading_fluctuation"],
                 "intent": storage_attributes["intent"],
                 "duration": storage_attributes["duration"],
                 "llm_output": v_b.get("llm_output", "")  
-            }
-            self.SDK_graph_vb[vb_id] = {}
+            }))
 
         if v_s:
             for attr_name, attr_value in v_s.items():
                 if attr_name in ['block', 'seq', 'MMSI']:
                     continue
-                if attr_name not in self.SDK_graph_vs:
-                    self.SDK_graph_vs[attr_name] = {}
-                
-                if attr_value not in self.SDK_graph_vs[attr_name]:
-                    self.SDK_graph_vs[attr_name][attr_value] = {}
-
-                if vb_id in self.SDK_graph_vs[attr_name][attr_value]:
-                    self.SDK_graph_vs[attr_name][attr_value][vb_id] += 1
-                else:
-                    self.SDK_graph_vs[attr_name][attr_value][vb_id] = 1
-                    
-                vs_key = f"vs_{attr_name}_{attr_value}"  
-                if vs_key in self.SDK_graph_vb[vb_id]:
-                    self.SDK_graph_vb[vb_id][vs_key] += 1
-                else:
-                    self.SDK_graph_vb[vb_id][vs_key] = 1
+                self._commit(("inc_vs", attr_name, attr_value, vb_id))
         
         if v_f:
-            func_content = v_f.get('spatial_function', '').strip()
-            vf_hash = hash(func_content)
-            vf_id = f"vf_{vf_hash}"
+            vf_id = vf_node_id(v_f.get('spatial_function', ''))
             
             if vf_id not in self.SDK_graph_vf_node:
-                self.SDK_graph_vf_node[vf_id] = {
+                self._commit(("add_vf", vf_id, {
                     "description": v_f.get("describe_of_function", ""), 
                     "code": v_f.get("spatial_function", "") 
-                }
-                self.SDK_graph_vf[vf_id] = {}
-
-            if vb_id in self.SDK_graph_vf[vf_id]:
-                self.SDK_graph_vf[vf_id][vb_id] += 1
-            else:
-                self.SDK_graph_vf[vf_id][vb_id] = 1
-            
-            if vf_id in self.SDK_graph_vb[vb_id]:
-                self.SDK_graph_vb[vb_id][vf_id] += 1
-            else:
-                self.SDK_graph_vb[vb_id][vf_id] = 1
+                }))
+            self._commit(("inc_vf", vf_id, vb_id))
 
         logging.info("Updated SDK graph with new knowledge unit")
 
+    @timed_stage("M0_SDKG")
     def update_SDK_graph_per_batch(self, knowledge_unit_list):
         if not knowledge_unit_list:
             return
@@ -433,6 +456,20 @@ class SDKG:
         logging.info("Updated SDK graph with batch of knowledge units")
 
     
+    def get_vocabulary_weights(self):
+        """Graph support of every vocabulary value Returns: {vb attribute: {clean value: summed edge weight of its vb nodes}}"""
+        weights = {"speed_profile": {}, "course_change": {}, "heading_fluctuation": {}, "intent": {}}
+        for vb_id, vb_node in self.SDK_graph_vb_node.items():
+            support = max(1, sum(self.SDK_graph_vb.get(vb_id, {}).values()))
+            for attr, attr_weights in weights.items():
+                clean_value = re.split(r'[(:]', str(vb_node.get(attr, "")), 1)[0].strip()
+                attr_weights[clean_value] = attr_weights.get(clean_value, 0) + support
+        return weights
+
+    def get_vf_weights(self):
+        """Returns: {vf_id: summed weight of its vb edges}"""
+        return {vf_id: sum(self.SDK_graph_vf.get(vf_id, {}).values()) for vf_id in self.SDK_graph_vf_node}
+
     def get_vb_attributes_dicts(self):
         return {
             "speed_dict": self.speed_dict,
@@ -441,38 +478,83 @@ class SDKG:
             "intent_dict": self.intent_dict
         }
         
-    def save_SDKG(self, checkpoint_point):
-        logging.info(f"Saving SDKG to {os.path.join(self.base_dir, 'pattern_attributes_dicts_' + checkpoint_point + '.json')}")
-        def convert_keys(obj):
-            if isinstance(obj, dict):
-                return {str(k): convert_keys(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_keys(item) for item in obj]
-            else:
-                return obj
-        with open(os.path.join(self.base_dir, "pattern_attributes_dicts_" + checkpoint_point + ".json"), "w") as f:
-            json.dump({"speed_dict": self.speed_dict, "course_dict": self.course_dict, "heading_dict": self.heading_dict, "intent_dict": self.intent_dict}, f, indent=2)
-
-        with open(os.path.join(self.base_dir, "SDK_graph_vs_" + checkpoint_point + ".json"), "w") as f:
-                json.dump({"SDK_graph_vs": convert_keys(self.SDK_graph_vs)}, f, indent=2)  
+    def _snapshot_path(self, checkpoint):
+        return os.path.join(self.base_dir, f"SDKG_snapshot_{checkpoint}.pkl")
 
-        with open(os.path.join(self.base_dir, "SDK_graph_vb_" + checkpoint_point + ".json"), "w") as f:
-            json.dump({"SDK_graph_vb": convert_keys(self.SDK_graph_vb)}, f, indent=2) 
-        
-        with open(os.path.join(self.base_dir, "SDK_graph_vb_node_" + checkpoint_point + ".json"), "w") as f:
-            json.dump({"SDK_graph_vb_node": convert_keys(self.SDK_graph_vb_node)}, f, indent=2) 
+    def _log_path(self, segment):
+        return os.path.join(self.base_dir, f"SDKG_log_{segment}.bin")
 
-        with open(os.path.join(self.base_dir, "SDK_graph_vf_" + checkpoint_point + ".json"), "w") as f:
-            json.dump({"SDK_graph_vf": convert_keys(self.SDK_graph_vf)}, f, indent=2) 
+    def _persisted_checkpoints(self, prefix, suffix):
+        checkpoints = []
+        for file_name in os.listdir(self.base_dir):
+            match = re.fullmatch(re.escape(prefix) + r"(\d+)" + re.escape(suffix), file_name)
+            if match:
+                checkpoints.append(int(match.group(1)))
+        return sorted(checkpoints)
 
-        with open(os.path.join(self.base_dir, "SDK_graph_vf_node_" + checkpoint_point + ".json"), "w") as f:
-            json.dump({"SDK_graph_vf_node": convert_keys(self.SDK_graph_vf_node)}, f, indent=2)  
+    def save_SDKG(self, checkpoint_point):
+        """
+        Checkpoint in O(changes): the changes since the previous checkpoint are appended to the current log
+        segment. Every --sdkg_snapshot_every checkpoints the whole graph is written as a snapshot instead,
+        which starts a new segment.
+        """
+        checkpoint = int(checkpoint_point)
+        with self.change_lock:
+            changes, self.pending_changes = self.pending_changes, []
+            if self.log_segment is None or self.log_batches + 1 >= self.snapshot_every:
+                if self.log_segment is not None:
+                    truncate_log(self._log_path(self.log_segment), self.log_offset)
+                write_snapshot(self._snapshot_path(checkpoint), {name: getattr(self, name) for name in PERSISTED_STATE})
+                self.log_segment, self.log_offset, self.log_batches = checkpoint, 0, 0
+                open(self._log_path(checkpoint), "wb").close()
+                logging.info(f"Saved SDKG snapshot {self._snapshot_path(checkpoint)}")
+            else:
+                self.log_offset = append_record(self._log_path(self.log_segment), self.log_offset, (checkpoint, changes))
+                self.log_batches += 1
+                logging.info(f"Appended {len(changes)} SDKG changes of checkpoint {checkpoint} to {self._log_path(self.log_segment)}")
+        # snapshots / segments past the current one were written by a run this one resumed before
+        for stale in self._persisted_checkpoints("SDKG_snapshot_", ".pkl") + self._persisted_checkpoints("SDKG_log_", ".bin"):
+            if stale > self.log_segment:
+                for path in (self._snapshot_path(stale), self._log_path(stale)):
+                    if os.path.exists(path):
+                        os.remove(path)
         return 
 
+    def _load_change_log(self, checkpoint):
+        """Restore checkpoint from the latest snapshot before it plus the log tail; Returns: False if not found"""
+        snapshots = [n for n in self._persisted_checkpoints("SDKG_snapshot_", ".pkl") if n <= checkpoint]
+        segment = snapshots[-1] if snapshots else 0
+        if not os.path.exists(self._log_path(segment)):
+            return False
+        state = read_snapshot(self._snapshot_path(segment)) if segment else {}
+        for name in PERSISTED_STATE:
+            setattr(self, name, state.get(name, {}))
+        offset, batches, replayed = 0, 0, 0
+        if segment != checkpoint:
+            for (record_checkpoint, changes), record_end in read_records(self._log_path(segment)):
+                for change in changes:
+                    self._apply(change)
+                offset, batches, replayed = record_end, batches + 1, replayed + len(changes)
+                if record_checkpoint == checkpoint:
+                    break
+            else:
+                for name in PERSISTED_STATE:
+                    setattr(self, name, {})
+                return False
+        self.log_segment, self.log_offset, self.log_batches = segment, offset, batches
+        logging.info(f"Loaded SDKG checkpoint {checkpoint} from snapshot {segment} and {replayed} logged changes")
+        return True
+
     def load_SDKG(self, start_point):
         if (start_point == 0):
             return
 
+        if self._load_change_log(int(start_point)):
+            self._rebuild_weights()
+            return
+        # checkpoints saved as JSON files before the change log; the next save writes a snapshot
+        self.log_segment = None
+
         logging.info(f"Loading SDKG from {os.path.join(self.base_dir, 'pattern_attributes_dicts_' + str(start_point) + '.json')}")
         dicts_file=os.path.join(self.base_dir, "pattern_attributes_dicts_" + str(start_point) + ".json")
         if os.path.exists(dicts_file):
@@ -525,3 +607,4 @@ class SDKG:
         else:
             logging.info(f"SDK_graph_vf_node_{str(start_point)}.json not found")
  
+        self._rebuild_weights()
@@ -8,6 +8,7 @@ import pandas as pd
 import requests
 from collections import Counter
 from typing import Dict, Any, Optional, Union
+from src.utils.Metrics import timed_stage
 
 # cache for API results to avoid redundant calls
 _geocode_cache = {}
@@ -99,6 +100,7 @@ def discretize_bucket(value: Union[float, int, str], step: int, upper: int, unit
     high_s = str(int(high)) if abs(high - int(high)) < 1e-9 else f"{high:g}"
     return f"[{low_s}, {high_s}){unit}"
 
+@timed_stage("M1_StaticSpatialEncoder")
 def generate_vs(df: pd.DataFrame, 
                             mmsi: int, 
                             sequence_id: Optional[Union[int, str]] = None,
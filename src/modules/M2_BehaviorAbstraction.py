@@ -1,11 +1,17 @@
-import sys, os, re, logging
+import sys, os, re, time, logging, threading
 import pandas as pd
 
 root_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(root_path)
 
-from src.utils.CallApi import call_qwen_api
-from src.modules.Prompt import Pattern_Prompt
+from src.utils.CallApi import call_qwen_api, reject_llm_response
+from src.modules.Prompt import Pattern_Prompt, Pattern_Batch_Prompt
+from src.data.AISDataProcess import format_dynamic_info
+from src.utils.TrajectoryEncoder import trajectory_text, PATTERN_COLUMNS
+from src.utils.PromptAssembler import budget_vocabulary_dicts
+from src.utils.Metrics import timed_stage
+from src.utils.ModelCascade import cascade_call, cascade_models
+from src.utils.StructuredOutput import json_output_enabled, with_output_schema, structured_text
 
 def extract_from_llm(rules, field_name):
     """Extract field value from LLM output"""
@@ -13,6 +19,126 @@ def extract_from_llm(rules, field_name):
     match = re.search(pattern, rules, flags=re.IGNORECASE)
     return match.group(1).strip() if match else "unknown"
 
+def is_complete_pattern(block):
+    """A pattern block is usable when all four fields were extracted"""
+    return all(extract_from_llm(block, field) != "unknown"
+               for field in ("speed_pattern", "course_pattern", "heading_pattern", "intent"))
+
+def parse_batched_patterns(raw_output, num_segments):
+    """Map the '=== Segment <i> ===' sections of a batched answer to their first pattern block Returns: {segment index: block}"""
+    blocks = {}
+    sections = re.split(r"===\s*Segment\s+(\d+)\s*===", raw_output)
+    for number, body in zip(sections[1::2], sections[2::2]):
+        idx = int(number) - 1
+        block = re.search(r"('''[\s\S]*?''')", body)
+        if 0 <= idx < num_segments and block and idx not in blocks:
+            blocks[idx] = block.group(1)
+    return blocks
+
+class PatternBatcher:
+    """
+    Collects the trajectory texts of concurrent generate_vb calls and labels them with one
+    Pattern_Batch_Prompt call. A batch closes when it holds max_batch segments, when the next
+    segment would exceed token_budget, or max_wait seconds after its first segment arrived.
+    """
+    def __init__(self, max_batch, token_budget, max_wait):
+        self.max_batch = max_batch
+        self.token_budget = token_budget
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.pending = []
+        self.leader_active = False
+
+    @staticmethod
+    def estimate_tokens(text):
+        return len(text) / 4.0
+
+    def _take_batch(self):
+        batch, tokens = [], 0.0
+        while self.pending and len(batch) < self.max_batch:
+            entry_tokens = self.estimate_tokens(self.pending[0]['text'])
+            if batch and tokens + entry_tokens > self.token_budget:
+                break
+            entry = self.pending.pop(0)
+            entry['taken'] = True
+            batch.append(entry)
+            tokens += entry_tokens
+        return batch
+
+    def _batch_ready(self):
+        if len(self.pending) >= self.max_batch:
+            return True
+        return sum(self.estimate_tokens(entry['text']) for entry in self.pending) >= self.token_budget
+
+    def _label(self, args, SDKG, batch):
+        segments_data = "\n".join(f"=== Segment {i + 1} ===\n{entry['text']}" for i, entry in enumerate(batch))
+        input_text = Pattern_Batch_Prompt.format(
+            num_segments=len(batch),
+            segments_data=segments_data,
+            **budget_vocabulary_dicts(args, SDKG)
+        )
+        # Batches go to the first model of the cascade; with more than one model, the segments it
+        # got wrong are mined again on their own through the whole cascade
+        models = cascade_models(args.mining_llm)
+        prompt = with_output_schema(args, input_text, 'pattern_batch')
+        try:
+            raw_output = call_qwen_api(args, prompt, models[0], 'pattern', json_output=json_output_enabled(args))
+            raw_output = structured_text(args, prompt, raw_output, 'pattern_batch', models[0], 'pattern')
+            blocks = parse_batched_patterns(raw_output, len(batch))
+            if len(models) > 1:
+                blocks = {idx: block for idx, block in blocks.items() if is_complete_pattern(block)}
+            if not blocks:
+                reject_llm_response(args, prompt, models[0], 'pattern')
+        except Exception as e:
+            logging.warning(f"Batched pattern call failed for {len(batch)} segments: {e}")
+            blocks = {}
+        logging.info(f"Batched pattern call labelled {len(blocks)}/{len(batch)} segments")
+        return blocks
+
+    def submit(self, args, SDKG, trajectory_data):
+        """Wait for the batched answer of one segment Returns: its pattern block, or None if the batch missed it"""
+        entry = {'text': trajectory_data, 'block': None, 'taken': False, 'done': False}
+        with self.cond:
+            self.pending.append(entry)
+            self.cond.notify_all()
+            deadline = time.monotonic() + self.max_wait
+            while not entry['done']:
+                # Wait while another thread is filling a batch or labelling the one holding this segment
+                if self.leader_active or entry['taken']:
+                    self.cond.wait()
+                    continue
+                # Lead the next batch: let it fill up, then call the LLM without holding the lock
+                self.leader_active = True
+                while not self._batch_ready() and time.monotonic() < deadline:
+                    self.cond.wait(timeout=deadline - time.monotonic())
+                batch = self._take_batch()
+                self.leader_active = False
+                self.cond.notify_all()
+                if not batch:
+                    self.cond.wait()
+                    continue
+                self.cond.release()
+                try:
+                    blocks = self._label(args, SDKG, batch)
+                finally:
+                    self.cond.acquire()
+                for i, batched_entry in enumerate(batch):
+                    batched_entry['block'] = blocks.get(i)
+                    batched_entry['done'] = True
+                self.cond.notify_all()
+        return entry['block']
+
+_pattern_batcher = None
+_pattern_batcher_lock = threading.Lock()
+
+def get_pattern_batcher(args):
+    global _pattern_batcher
+    with _pattern_batcher_lock:
+        if _pattern_batcher is None:
+            _pattern_batcher = PatternBatcher(args.vb_batch_size, args.vb_batch_token_budget, args.vb_batch_wait)
+    return _pattern_batcher
+
+@timed_stage("M2_BehaviorAbstraction")
 def generate_vb(args, minimal_seg, SDKG):
     """Generate patterns from trajectory data with identifiers"""
     logging.info("Generating patterns from trajectory data...")
@@ -45,15 +171,30 @@ def generate_vb(args, minimal_seg, SDKG):
     duration = f"{lower}~{upper}"
     logging.info(f"Duration interval: {duration}")
     
-    # Generate prompt with available options
-    field_dicts = SDKG.get_vb_attributes_dicts()
-    input_text = Pattern_Prompt.format(
-        trajectory_data='\n'.join(minimal_seg['dynamic_info']).strip(),
-        **field_dicts
-    )
-    # Call LLM API to generate patterns
-    raw_output = call_qwen_api(args, input_text,args.mining_llm,'pattern')
-    rule_blocks = re.findall(r"('''[\s\S]*?''')", raw_output, flags=re.DOTALL)
+    trajectory_data = trajectory_text(args, minimal_seg, 'pattern', '\n'.join(format_dynamic_info(minimal_seg)).strip(), PATTERN_COLUMNS)
+    rule_blocks = []
+    if args.vb_batch_size > 1:
+        # Label this segment together with the ones mined concurrently; a segment the batch missed is re-sent on its own
+        block = get_pattern_batcher(args).submit(args, SDKG, trajectory_data)
+        if block is not None:
+            rule_blocks = [block]
+        else:
+            logging.warning("Segment missing from batched pattern output, re-sending it alone")
+
+    if not rule_blocks:
+        # Generate prompt with available options
+        field_dicts = budget_vocabulary_dicts(args, SDKG)
+        input_text = Pattern_Prompt.format(
+            trajectory_data=trajectory_data,
+            **field_dicts
+        )
+        # Call LLM API to generate patterns, escalating while the answer has no complete pattern block
+        rule_blocks, _ = cascade_call(
+            args, input_text, args.mining_llm, 'pattern',
+            parse=lambda raw_output: re.findall(r"('''[\s\S]*?''')", raw_output, flags=re.DOTALL),
+            is_valid=lambda blocks: bool(blocks) and is_complete_pattern(blocks[0]),
+            prompt_type='pattern'
+        )
     
     if not rule_blocks:
         logging.warning("No valid pattern blocks found in LLM output")
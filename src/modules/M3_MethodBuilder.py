@@ -7,8 +7,13 @@ sys.path.append(root_path)
 import re,pandas
 import logging
 import numpy as np
-from src.utils.CallApi import call_qwen_api
+from src.utils.CallApi import call_qwen_api, reject_llm_response
 from src.modules.Prompt import Function_Prompt
+from src.data.AISDataProcess import format_dynamic_info
+from src.utils.TrajectoryEncoder import trajectory_text, FUNCTION_COLUMNS
+from src.utils.Metrics import timed_stage
+from src.utils.ModelCascade import cascade_models, record_cascade_attempt
+from src.utils.FunctionCache import get_function_cache
 
 def extract_function_and_description(text):
     """Extract function code and description from LLM output"""
@@ -18,15 +23,9 @@ def extract_function_and_description(text):
     function_description = desc_match.group(1).strip() if desc_match else ""
     return spatial_function, function_description
 
-def compile_function_from_code(spatial_function_code):
-    """Compile spatial function from code string"""
-    local_ns = {}
-    try:
-        exec(spatial_function_code, {}, local_ns)
-        function = local_ns.get("spatial_function", None)
-        return function
-    except Exception as e:
-        raise RuntimeError(f"Function compilation failed: {e}")
+def compile_function_from_code(args, spatial_function_code):
+    """Compile spatial function from code string, through the shared compiled function cache"""
+    return get_function_cache(args).get(spatial_function_code)
 
 def evaluate_function_on_batch(fn, minimal_seg_np):
     """
@@ -61,13 +60,16 @@ def evaluate_function_on_batch(fn, minimal_seg_np):
     
     return e_f, mae_lat, mae_lon
 
+@timed_stage("M3_MethodBuilder")
 def generate_vf(args, vb, SDKG, minimal_seg):
     """Generate and validate spatial function for a vb """
     is_new_vf = True
     
+    combined_data = trajectory_text(args, minimal_seg, 'function', '\n'.join(format_dynamic_info(minimal_seg)).strip(), FUNCTION_COLUMNS)
+
     def build_prompt(feedback_txt=""):
         return Function_Prompt.format(
-            combined_data='\n'.join(minimal_seg['dynamic_info']).strip(),
+            combined_data=combined_data,
             pattern=vb["llm_output"],
             feedback_txt=feedback_txt
         )
@@ -84,7 +86,7 @@ def generate_vf(args, vb, SDKG, minimal_seg):
         function_description = selected_vf.get("description", "")
         logging.info("Selected existing VF from SDKG")
 
-        function = compile_function_from_code(spatial_function_code)
+        function = compile_function_from_code(args, spatial_function_code)
         e_f,mae_lat, mae_lon = evaluate_function_on_batch(function, minimal_seg[['latitude', 'longitude', 'timestamp']].to_numpy())
         logging.info(f" Selected VF validation → {e_f}")           
         if e_f <= args.e_f:
@@ -97,7 +99,10 @@ def generate_vf(args, vb, SDKG, minimal_seg):
     
     if not attempt_ok:
         logging.info("No suitable VF found in SDKG, generating new function...")
+        # Attempt i goes to the i-th model of the coding cascade (the last one for any further attempt)
+        models = cascade_models(args.coding_llm)
         for attempt in range(1, args.retry_times + 1):
+            llm_model = models[min(attempt, len(models)) - 1]
             feedback = ""
             if attempt > 1 and last_err_msg:
                 feedback = (
@@ -107,8 +112,9 @@ def generate_vf(args, vb, SDKG, minimal_seg):
                     "and reduces e(f)=0.5*(MAE_lat+MAE_lon) below 3e-3 degrees.\n"
                 )
 
+            prompt = build_prompt(feedback_txt=feedback)
             try:
-                response_text = call_qwen_api(args, build_prompt(feedback_txt=feedback),args.coding_llm,'function')
+                response_text = call_qwen_api(args, prompt, llm_model, 'function')
                 spatial_function_code, function_description = extract_function_and_description(response_text)
 
                 if not spatial_function_code:
@@ -117,7 +123,7 @@ def generate_vf(args, vb, SDKG, minimal_seg):
                     continue
 
                 # Validate function on trajectory data
-                function = compile_function_from_code(spatial_function_code)
+                function = compile_function_from_code(args, spatial_function_code)
                 e_f, mae_lat, mae_lon = evaluate_function_on_batch(function, minimal_seg[['latitude', 'longitude', 'timestamp']].to_numpy())
                 logging.info(f"Attempt {attempt} validation → {e_f}")
                 
@@ -132,6 +138,11 @@ def generate_vf(args, vb, SDKG, minimal_seg):
             except Exception as e:
                 last_err_msg = f"Runtime/validation error: {e}"
                 logging.warning(f"Attempt {attempt} error: {last_err_msg}")
+            finally:
+                escalated = not attempt_ok and attempt < min(args.retry_times, len(models))
+                record_cascade_attempt('function', llm_model, attempt_ok, escalated)
+                if not attempt_ok:
+                    reject_llm_response(args, prompt, llm_model, 'function')
 
     vf = {
         "spatial_function": spatial_function_code,
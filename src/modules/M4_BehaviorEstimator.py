@@ -1,5 +1,7 @@
-from src.utils.CallApi import call_qwen_api
+from src.utils.ModelCascade import cascade_call
 from src.modules.Prompt import Behavior_Estimator_Prompt
+from src.utils.TrajectoryEncoder import trajectory_text, IMPUTATION_COLUMNS
+from src.utils.Metrics import timed_stage
 import re
 from typing import Dict
 import logging
@@ -20,6 +22,7 @@ def extract_behavior_selection(llm_output: str) -> Dict[str, str]:
     
     return result if any(result.values()) else {}
 
+@timed_stage("M4_BehaviorEstimator")
 def behavior_estimator(args,minimal_seg,SDKG,context_information):
     logging.info("START M4")
     vb_c,vs_c=context_information.infer_vs_vb(minimal_seg)
@@ -29,19 +32,25 @@ def behavior_estimator(args,minimal_seg,SDKG,context_information):
     dot_graph=SDKG.generate_induce_graph(vs_c , Cb , None)
     #logging.info(f"Generated dot graph for behavior estimation:\n{dot_graph}")  
     
+    rows_text = trajectory_text(args, minimal_seg, 'selection', str(minimal_seg), IMPUTATION_COLUMNS)
     def build_prompt():
         return Behavior_Estimator_Prompt.format(
             boundary_text=vb_c,
             dot_text=dot_graph,
             context_vessels=vs_c,
             movement_text=Cb,
-            rows_text=minimal_seg,
+            rows_text=rows_text,
             top_k=args.top_k
         )
     
-    raw_output = call_qwen_api(args, build_prompt(),args.analysis_llm,'selection')
-    #logging.info(f"Behavior Estimator LLM Output:\n{raw_output}")
-    vb = extract_behavior_selection(raw_output)
+    # Escalate while the answer does not name one of the candidate movements
+    candidate_ids = set(Cb[0]) if Cb else set()
+    vb, _ = cascade_call(
+        args, build_prompt(), args.analysis_llm, 'selection',
+        parse=extract_behavior_selection,
+        is_valid=lambda vb: vb.get('selected_movement_id') in candidate_ids,
+        prompt_type='behavior_estimator'
+    )
     #logging.info(f"Extracted Behavior Selection: {vb}")
     
     return Cb,vb
\ No newline at end of file
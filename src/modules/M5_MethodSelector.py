@@ -1,5 +1,7 @@
-from src.utils.CallApi import call_qwen_api
+from src.utils.ModelCascade import cascade_call
 from src.modules.Prompt import Method_Selector_Prompt
+from src.utils.TrajectoryEncoder import trajectory_text, IMPUTATION_COLUMNS
+from src.utils.Metrics import timed_stage
 import re
 from typing import Dict
 import logging
@@ -21,22 +23,28 @@ def extract_selection_methods(llm_output: str) -> Dict[str, str]:
     
     return result if any(result.values()) else {}
 
+@timed_stage("M5_MethodSelector")
 def method_selector(args,Cb,minimal_seg,SDKG):
     logging.info("START M5")
     Cf=SDKG.select_Cf_Cb(args,Cb)
     #logging.info(f"Selected candidate functions: {Cf}")
     dot_graph=SDKG.generate_induce_graph(None,Cb,Cf)
     #logging.info(f"Generated dot graph for method selection:\n{dot_graph}")
+    rows_text = trajectory_text(args, minimal_seg, 'selection', str(minimal_seg), IMPUTATION_COLUMNS)
     def build_prompt():
         return Method_Selector_Prompt.format(
             dot_text=dot_graph,
             functions_text=Cf,
             movement_text=Cb,
-            rows_text=minimal_seg
+            rows_text=rows_text
         )
     
-    raw_output = call_qwen_api(args, build_prompt(),args.analysis_llm,'selection')
-    #logging.info(f"Raw LLM output for method selection:\n{raw_output}")
-    vf = extract_selection_methods(raw_output)
+    # Escalate while the answer does not name a function of the SDKG
+    vf, _ = cascade_call(
+        args, build_prompt(), args.analysis_llm, 'selection',
+        parse=extract_selection_methods,
+        is_valid=lambda vf: bool(vf.get('selected_function_id')) and SDKG.check_vf_exists(vf['selected_function_id']),
+        prompt_type='method_selector'
+    )
     #logging.info(f"Extracted method selection results: {vf}")
     return Cf,vf
\ No newline at end of file
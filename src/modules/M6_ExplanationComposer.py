@@ -1,7 +1,8 @@
 import re
 from typing import Dict
-from src.utils.CallApi import call_qwen_api
+from src.utils.ModelCascade import cascade_call
 from src.modules.Prompt import Explanation_Composer_Prompt
+from src.utils.Metrics import timed_stage
 import logging
 def extract_explanation(llm_output: str) -> Dict[str, str]:
     match = re.search(r"```(?:\w+)?\s*(.*?)\s*```", llm_output, re.DOTALL)
@@ -17,6 +18,7 @@ def extract_explanation(llm_output: str) -> Dict[str, str]:
     
     return result if any(result.values()) else {}
 
+@timed_stage("M6_ExplanationComposer")
 def explanation_composer(args,minimal_seg,Cb,Cf,vb_f,vf_f,SDKG,context_information):
     logging.info("START M6")
     vb_c,vs_c=context_information.infer_vs_vb(minimal_seg)
@@ -33,8 +35,11 @@ def explanation_composer(args,minimal_seg,Cb,Cf,vb_f,vf_f,SDKG,context_informati
             vessels_behavior_pattern=vb_c
         )
     
-    raw_output = call_qwen_api(args, build_prompt(),args.analysis_llm,'explanation')
-    #logging.info(f"Raw LLM output for explanation composition:\n{raw_output}")
-    explanations = extract_explanation(raw_output)
+    explanations, _ = cascade_call(
+        args, build_prompt(), args.analysis_llm, 'explanation',
+        parse=extract_explanation,
+        is_valid=lambda explanations: bool(explanations.get('operational_protocol_rationale')),
+        prompt_type='explanation_composer'
+    )
     #logging.info(f"Extracted explanations: {explanations}")
     return explanations
\ No newline at end of file
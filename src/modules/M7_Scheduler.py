@@ -5,6 +5,7 @@ import numpy as np
 import logging
 import concurrent.futures
 from src.utils.utils import get_root_path
+from src.utils.Metrics import timed_stage
 root_path=get_root_path()
 from src.modules.M8_AnomalyDetection import handle_task_exception_with_retry
 from src.modules.M9_Deredundancy import deredundancy
@@ -133,14 +134,86 @@ class ImputationResultsManager:
         logging.info(f"Saved imputation results to {output_path}")
         return output_path    
     
+class SegmentIndex:
+    """Row ranges of every (sequence_id, segment_id) pair, built with one stable sort of the trajectory frame"""
+    def __init__(self, traj_df):
+        seq_ids = traj_df['sequence_id'].to_numpy()
+        seg_ids = traj_df['segment_id'].to_numpy()
+        order = np.lexsort((seg_ids, seq_ids))
+        self.data = traj_df.iloc[order]
+        self.seg_ids = seg_ids[order]
+        seq_ids = seq_ids[order]
+
+        n = len(order)
+        seq_start = np.ones(n, dtype=bool)
+        seq_start[1:] = seq_ids[1:] != seq_ids[:-1]
+        pair_start = seq_start.copy()
+        pair_start[1:] |= self.seg_ids[1:] != self.seg_ids[:-1]
+
+        starts = np.flatnonzero(pair_start)
+        stops = np.append(starts[1:], n)
+        # Stable sort: the first row of each pair is also its first row in traj_df
+        appearance = np.argsort(order[starts], kind='stable')
+        self.segment_ranges = {
+            (seq_ids[starts[i]].item(), self.seg_ids[starts[i]].item()): (int(starts[i]), int(stops[i])) for i in appearance
+        }
+
+        seq_starts = np.flatnonzero(seq_start)
+        seq_stops = np.append(seq_starts[1:], n)
+        self.sequence_ranges = {seq_ids[a].item(): (int(a), int(b)) for a, b in zip(seq_starts, seq_stops)}
+
+    def segments(self, sequence_ids):
+        """(sequence_id, segment_id) pairs of the given sequences, in order of appearance in traj_df"""
+        wanted = set(sequence_ids)
+        return [key for key in self.segment_ranges if key[0] in wanted]
+
+    def rows(self, start, stop):
+        return self.data.iloc[start:stop]
+
+    def segment(self, sequence_id, segment_id):
+        return self.rows(*self.segment_ranges[(sequence_id, segment_id)])
+
+    def sequence(self, sequence_id):
+        return self.rows(*self.sequence_ranges[sequence_id])
+
+    def segment_window(self, sequence_id, first_segment_id, last_segment_id):
+        """Row range of the segments first_segment_id..last_segment_id (inclusive) of one sequence"""
+        start, stop = self.sequence_ranges[sequence_id]
+        seg_ids = self.seg_ids[start:stop]
+        return (start + int(np.searchsorted(seg_ids, first_segment_id, side='left')),
+                start + int(np.searchsorted(seg_ids, last_segment_id, side='right')))
+
+    def masked_rows(self, rows, masked, columns=('latitude', 'longitude')):
+        """Copy of the row range `rows` with `columns` blanked over the sub-range `masked`"""
+        start, stop = rows
+        data = self.rows(start, stop).copy()
+        col_positions = [data.columns.get_loc(col) for col in columns]
+        data.iloc[masked[0] - start:masked[1] - start, col_positions] = None
+        return data
+
+def materialize_task(task):
+    """Attach the DataFrame views of a task right before it is processed"""
+    segment_index = task.get('segment_index')
+    if segment_index is None or 'rows' not in task:
+        return task
+    if 'masked_rows' in task:
+        task['minimal_seg'] = segment_index.masked_rows(task['rows'], task['masked_rows'])
+        task['sequence_data'] = segment_index.sequence(task['actual_seq_id'])
+    else:
+        task['minimal_seg'] = segment_index.rows(*task['rows'])
+    return task
+
+def release_task(task):
+    """Drop the DataFrame views of a finished task; a retried task is materialized again"""
+    task.pop('minimal_seg', None)
+    task.pop('sequence_data', None)
+
 def build_segment_tasks(traj_df, sequences_to_process, mark_missing, start_idx, mode='SDKG'):
     tasks = []
-    all_segments = traj_df[traj_df['sequence_id'].isin(sequences_to_process)][['sequence_id', 'segment_id']].drop_duplicates()
+    segment_index = SegmentIndex(traj_df)
     seq_to_local = {sid: i for i, sid in enumerate(sequences_to_process)} 
     
-    for _, row in all_segments.iterrows():
-        actual_seq_id = row['sequence_id']
-        segment_id = row['segment_id']
+    for actual_seq_id, segment_id in segment_index.segments(sequences_to_process):
         seq_idx = seq_to_local[actual_seq_id]   
         
         if mode == 'SDKG':
@@ -152,29 +225,24 @@ def build_segment_tasks(traj_df, sequences_to_process, mark_missing, start_idx,
                     'segment_id': segment_id
                 })
             else:
-                segment_data = traj_df[
-                    (traj_df['sequence_id'] == actual_seq_id) & 
-                    (traj_df['segment_id'] == segment_id)
-                ]
                 tasks.append({
                     'type': 'process', 
                     'seq_idx': seq_idx,
                     'actual_seq_id': actual_seq_id,
                     'segment_id': segment_id,
-                    'minimal_seg': segment_data.copy()
+                    'segment_index': segment_index,
+                    'rows': segment_index.segment_ranges[(actual_seq_id, segment_id)]
                 })
                 
         elif mode == 'imputation':
             if mark_missing[seq_idx, segment_id] == 1:
-                sequence_data = traj_df[traj_df['sequence_id'] == actual_seq_id]
-                minimal_seg = sequence_data[sequence_data['segment_id'].isin([segment_id-1, segment_id, segment_id+1])]
-                minimal_seg.loc[minimal_seg['segment_id'] == segment_id, ['latitude', 'longitude']] = None
                 tasks.append({
                     'seq_idx': seq_idx,
                     'actual_seq_id': actual_seq_id,
                     'segment_id': segment_id,
-                    'minimal_seg': minimal_seg.copy(),
-                    'sequence_data': sequence_data.copy()
+                    'segment_index': segment_index,
+                    'rows': segment_index.segment_window(actual_seq_id, segment_id - 1, segment_id + 1),
+                    'masked_rows': segment_index.segment_ranges[(actual_seq_id, segment_id)]
                 })
             else:
                 tasks.append({
@@ -187,6 +255,7 @@ def build_segment_tasks(traj_df, sequences_to_process, mark_missing, start_idx,
     logging.info(f"Built {len(tasks)} segments for {mode} processing")
     return tasks
 
+@timed_stage("M7_Scheduler")
 def stack_schedule_sdk_construction(
     *,
     args,
@@ -225,7 +294,7 @@ def stack_schedule_sdk_construction(
                 #Parallel
                 batch_futures = []
                 for t in batch:
-                    f = executor.submit(process_single_segment_fn, SDKG, args, t)
+                    f = executor.submit(process_single_segment_fn, SDKG, args, materialize_task(t))
                     future_to_task[f] = t
                     batch_futures.append(f)
                     logging.info(f"[S_c submit] seq {t['seq_idx']} seg {t['segment_id']}")
@@ -238,6 +307,7 @@ def stack_schedule_sdk_construction(
                     result, should_retry = handle_task_exception_with_retry(
                         f, t, ku_manager.knowledge_unit_list, "SDKG", args.max_retries, SDKG
                     )
+                    release_task(t)
                     #success
                     if result is not None and result.get('result'):
                         #push to Sd
@@ -309,6 +379,7 @@ def stack_schedule_sdk_construction(
     logging.info("Stack-Based Scheduler finished")
     return SDKG, ku_manager
 
+@timed_stage("M7_Scheduler")
 def stack_schedule_imputation(
     *,
     args,
@@ -340,7 +411,7 @@ def stack_schedule_imputation(
             future_to_task: Dict[concurrent.futures.Future, Dict[str, Any]] = {}
             for task in batch:
  
-                fut = executor.submit(process_single_segment_fn, task, args, SDKG, context_info_manager)
+                fut = executor.submit(process_single_segment_fn, materialize_task(task), args, SDKG, context_info_manager)
                 future_to_task[fut] = task
                 batch_futures.append(fut)
                 if task.get('type') != 'skip':
@@ -354,6 +425,7 @@ def stack_schedule_imputation(
                 result, should_retry = handle_task_exception_with_retry(
                     fut, task, result_manager.results_list, "imputation", args.max_retries, SDKG
                 )
+                release_task(task)
                 #success
                 if result is not None:
                     if task.get('type') != 'skip':
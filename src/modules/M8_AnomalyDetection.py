@@ -1,5 +1,7 @@
 import logging
 import concurrent
+from src.utils.Metrics import timed_stage
+@timed_stage("M8_AnomalyDetection")
 def handle_task_exception_with_retry(future, task, result_list, task_type="task", max_retries=3, SDKG=None):
     if 'retry_count' not in task:
         task['retry_count'] = 0
@@ -1,18 +1,23 @@
-from src.utils.CallApi import call_qwen_api
+from src.utils.ModelCascade import cascade_call
 from src.modules.Prompt import Redundancy_Analysis_Prompt
+from src.utils.PromptAssembler import estimate_tokens, take_within_budget, rank_by_weight
+from src.utils.Metrics import timed_stage
 import logging
 
+@timed_stage("M9_Deredundancy")
 def deredundancy(args, SDKG, knowledge_unit_list, new_flags_list,vf_flags_list):
     
     if not knowledge_unit_list:
         return knowledge_unit_list
 
-    vb_data_text, all_vb_data, dict_mapping = prepare_vb_data(SDKG, knowledge_unit_list, new_flags_list)
+    # The selection budget is split evenly between the behavior and the function listings
+    section_budget = args.selection_prompt_budget / 2
+    vb_data_text, all_vb_data, dict_mapping = prepare_vb_data(SDKG, knowledge_unit_list, new_flags_list, section_budget)
     logging.info(f"vb_data_text:{vb_data_text}")
     logging.info(f"all_vb_data:{all_vb_data}")
     logging.info(f"dict_mapping:{dict_mapping}")
     
-    vf_data_text = prepare_vf_data(SDKG, knowledge_unit_list, vf_flags_list)
+    vf_data_text = prepare_vf_data(SDKG, knowledge_unit_list, vf_flags_list, section_budget)
     logging.info(f"vf_data_text:{vf_data_text}")
     
     if vb_data_text or vf_data_text:
@@ -20,7 +25,8 @@ def deredundancy(args, SDKG, knowledge_unit_list, new_flags_list,vf_flags_list):
 
     return knowledge_unit_list
 
-def prepare_vb_data(SDKG, knowledge_unit_list, new_flags_list):
+def prepare_vb_data(SDKG, knowledge_unit_list, new_flags_list, token_budget=0):
+    """token_budget (0 = unlimited) is shared by the dictionary listings, each keeping its best supported values"""
 
     attribute_dicts = SDKG.get_vb_attributes_dicts()
     dict_mapping = {
@@ -56,25 +62,45 @@ def prepare_vb_data(SDKG, knowledge_unit_list, new_flags_list):
         if vb_data['attributes_to_check']:
             all_vb_data.append(vb_data)
 
-            sequence_id = knowledge_unit.get('sequence_id', 'unknown')
-            segment_id = knowledge_unit.get('segment_id', 'unknown')
-            vb_data_text += f"\nVB {i} (Sequence {sequence_id}, Segment {segment_id}):\n"
+    num_listings = sum(len(vb_data['attributes_to_check']) for vb_data in all_vb_data)
+    listing_budget = token_budget / num_listings if token_budget and num_listings else 0
+    weights = SDKG.get_vocabulary_weights() if listing_budget else {}
+    truncated = 0
+
+    for vb_data in all_vb_data:
+        knowledge_unit = vb_data['knowledge_unit']
+        sequence_id = knowledge_unit.get('sequence_id', 'unknown')
+        segment_id = knowledge_unit.get('segment_id', 'unknown')
+        vb_data_text += f"\nVB {vb_data['index']} (Sequence {sequence_id}, Segment {segment_id}):\n"
+        
+        for attribute, data in vb_data['attributes_to_check'].items():
+            current_value = data['current_value']
+            dict_values = data['dict_values']
+            if listing_budget:
+                shown_values = take_within_budget(rank_by_weight(dict_values, weights.get(attribute, {})),
+                                                  listing_budget, lambda value: f"    - {value}\n")
+            else:
+                shown_values = dict_values
             
-            for attribute, data in vb_data['attributes_to_check'].items():
-                current_value = data['current_value']
-                dict_values = data['dict_values']
-                
-                vb_data_text += f"  Attribute: {attribute}\n"
-                vb_data_text += f"  Current value: {current_value}\n"
+            vb_data_text += f"  Attribute: {attribute}\n"
+            vb_data_text += f"  Current value: {current_value}\n"
+            if len(shown_values) < len(dict_values):
+                truncated += len(dict_values) - len(shown_values)
+                vb_data_text += f"  Dictionary values (top {len(shown_values)} of {len(dict_values)} by graph support):\n"
+            else:
                 vb_data_text += f"  Dictionary values ({len(dict_values)}):\n"
-                for value in dict_values:
-                    vb_data_text += f"    - {value}\n"
-                vb_data_text += "\n"
+            for value in shown_values:
+                vb_data_text += f"    - {value}\n"
+            vb_data_text += "\n"
+
+    if truncated:
+        logging.info(f"[SELECTION] redundancy prompt: {truncated} dictionary values left out by the token budget")
     
     return vb_data_text, all_vb_data, dict_mapping
 
-def prepare_vf_data(SDKG, knowledge_unit_list, vf_flags_list):
-    """Prepare VF data for redundancy analysis, only process when vf_flag is True"""
+def prepare_vf_data(SDKG, knowledge_unit_list, vf_flags_list, token_budget=0):
+    """Prepare VF data for redundancy analysis, only process when vf_flag is True.
+    New VFs are always listed; SDKG VFs fill the rest of token_budget (0 = unlimited) by graph weight"""
     all_vfs = {}
 
     for i, (knowledge_unit, is_new_vf) in enumerate(zip(knowledge_unit_list, vf_flags_list)):
@@ -89,13 +115,22 @@ def prepare_vf_data(SDKG, knowledge_unit_list, vf_flags_list):
                 }
 
     existing_vf_nodes = SDKG.load_vf_node()
-    for vf_id, vf_node in existing_vf_nodes.items():
-        if 'code' in vf_node:
-            all_vfs[vf_id] = {
-                'code': vf_node['code'],
-                'knowledge_unit': None,
-                'source': 'SDKG'
-            }
+    existing_vf_ids = [vf_id for vf_id, vf_node in existing_vf_nodes.items() if 'code' in vf_node]
+    if token_budget:
+        render = lambda vf_id, source='SDKG', code=None: \
+            f"\nFunction ID: {vf_id} (from {source}):\n```python\n{code or existing_vf_nodes[vf_id]['code']}\n```\n"
+        remaining = token_budget - sum(estimate_tokens(render(vf_id, 'current_batch', data['code'])) for vf_id, data in all_vfs.items())
+        ranked_vf_ids = rank_by_weight(existing_vf_ids, SDKG.get_vf_weights())
+        kept_vf_ids = take_within_budget(ranked_vf_ids, remaining, render) if remaining > 0 else []
+        if len(kept_vf_ids) < len(existing_vf_ids):
+            logging.info(f"[SELECTION] redundancy prompt: {len(existing_vf_ids) - len(kept_vf_ids)} of {len(existing_vf_ids)} SDKG functions left out by the token budget")
+        existing_vf_ids = kept_vf_ids
+    for vf_id in existing_vf_ids:
+        all_vfs[vf_id] = {
+            'code': existing_vf_nodes[vf_id]['code'],
+            'knowledge_unit': None,
+            'source': 'SDKG'
+        }
     
     if len(all_vfs) <= 1:
         return ""
@@ -116,7 +151,12 @@ def combined_redundancy_analysis(args, SDKG, vb_data_text, vf_data_text, all_vb_
     )
     
     try:
-        response = call_qwen_api(args, prompt, args.analysis_llm, 'selection')
+        response, _ = cascade_call(
+            args, prompt, args.analysis_llm, 'selection',
+            parse=lambda response: response,
+            is_valid=lambda response: "BEHAVIOR_REDUNDANCY:" in response or "FUNCTION_REDUNDANCY:" in response,
+            prompt_type='redundancy_analysis'
+        )
         logging.info(f"Redundancy analysis response: {response}")
 
         if vb_data_text:
@@ -1,11 +1,3 @@
-
-USAGE_STAT = {
-    "pattern":     {"prompt": 0, "completion": 0, "total": 0, "time_sec": 0.0, "calls": 0},
-    "function":    {"prompt": 0, "completion": 0, "total": 0, "time_sec": 0.0, "calls": 0},
-    "selection":   {"prompt": 0, "completion": 0, "total": 0, "time_sec": 0.0, "calls": 0},
-    "explanation": {"prompt": 0, "completion": 0, "total": 0, "time_sec": 0.0, "calls": 0},
-}
-
 Pattern_Prompt= """[Task] 
 You are an expert in maritime data analysis.
 Your task is to generate a list of specific, interpretable patterns that describe how both **latitude and longitude** (vessel position) can be inferred from a set of AIS features.
@@ -50,6 +42,53 @@ Make sure that your output strictly follows this format. Any patterns that do no
 """
 
 
+Pattern_Batch_Prompt= """[Task] 
+You are an expert in maritime data analysis.
+Your task is to generate, for each of the {num_segments} trajectory segments below, a specific, interpretable pattern that describes how both **latitude and longitude** (vessel position) can be inferred from a set of AIS features.
+
+These patterns will be used to **impute missing values of latitude and longitude** in AIS data. Each pattern must be:
+- **Concrete and usable**, describing a clear condition on the target features and the corresponding position range;
+- **Simultaneous**, including both latitude **and** longitude ranges, or describing a **trajectory pattern** (e.g., a curved path, straight line, or repeated loop);
+- **Explainable**, with a short justification after each pattern explaining why this condition relates to the given position;
+- **Mathematically expressive**, including a possible **trajectory equation or shape** that approximates the vessel's movement under this condition.
+Analyze every segment independently.
+
+[INPUT]
+You are given:
+    {num_segments} samples of trajectory data (latitude, longitude, and various AIS features), each introduced by its "=== Segment <i> ===" header:
+{segments_data}
+
+[OUTPUT]
+Please strictly follow the following format. For every segment, repeat its "=== Segment <i> ===" header and return only one pattern in triple quotes ''' ''':
+
+=== Segment <i> ===
+'''
+Pattern:
+- **speed_pattern**: speed profile without numerical values and punctuation (detailed description for speed profile).
+- **course_pattern**: change in course over ground without numerical values and punctuation (detailed description for change in course over ground).
+- **heading_pattern**: heading fluctuation without numerical values and punctuation (detailed description for heading fluctuation).
+- **intent**: inferred maneuver intention without numerical values and punctuation (detailed description for inferred maneuver intention).
+'''
+
+For speed_pattern, You can choose from {speed_dict}, and if you don't have a suitable one, you can create a new one. 
+For course_pattern, You can choose from {course_dict}, and if you don't have a suitable one, you can create a new one. 
+For heading_pattern, You can choose from {heading_dict}, and if you don't have a suitable one, you can create a new one. 
+For intent,You can choose from {intent_dict}, and if you don't have a suitable one, you can create a new one. 
+
+[EXAMPLE]
+=== Segment 1 ===
+'''
+Pattern:
+- **speed_pattern**: stable (the vessel is maintaining a consistent speed, not accelerating or decelerating)
+- **course_pattern**: stable (the vessel is maintaining a consistent course over ground)
+- **heading_pattern**: stable (the heading does not fluctuate significantly, indicating no sharp maneuvers)
+- **intent**: navigating (the vessel is maintaining its course)
+'''
+
+Make sure that your output strictly follows this format and contains exactly one block for each of the {num_segments} segments, in order.
+"""
+
+
 Function_Prompt= """[Task] 
 You are an expert in maritime trajectory analysis and spatial-temporal modeling, specialized in developing interpretable algorithms for vessel movement
 reconstruction. You are given vessel trajectory data and are asked to generate a spatial_function that estimates missing latitude and longitude
@@ -1,6 +1,7 @@
 import logging
 from typing import List, Dict, Any
 from src.utils.utils import get_root_path
+from src.utils.Metrics import start_metrics_reporter
 from src.modules.M7_Scheduler import build_segment_tasks,stack_schedule_sdk_construction, stack_schedule_imputation
 root_path = get_root_path()
 
@@ -46,6 +47,7 @@ def SDKG_Construction_Multithreading(
     SDKG,
 ) -> List[Dict[str, Any]]:
     logging.info("\n========= SDKG Construction =========")
+    start_metrics_reporter(args)
     traj_df, mark_missing = trajectory_data
     start_idx, end_idx = args.check_point, args.end_point
     sequences_to_process = traj_df['sequence_id'].unique()[start_idx:end_idx]
@@ -82,6 +84,7 @@ def Trajectory_Imputation_Multithreading(
     result_manager
 ) -> List[Dict[str, Any]]:
     logging.info("\n========= Trajectory Imputation =========")
+    start_metrics_reporter(args)
     traj_df, mark_missing = trajectory_data
     start_idx, end_idx = args.check_point, args.end_point
     sequences_to_process = traj_df['sequence_id'].unique()[start_idx:end_idx]
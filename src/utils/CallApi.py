@@ -1,66 +1,171 @@
 import openai
 import time
 import logging
-from ..modules.Prompt import USAGE_STAT
-total_prompt_tokens = 0
-total_completion_tokens = 0
+import asyncio
+import threading
+import weakref
+try:
+    import httpx
+except ImportError:  # recent openai releases ship their transport as httpx2
+    import httpx2 as httpx
+from .LLMCache import get_llm_cache, LLMCacheMiss
+from .RateLimiter import get_rate_limiter
+from .Metrics import METRICS
+from .Hedging import get_hedge_policy
+LLM_TEMPERATURE = 0.3
 
-def _accumulate_usage(purpose, usage, elapsed_sec):
-    global total_prompt_tokens, total_completion_tokens
+# One pooled client per endpoint configuration, shared by every thread of the process.
+# Async clients are bound to the event loop that created their connections.
+_llm_clients = {}
+_async_llm_clients = weakref.WeakKeyDictionary()
+_llm_clients_lock = threading.Lock()
+
+def _accumulate_usage(purpose, llm_model, usage, elapsed_sec):
+    METRICS.inc("llm_calls_total", purpose=purpose, model=llm_model)
+    METRICS.observe("llm_latency_seconds", elapsed_sec, purpose=purpose, model=llm_model)
     if not usage:
         return
     pr = getattr(usage, "prompt_tokens", 0) or 0
     cp = getattr(usage, "completion_tokens", 0) or 0
-    tt = getattr(usage, "total_tokens", 0) or (pr + cp)
-    total_prompt_tokens += pr
-    total_completion_tokens += cp
-    
-    g = USAGE_STAT[purpose]
-    g["prompt"]     += pr
-    g["completion"] += cp
-    g["total"]      += tt
-    g["time_sec"]   += float(elapsed_sec)
-    g["calls"]      += 1
-
-
-def call_qwen_api(args,prompt,llm_model,llm_purpose):
-    client = openai.OpenAI(
-        api_key=args.llm_api_key,
-        base_url='https://dashscope.aliyuncs.com/compatible-mode/v1'
-    )
-    t0 = time.time()
-    completion = client.chat.completions.create(
+    METRICS.inc("llm_prompt_tokens_total", pr, purpose=purpose, model=llm_model)
+    METRICS.inc("llm_completion_tokens_total", cp, purpose=purpose, model=llm_model)
+
+
+def record_encoding_savings(purpose, verbose_text, encoded_text):
+    """Credit the estimated tokens (4 characters each) saved by a compact trajectory encoding"""
+    METRICS.inc("llm_encoding_saved_tokens_total", int((len(verbose_text) - len(encoded_text)) / 4), purpose=purpose)
+
+
+def _client_key(args):
+    return (args.llm_base_url, args.llm_api_key, args.llm_pool_size, args.llm_timeout, args.llm_connect_timeout)
+
+def _client_options(args):
+    return {
+        "api_key": args.llm_api_key,
+        "base_url": args.llm_base_url,
+        "timeout": httpx.Timeout(args.llm_timeout, connect=args.llm_connect_timeout),
+        # Retries are owned by the rate limiter so that they back off and adapt concurrency
+        "max_retries": 0,
+    }
+
+def _pool_limits(args):
+    return httpx.Limits(max_connections=args.llm_pool_size, max_keepalive_connections=args.llm_pool_size)
+
+def get_llm_client(args):
+    """Return the process-wide OpenAI client for the configured endpoint, creating it on first use"""
+    key = _client_key(args)
+    with _llm_clients_lock:
+        client = _llm_clients.get(key)
+        if client is None:
+            client = openai.OpenAI(
+                http_client=openai.DefaultHttpxClient(limits=_pool_limits(args)),
+                **_client_options(args)
+            )
+            _llm_clients[key] = client
+    return client
+
+def get_async_llm_client(args):
+    """Return the AsyncOpenAI client of the running event loop for the configured endpoint"""
+    loop = asyncio.get_running_loop()
+    key = _client_key(args)
+    with _llm_clients_lock:
+        loop_clients = _async_llm_clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                http_client=openai.DefaultAsyncHttpxClient(limits=_pool_limits(args)),
+                **_client_options(args)
+            )
+            loop_clients[key] = client
+    return client
+
+def close_llm_clients():
+    """Close the pooled synchronous clients (async ones are released with their event loop)"""
+    with _llm_clients_lock:
+        clients = list(_llm_clients.values())
+        _llm_clients.clear()
+    for client in clients:
+        client.close()
+
+def _chat_request(prompt, llm_model, json_output=False):
+    request = dict(
         model=llm_model,
         messages=[
             {"role": "system", "content": "You are a maritime data analyst."},
             {"role": "user", "content": prompt}
         ],
-        temperature=0.3,
+        temperature=LLM_TEMPERATURE,
         extra_body={"enable_thinking": False}
     )
-    elapsed = time.time() - t0
+    if json_output:
+        request["response_format"] = {"type": "json_object"}
+    return request
 
-    # usage statistics
-    usage = getattr(completion, "usage", None)
-    _accumulate_usage(llm_purpose, usage, elapsed)
+def _lookup_cache(args, prompt, llm_model, llm_purpose):
+    """Returns: (cache, key, cached response) with cache None when caching is off"""
+    cache = get_llm_cache(args)
+    if cache is None:
+        return None, None, None
+    key = cache.make_key(llm_model, llm_purpose, LLM_TEMPERATURE, prompt)
+    # Replay reproduces a recorded run, including the answers its callers rejected
+    cached = cache.get(key, include_rejected=args.llm_cache_mode == "replay")
+    METRICS.inc("llm_cache_hits_total" if cached is not None else "llm_cache_misses_total", purpose=llm_purpose)
+    if cached is not None:
+        logging.debug(f"[{llm_purpose.upper()}] cache hit {key[:12]}")
+    elif args.llm_cache_mode == "replay":
+        raise LLMCacheMiss(f"No recorded {llm_purpose} response for {llm_model} prompt {key[:12]}")
+    return cache, key, cached
 
-    # The console displays staged statistics
+def reject_llm_response(args, prompt, llm_model, llm_purpose):
+    """
+    Mark the cached response to prompt as rejected (malformed, unparseable or failing validation)
+    so that a retry of the same prompt asks the model again instead of replaying it
+    """
+    cache = get_llm_cache(args)
+    if cache is not None and cache.reject(cache.make_key(llm_model, llm_purpose, LLM_TEMPERATURE, prompt)):
+        METRICS.inc("llm_cache_rejects_total", purpose=llm_purpose)
+
+def _record_completion(llm_purpose, llm_model, completion, elapsed):
+    # usage statistics; summaries are reported periodically by the metrics reporter
+    usage = getattr(completion, "usage", None)
+    _accumulate_usage(llm_purpose, llm_model, usage, elapsed)
     if usage:
-        logging.info(f"[{llm_purpose.upper()}] +{usage.total_tokens} tok "
+        logging.debug(f"[{llm_purpose.upper()}] +{usage.total_tokens} tok "
               f"(in {getattr(usage,'prompt_tokens',0)}/out {getattr(usage,'completion_tokens',0)}), "
               f"time {elapsed:.2f}s")
-    else:
-        logging.info(f"[{llm_purpose.upper()}] No usage field, time {elapsed:.2f}s")
-        
-    logging.info(f"Current Stats - Total: {total_prompt_tokens + total_completion_tokens} tokens "
-        f"(Input: {total_prompt_tokens}, Output: {total_completion_tokens})")
-
-    for purpose, stats in USAGE_STAT.items():
-        if stats["calls"] > 0:
-            avg_time = stats["time_sec"] / stats["calls"] if stats["calls"] > 0 else 0
-            logging.info(f"  {purpose:12}: {stats['calls']:2d} calls, "
-                f"{stats['total']:5d} tokens "
-                f"(in:{stats['prompt']:4d}/out:{stats['completion']:4d}), "
-                f"time:{stats['time_sec']:6.2f}s (avg:{avg_time:.2f}s)")
-
-    return completion.choices[0].message.content
\ No newline at end of file
+    return completion.choices[0].message.content
+
+def _discarded_usage(llm_purpose, llm_model):
+    """on_discard of the hedging policy: the tokens of a losing request are billed all the same"""
+    return lambda result: _accumulate_usage(llm_purpose, llm_model, getattr(result[0], "usage", None), result[1])
+
+
+def call_qwen_api(args,prompt,llm_model,llm_purpose,json_output=False):
+    cache, key, cached = _lookup_cache(args, prompt, llm_model, llm_purpose)
+    if cached is not None:
+        return cached
+    client = get_llm_client(args)
+    limiter = get_rate_limiter(args)
+    request_fn = lambda: limiter.call(lambda: client.chat.completions.create(**_chat_request(prompt, llm_model, json_output)), prompt)
+    hedging = get_hedge_policy(args)
+    completion, elapsed = hedging.call(llm_purpose, request_fn, _discarded_usage(llm_purpose, llm_model)) if hedging else request_fn()
+    response = _record_completion(llm_purpose, llm_model, completion, elapsed)
+    if cache is not None:
+        cache.put(key, response, model=llm_model, purpose=llm_purpose)
+    return response
+
+
+async def acall_llm(args,prompt,llm_model,llm_purpose,json_output=False):
+    """asyncio variant of call_qwen_api sharing the pooled client of the running event loop"""
+    cache, key, cached = _lookup_cache(args, prompt, llm_model, llm_purpose)
+    if cached is not None:
+        return cached
+    client = get_async_llm_client(args)
+    limiter = get_rate_limiter(args)
+    request_fn = lambda: limiter.acall(lambda: client.chat.completions.create(**_chat_request(prompt, llm_model, json_output)), prompt)
+    hedging = get_hedge_policy(args)
+    completion, elapsed = await (hedging.acall(llm_purpose, request_fn, _discarded_usage(llm_purpose, llm_model)) if hedging else request_fn())
+    response = _record_completion(llm_purpose, llm_model, completion, elapsed)
+    if cache is not None:
+        cache.put(key, response, model=llm_model, purpose=llm_purpose)
+    return response
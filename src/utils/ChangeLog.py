@@ -0,0 +1,63 @@
+import os
+import zlib
+import pickle
+import struct
+import logging
+
+# Record header: payload length and CRC-32 of the payload
+_HEADER = struct.Struct("<II")
+
+
+def append_record(path, offset, record):
+    """
+    Write one record at byte offset of an append-only log, dropping whatever followed it
+
+    Returns:
+        int: offset right after the record
+    """
+    payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(offset)
+        f.truncate()
+        f.write(_HEADER.pack(len(payload), zlib.crc32(payload)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def read_records(path):
+    """Yield (record, offset after it) in order; a torn or corrupt tail left by a crash ends the log"""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if not header:
+                return
+            if len(header) == _HEADER.size:
+                size, crc = _HEADER.unpack(header)
+                payload = f.read(size)
+                if len(payload) == size and zlib.crc32(payload) == crc:
+                    yield pickle.loads(payload), f.tell()
+                    continue
+            logging.warning(f"Ignoring incomplete record at the end of {os.path.basename(path)}")
+            return
+
+
+def truncate_log(path, offset):
+    if os.path.exists(path) and os.path.getsize(path) > offset:
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+
+
+def write_snapshot(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
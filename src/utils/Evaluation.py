@@ -4,18 +4,17 @@ import logging
 import json
 import os
 from src.utils.utils import get_root_path
+from src.utils.FunctionCache import get_function_cache
 
-def get_vf_function(sdkg, function_id):
-    """Get and compile function from SDKG by function ID"""
+def get_vf_function(args, sdkg, function_id):
+    """Get and compile function from SDKG by function ID, through the shared compiled function cache"""
     vf_node = sdkg.SDK_graph_vf_node.get(function_id)
     if not vf_node or not vf_node.get('code'):
         logging.warning(f"Function {function_id} not found or has no code")
         return None
     
     try:
-        local_ns = {}
-        exec(vf_node['code'], {'np': np}, local_ns)
-        return local_ns.get("spatial_function")
+        return get_function_cache(args).get(vf_node['code'], function_id)
     except Exception as e:
         logging.warning(f"Failed to compile function {function_id}: {e}")
         return None
@@ -108,7 +107,7 @@ def evaluate_imputed_result(args, result_manager, test_df, mark_missing_test, sd
         try:
             # Get function from SDKG
             function_id = result['method_selector']['selected_function_id']
-            function = get_vf_function(sdkg, function_id)
+            function = get_vf_function(args, sdkg, function_id)
             if not function:
                 continue
                 
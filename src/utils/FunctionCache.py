@@ -0,0 +1,81 @@
+import threading
+import collections
+import numpy as np
+from src.utils.Metrics import METRICS
+from src.modules.M0_SDKG import vf_node_id
+from src.utils.FunctionSandbox import SandboxedFunction, SandboxCodeError, get_function_sandbox
+
+_function_cache = None
+_function_cache_lock = threading.Lock()
+
+
+class CompiledFunctionCache:
+    """
+    Thread-safe LRU of compiled spatial functions keyed by vf_id
+
+    Compilation failures are cached as well, so broken code is executed once. Hits, misses and
+    failures are counted in METRICS (vf_cache_*). With a sandbox, code is compiled and run in its
+    worker processes and the cache holds SandboxedFunction stand-ins; only errors raised by the code
+    are cached, a sandbox that could not compile it (no worker, hang, crash) is retried next time.
+    """
+    def __init__(self, max_size=1024, sandbox=None):
+        self.max_size = max_size
+        self.sandbox = sandbox
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        METRICS.register_collector(lambda: [("vf_cache_size", len(self.entries), {})])
+
+    def _compile(self, code, key):
+        if self.sandbox is not None:
+            try:
+                defined = self.sandbox.run("compile", key, code)
+            except SandboxCodeError as e:
+                return None, f"Function compilation failed: {e}"
+            return (SandboxedFunction(self.sandbox, key, code) if defined else None), None
+        local_ns = {}
+        try:
+            exec(code, {'np': np}, local_ns)
+        except Exception as e:
+            return None, f"Function compilation failed: {e}"
+        return local_ns.get("spatial_function", None), None
+
+    def get(self, code, vf_id=None):
+        """
+        Compiled spatial_function of code (None when the code defines none)
+
+        Args:
+            vf_id: SDKG id of the code, computed from the code when not given
+
+        Raises:
+            RuntimeError: the code does not compile (raised again on every lookup), or the sandbox
+                failed to compile it (not cached)
+        """
+        key = vf_id or vf_node_id(code)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None:
+            METRICS.inc("vf_cache_misses_total")
+            entry = self._compile(code, key)
+            if entry[1] is not None:
+                METRICS.inc("vf_compile_failures_total")
+            with self.lock:
+                self.entries[key] = entry
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        else:
+            METRICS.inc("vf_cache_hits_total")
+        function, error = entry
+        if error is not None:
+            raise RuntimeError(error)
+        return function
+
+
+def get_function_cache(args):
+    """Return the process-wide compiled function cache (--vf_cache_size entries)"""
+    global _function_cache
+    with _function_cache_lock:
+        if _function_cache is None:
+            _function_cache = CompiledFunctionCache(max_size=args.vf_cache_size, sandbox=get_function_sandbox(args))
+    return _function_cache
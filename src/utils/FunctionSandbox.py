@@ -0,0 +1,200 @@
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import collections
+import multiprocessing
+import numpy as np
+from src.utils.Metrics import METRICS
+
+try:
+    import resource
+except ImportError:  # not available on Windows: no memory limit
+    resource = None
+
+_function_sandbox = None
+_function_sandbox_lock = threading.Lock()
+
+# compiled functions kept by each worker
+WORKER_CACHE_SIZE = 256
+# seconds a new worker may take to start (spawn re-imports the main module)
+WORKER_START_SECONDS = 120
+
+
+class CPUTimeExceeded(Exception):
+    pass
+
+
+class SandboxCodeError(RuntimeError):
+    """The code itself raised in its worker, as opposed to a worker that was unavailable, hung or died"""
+    pass
+
+
+def _cpu_time_exceeded(signum, frame):
+    raise CPUTimeExceeded("CPU time limit exceeded")
+
+
+def _limit_memory(memory_mb):
+    """Cap the address space of the worker at its current size plus memory_mb"""
+    if resource is None or not memory_mb:
+        return
+    try:
+        with open("/proc/self/statm") as f:
+            baseline = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        baseline = 0
+    limit = baseline + memory_mb * 2 ** 20
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _worker_main(conn, cpu_seconds, memory_mb):
+    """Serve (op, vf_id, code, call_args) requests; op "compile" answers whether code defines spatial_function"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cpu_timer = hasattr(signal, "setitimer")
+    if cpu_timer:
+        signal.signal(signal.SIGPROF, _cpu_time_exceeded)
+    _limit_memory(memory_mb)
+    conn.send(("ready", None))
+    compiled = collections.OrderedDict()
+    while True:
+        try:
+            op, vf_id, code, call_args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            if cpu_timer:
+                signal.setitimer(signal.ITIMER_PROF, cpu_seconds)
+            function = compiled.get(vf_id)
+            if function is None:
+                local_ns = {}
+                exec(code, {'np': np}, local_ns)
+                function = compiled[vf_id] = local_ns.get("spatial_function", None)
+                if len(compiled) > WORKER_CACHE_SIZE:
+                    compiled.popitem(last=False)
+            reply = ("ok", function is not None) if op == "compile" else ("ok", function(*call_args))
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+        finally:
+            if cpu_timer:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send(("error", f"Unusable result: {e}"))
+
+
+class _Worker:
+    def __init__(self, context, cpu_seconds, memory_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, cpu_seconds, memory_mb),
+                                       name="vf-sandbox", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self):
+        if not self.ready:
+            if not self.conn.poll(WORKER_START_SECONDS):
+                raise OSError(f"sandbox worker did not start within {WORKER_START_SECONDS}s")
+            self.conn.recv()
+            self.ready = True
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class FunctionSandbox:
+    """
+    Pool of worker processes compiling and running LLM-generated spatial functions
+
+    Each call gets cpu_seconds of CPU time in its worker and the worker memory_mb of memory; a worker
+    that does not answer within 2 * cpu_seconds + 1 s (e.g. stuck in C code or sleeping) or that dies
+    is killed and replaced. Latencies are recorded per vf_id in vf_exec_seconds.
+    """
+    def __init__(self, workers=4, cpu_seconds=10.0, memory_mb=1024):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.wall_seconds = 2 * cpu_seconds + 1
+        self.context = multiprocessing.get_context("spawn")
+        self.idle = queue.Queue()
+        for _ in range(workers):
+            self.idle.put(self._spawn())
+
+    def _spawn(self):
+        return _Worker(self.context, self.cpu_seconds, self.memory_mb)
+
+    def _replace(self, worker, reason):
+        worker.kill()
+        METRICS.inc("vf_sandbox_restarts_total", reason=reason)
+        logging.warning(f"Replacing VF sandbox worker {worker.process.pid} ({reason})")
+        return self._spawn()
+
+    def run(self, op, vf_id, code, call_args=()):
+        """
+        Args:
+            op: "compile" (Returns: whether code defines spatial_function) or "call" (Returns: spatial_function(*call_args))
+
+        Raises:
+            SandboxCodeError: the code raised (including its CPU time or memory limit)
+            RuntimeError: no worker was available, or the code hung or killed its worker
+        """
+        worker = self.idle.get()
+        try:
+            worker.wait_ready()
+        except (EOFError, OSError) as e:
+            self.idle.put(self._replace(worker, "start"))
+            raise RuntimeError(f"VF sandbox worker unavailable: {e}")
+        t0 = time.perf_counter()
+        try:
+            try:
+                worker.conn.send((op, vf_id, code, call_args))
+                answered = worker.conn.poll(self.wall_seconds)
+                status, value = worker.conn.recv() if answered else ("timeout", None)
+            except (EOFError, OSError):
+                worker.process.join(timeout=1)
+                exitcode = worker.process.exitcode
+                worker = self._replace(worker, "crash")
+                raise RuntimeError(f"{vf_id} killed its sandbox worker (exit code {exitcode})")
+            if status == "timeout":
+                worker = self._replace(worker, "timeout")
+                raise RuntimeError(f"{vf_id} did not return within {self.wall_seconds:.0f}s")
+        except RuntimeError:
+            METRICS.inc("vf_exec_errors_total", vf_id=vf_id, op=op)
+            raise
+        finally:
+            self.idle.put(worker)
+            METRICS.observe("vf_exec_seconds", time.perf_counter() - t0, vf_id=vf_id, op=op)
+        if status != "ok":
+            METRICS.inc("vf_exec_errors_total", vf_id=vf_id, op=op)
+            raise SandboxCodeError(value)
+        return value
+
+
+class SandboxedFunction:
+    """Stand-in for a compiled spatial_function that runs it in the sandbox"""
+    def __init__(self, sandbox, vf_id, code):
+        self.sandbox = sandbox
+        self.vf_id = vf_id
+        self.code = code
+
+    def __call__(self, *call_args):
+        return self.sandbox.run("call", self.vf_id, self.code, call_args)
+
+
+def get_function_sandbox(args):
+    """Return the process-wide sandbox, or None when --vf_sandbox_workers is 0 (functions run in-process)"""
+    global _function_sandbox
+    if not args.vf_sandbox_workers:
+        return None
+    with _function_sandbox_lock:
+        if _function_sandbox is None:
+            _function_sandbox = FunctionSandbox(
+                workers=args.vf_sandbox_workers,
+                cpu_seconds=args.vf_cpu_seconds,
+                memory_mb=args.vf_memory_mb,
+            )
+    return _function_sandbox
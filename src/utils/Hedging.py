@@ -0,0 +1,175 @@
+import time
+import asyncio
+import logging
+import threading
+import collections
+import concurrent.futures
+from src.utils.Metrics import METRICS
+
+_hedge_policies = {}
+_hedge_policies_lock = threading.Lock()
+
+
+class HedgePolicy:
+    """
+    Duplicates an LLM request that is slower than recent requests of the same purpose
+
+    Once min_samples latencies of a purpose are known, a request still running after their
+    `percentile` is sent a second time; the first response wins. At most max_rate of the calls
+    of a purpose are hedged, and only the service time of primary requests is recorded. The losing
+    async request is cancelled; a losing sync request cannot be interrupted, so its response is
+    passed to on_discard (e.g. to account its token usage) when it arrives.
+    """
+    def __init__(self, percentile=95, max_rate=0.05, min_samples=20, window=200, max_workers=32):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.latencies = {}
+        self.calls = collections.Counter()
+        self.hedges = collections.Counter()
+        self.lock = threading.Lock()
+        # Only hedges run on the pool, so a slot held by a losing request never delays a primary
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+
+    def hedge_delay(self, purpose):
+        """Seconds after which a call of this purpose gets hedged, None while too few latencies are known"""
+        with self.lock:
+            recent = sorted(self.latencies.get(purpose, ()))
+        if len(recent) < self.min_samples:
+            return None
+        return recent[min(len(recent) - 1, int(len(recent) * self.percentile / 100))]
+
+    def _start(self, purpose):
+        with self.lock:
+            self.calls[purpose] += 1
+
+    def _can_hedge(self, purpose):
+        with self.lock:
+            return self.hedges[purpose] + 1 <= self.max_rate * self.calls[purpose]
+
+    def _allow_hedge(self, purpose):
+        with self.lock:
+            if self.hedges[purpose] + 1 > self.max_rate * self.calls[purpose]:
+                return False
+            self.hedges[purpose] += 1
+        METRICS.inc("llm_hedges_total", purpose=purpose)
+        return True
+
+    def _record(self, purpose, elapsed):
+        with self.lock:
+            self.latencies.setdefault(purpose, collections.deque(maxlen=self.window)).append(elapsed)
+
+    def _discard(self, purpose, future, on_discard):
+        """Done-callback of a losing request: hand its response to on_discard"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        METRICS.inc("llm_hedge_discarded_total", purpose=purpose)
+        if on_discard is not None:
+            on_discard(future.result())
+
+    def call(self, purpose, request_fn, on_discard=None):
+        """
+        Run request_fn, hedging it once if it is slow
+
+        Calls that cannot be hedged run on the caller thread. Otherwise the caller waits for the
+        first response while the primary request runs on its own thread, since a blocking request
+        cannot be abandoned by the thread running it.
+
+        Returns:
+            request_fn() of the first request to succeed
+        """
+        self._start(purpose)
+        delay = self.hedge_delay(purpose)
+        if delay is None or not self._can_hedge(purpose):
+            t0 = time.time()
+            result = request_fn()
+            self._record(purpose, time.time() - t0)
+            return result
+
+        primary = concurrent.futures.Future()
+        primary.set_running_or_notify_cancel()
+
+        def run_primary():
+            t0 = time.time()
+            try:
+                result = request_fn()
+            except BaseException as e:
+                primary.set_exception(e)
+                return
+            # the primary's own service time, whether or not a hedge answered first
+            self._record(purpose, time.time() - t0)
+            primary.set_result(result)
+
+        threading.Thread(target=run_primary, name="llm-hedge-primary", daemon=True).start()
+        done, _ = concurrent.futures.wait({primary}, timeout=delay)
+        if done or not self._allow_hedge(purpose):
+            return primary.result()
+        logging.debug(f"[{purpose.upper()}] hedging request after {delay:.2f}s")
+        hedge = self.executor.submit(request_fn)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for other in pending | (done - {future}):
+                    # a hedge still queued for a pool slot is dropped, a running request is accounted when it ends
+                    if not other.cancel():
+                        other.add_done_callback(lambda f: self._discard(purpose, f, on_discard))
+                if future is hedge:
+                    METRICS.inc("llm_hedge_wins_total", purpose=purpose)
+                return future.result()
+        raise error
+
+    async def acall(self, purpose, request_fn, on_discard=None):
+        """asyncio variant of call; request_fn returns an awaitable and the losing request is cancelled"""
+        self._start(purpose)
+        delay = self.hedge_delay(purpose)
+        t0 = time.time()
+        primary = asyncio.ensure_future(request_fn())
+        if delay is not None:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        if delay is None or done or not self._allow_hedge(purpose):
+            result = await primary
+            self._record(purpose, time.time() - t0)
+            return result
+        logging.debug(f"[{purpose.upper()}] hedging request after {delay:.2f}s")
+        hedge = asyncio.ensure_future(request_fn())
+        pending, error = {primary, hedge}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    for other in done - {task}:
+                        self._discard(purpose, other, on_discard)
+                    # a primary cancelled by a winning hedge ran at least this long
+                    self._record(purpose, time.time() - t0)
+                    if task is hedge:
+                        METRICS.inc("llm_hedge_wins_total", purpose=purpose)
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def get_hedge_policy(args):
+    """Return the process-wide hedging policy, or None when --llm_hedge_percentile is 0"""
+    if not args.llm_hedge_percentile:
+        return None
+    with _hedge_policies_lock:
+        policy = _hedge_policies.get(args.llm_base_url)
+        if policy is None:
+            policy = HedgePolicy(
+                percentile=args.llm_hedge_percentile,
+                max_rate=args.llm_hedge_max_rate,
+                min_samples=args.llm_hedge_min_samples,
+                max_workers=2 * args.llm_pool_size,
+            )
+            _hedge_policies[args.llm_base_url] = policy
+    return policy
@@ -4,6 +4,10 @@ sys.path.append(root_path)
 from src.utils.utils import get_root_path
 root_path = get_root_path()
 sys.path.append(root_path)
+from src.data.utils.ais_data_storage import hyperparameter_configure_ais_storage
+from src.utils.LLMCache import LLM_CACHE_MODES
+from src.utils.TrajectoryEncoder import TRAJECTORY_ENCODINGS
+from src.utils.StructuredOutput import OUTPUT_FORMATS
 
 def configure_parser():
     """Configure command line arguments for the experiment"""
@@ -25,10 +29,14 @@ def configure_parser():
                           help='Starting point for processing')
     base_group.add_argument('--process_length', type=int, default=2,
                           help='How many pieces of data are saved once')
+    base_group.add_argument('--sdkg_snapshot_every', type=int, default=10,
+                          help='Checkpoints per full SDKG snapshot; the others only append their changes to the SDKG change log')
     base_group.add_argument('--end_point', type=int, default=1,
                           help='End point for processing')
     base_group.add_argument('--pre_load', type=bool, default=False,
                           help='IF you want preload the imputation results')
+    base_group.add_argument('--metrics_interval', type=float, default=60.0,
+                          help='Seconds between metrics dumps to results/<exp_name>/metrics (0 = off)')
     # Dataset configuration
     dataset_group = parser.add_argument_group('Dataset Configuration')
     dataset_group.add_argument('--raw_data_file', type=str, default=f'{root_path}/data/RawData/aisdk-2024-03-01@31_1.csv',
@@ -43,6 +51,8 @@ def configure_parser():
                              help='Ratio of missing data to simulate')
     dataset_group.add_argument('--training_test', type=float, default=0.8,
                              help='Training/test split ratio')
+    # Storage configuration
+    hyperparameter_configure_ais_storage(parser)
     # VISTA Configuration
     vista_group = parser.add_argument_group('VISTA Configuration')
     vista_group.add_argument('--retry_times', type=int, default=3,
@@ -51,20 +61,78 @@ def configure_parser():
                              help='Error threshold: e(f)=0.5*(MAE_lat + MAE_lon)')
     vista_group.add_argument('--top_k', type=int, default=5,    
                             help='Top K candidate functions to consider')
+    vista_group.add_argument('--vf_cache_size', type=int, default=1024,
+                            help='Compiled spatial functions kept in memory, shared by M3 and the evaluation')
+    vista_group.add_argument('--vf_sandbox_workers', type=int, default=0,
+                            help='Worker processes running generated spatial functions (0 = run them in-process)')
+    vista_group.add_argument('--vf_cpu_seconds', type=float, default=10.0,
+                            help='CPU seconds per spatial function call; a worker silent for twice as long is replaced')
+    vista_group.add_argument('--vf_memory_mb', type=int, default=1024,
+                            help='Memory (MB) a sandbox worker may allocate beyond its start-up size')
     vista_group.add_argument('--max_concurrent', type=int, default=9,    
                             help='max concurrent nums')
     vista_group.add_argument('--max_retries', type=int, default=3,    
                             help='max retry times')
+    vista_group.add_argument('--traj_encoding', type=str, default='verbose', choices=TRAJECTORY_ENCODINGS,
+                            help="Trajectory text in prompts: 'compact' sends base time/position plus offsets")
+    vista_group.add_argument('--traj_precision', type=int, default=5,
+                            help='Decimal places of latitude / longitude in the compact trajectory encoding')
+    vista_group.add_argument('--vb_batch_size', type=int, default=1,
+                            help='Max segments labelled per pattern mining call (1 = one call per segment)')
+    vista_group.add_argument('--vb_batch_token_budget', type=int, default=6000,
+                            help='Approximate trajectory tokens per batched pattern mining call')
+    vista_group.add_argument('--vb_batch_wait', type=float, default=0.5,
+                            help='Seconds a pattern mining batch waits to fill up')
+    vista_group.add_argument('--pattern_prompt_budget', type=int, default=0,
+                            help='Approximate tokens of vocabulary in pattern mining prompts (0 = unlimited)')
+    vista_group.add_argument('--selection_prompt_budget', type=int, default=0,
+                            help='Approximate tokens of vocabulary and function listings in redundancy prompts (0 = unlimited)')
     # LLM Configuration
     llm_group = parser.add_argument_group('LLM Configuration')
     llm_group.add_argument('--llm_api_key', type=str, default='',
                              help='LLM API Key')
     llm_group.add_argument('--mining_llm', type=str, default='qwen-plus',
-                             help='LLM model for pattern mining')
+                             help='LLM model for pattern mining; a comma-separated list (cheapest first) escalates on invalid answers')
     llm_group.add_argument('--coding_llm', type=str, default='qwen-plus',
-                             help='LLM model for code generation')
+                             help='LLM model for code generation; a comma-separated list (cheapest first) escalates on invalid answers')
     llm_group.add_argument('--analysis_llm', type=str, default='qwen-plus',
-                             help='LLM model for result analysis')
+                             help='LLM model for result analysis; a comma-separated list (cheapest first) escalates on invalid answers')
+    llm_group.add_argument('--llm_base_url', type=str, default='https://dashscope.aliyuncs.com/compatible-mode/v1',
+                             help='Base URL of the OpenAI-compatible endpoint')
+    llm_group.add_argument('--llm_pool_size', type=int, default=32,
+                             help='Max pooled HTTP connections shared by all LLM calls')
+    llm_group.add_argument('--llm_timeout', type=float, default=120.0,
+                             help='LLM request timeout in seconds')
+    llm_group.add_argument('--llm_connect_timeout', type=float, default=10.0,
+                             help='LLM connection timeout in seconds')
+    llm_group.add_argument('--llm_rpm', type=float, default=0,
+                             help='Requests per minute allowed by the provider (0 = unlimited)')
+    llm_group.add_argument('--llm_tpm', type=float, default=0,
+                             help='Tokens per minute allowed by the provider (0 = unlimited)')
+    llm_group.add_argument('--llm_max_concurrency', type=int, default=16,
+                             help='Upper bound of the adaptive number of in-flight LLM requests')
+    llm_group.add_argument('--llm_backoff_base', type=float, default=1.0,
+                             help='Base delay in seconds of the exponential retry backoff')
+    llm_group.add_argument('--llm_backoff_max', type=float, default=60.0,
+                             help='Max delay in seconds of the exponential retry backoff')
+    llm_group.add_argument('--llm_max_attempts', type=int, default=6,
+                             help='Attempts per LLM request on throttling or transient errors')
+    llm_group.add_argument('--llm_cache_mode', type=str, default='off', choices=LLM_CACHE_MODES,
+                             help="LLM response cache: 'record' reuses and stores responses, 'replay' fails on a miss")
+    llm_group.add_argument('--llm_cache_max_size_mb', type=float, default=1024,
+                             help='Evict least recently used cached responses above this size (0 = unlimited)')
+    llm_group.add_argument('--llm_cache_max_age_days', type=float, default=0,
+                             help='Ignore cached responses older than this (0 = never expire)')
+    llm_group.add_argument('--llm_hedge_percentile', type=float, default=0,
+                             help='Send a duplicate request when a call is slower than this latency percentile of its purpose (0 = no hedging)')
+    llm_group.add_argument('--llm_hedge_max_rate', type=float, default=0.05,
+                             help='Max fraction of calls of a purpose that may be hedged')
+    llm_group.add_argument('--llm_hedge_min_samples', type=int, default=20,
+                             help='Latencies of a purpose needed before its calls are hedged')
+    llm_group.add_argument('--llm_output_format', type=str, default='text', choices=OUTPUT_FORMATS,
+                             help="'json' asks for answers following a JSON schema per prompt type instead of the text layout")
+    llm_group.add_argument('--llm_repair_followups', type=int, default=1,
+                             help='Follow-up requests for missing fields of a JSON answer that local repair cannot fix')
     
     # Parse initial arguments to get config file path
     args, unknown = parser.parse_known_args()
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from src.utils.utils import get_root_path
+
+LLM_CACHE_MODES = ["off", "record", "replay"]
+
+_llm_caches = {}
+_llm_caches_lock = threading.Lock()
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when a prompt has no recorded response"""
+
+
+class LLMResponseCache:
+    """
+    Content-addressed on-disk store of LLM responses, one JSON file per request under results/<exp>/LLMCache
+
+    Entries are evicted oldest-access-first once the cache exceeds max_size_mb, and ignored
+    (and removed) once older than max_age_days; 0 disables either limit. Responses the caller
+    rejected (malformed, unparseable) are marked and count as misses unless include_rejected is set.
+    """
+    def __init__(self, cache_dir, max_size_mb=1024, max_age_days=0):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_sec = max_age_days * 86400
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.size_bytes = sum(os.path.getsize(path) for path in self._entry_paths())
+
+    @staticmethod
+    def make_key(llm_model, llm_purpose, temperature, prompt):
+        payload = json.dumps([llm_model, llm_purpose, temperature, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entry_paths(self):
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for name in file_names:
+                if name.endswith(".json"):
+                    yield os.path.join(dir_path, name)
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.size_bytes -= size
+        except OSError:
+            pass
+
+    def get(self, key, include_rejected=False):
+        """Return the cached response text, or None on a miss"""
+        path = self._path(key)
+        with self.lock:
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._remove(path)
+                return None
+            if self.max_age_sec and time.time() - entry.get("created", 0) > self.max_age_sec:
+                self._remove(path)
+                return None
+            if entry.get("rejected") and not include_rejected:
+                return None
+            # Access time drives the size-based eviction order
+            os.utime(path, None)
+        return entry["response"]
+
+    def put(self, key, response, **metadata):
+        path = self._path(key)
+        entry = dict(metadata, created=time.time(), response=response)
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                self._remove(path)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self.size_bytes += os.path.getsize(path)
+            if self.max_size_bytes and self.size_bytes > self.max_size_bytes:
+                self._evict()
+
+    def reject(self, key):
+        """Mark a cached response as rejected by its caller, so that record mode requests it again"""
+        path = self._path(key)
+        with self.lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return False
+            entry["rejected"] = True
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            size = os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.size_bytes += os.path.getsize(path) - size
+        return True
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its size limit"""
+        entries = sorted(self._entry_paths(), key=lambda p: os.path.getmtime(p))
+        target = 0.9 * self.max_size_bytes
+        removed = 0
+        for path in entries:
+            if self.size_bytes <= target:
+                break
+            self._remove(path)
+            removed += 1
+        logging.info(f"LLM cache evicted {removed} entries, {self.size_bytes / (1024 * 1024):.1f} MB left")
+
+
+def get_llm_cache(args):
+    """Return the response cache of the experiment, or None when --llm_cache_mode is 'off'"""
+    if args.llm_cache_mode == "off":
+        return None
+    cache_dir = os.path.join(get_root_path(), 'results', args.exp_name, 'LLMCache')
+    with _llm_caches_lock:
+        cache = _llm_caches.get(cache_dir)
+        if cache is None:
+            cache = LLMResponseCache(cache_dir, args.llm_cache_max_size_mb, args.llm_cache_max_age_days)
+            _llm_caches[cache_dir] = cache
+    return cache
@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import functools
+import threading
+from src.utils.utils import get_root_path
+
+# Latency bucket upper bounds in seconds: 1 ms to ~17 min, four buckets per doubling
+LATENCY_BUCKETS = tuple(0.001 * 2 ** (i / 4) for i in range(81))
+
+_reporters = {}
+_reporters_lock = threading.Lock()
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; quantiles are interpolated inside the bucket holding them"""
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters, gauges and latency histograms, safe to update from any thread
+
+    Every series is identified by a metric name and its labels, e.g.
+    inc("llm_calls_total", purpose="pattern", model="qwen-plus").
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def register_collector(self, collector):
+        """collector() is called before every snapshot and returns [(gauge name, value, labels dict), ...]"""
+        with self.lock:
+            self.collectors.append(collector)
+
+    def get(self, name, **labels):
+        """Current value of a counter (0 when never incremented)"""
+        with self.lock:
+            return self.counters.get(self._key(name, labels), 0)
+
+    def _collect(self):
+        with self.lock:
+            collectors = list(self.collectors)
+        for collector in collectors:
+            try:
+                for name, value, labels in collector():
+                    self.set_gauge(name, value, **labels)
+            except Exception as e:
+                logging.warning(f"Metrics collector failed: {e}")
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {"counters"|"gauges": [{name, labels, value}], "histograms": [{name, labels, count, sum, p50, p95, p99, max}]}
+        """
+        self._collect()
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                           for (name, labels), value in sorted(self.gauges.items())],
+                "histograms": [{"name": name, "labels": dict(labels), "count": h.count, "sum": round(h.sum, 6),
+                                "p50": round(h.quantile(0.5), 6), "p95": round(h.quantile(0.95), 6),
+                                "p99": round(h.quantile(0.99), 6), "max": round(h.max, 6)}
+                               for (name, labels), h in sorted(self.histograms.items())],
+            }
+
+    def to_prometheus(self):
+        """Prometheus text exposition format of every series"""
+        self._collect()
+        lines = []
+        def series(name, labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in labels] + [f'{k}="{v}"' for k, v in extra]
+            return f"{name}{{{','.join(pairs)}}}" if pairs else name
+        with self.lock:
+            typed = set()
+            for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+                for (name, labels), value in sorted(values.items()):
+                    if name not in typed:
+                        typed.add(name)
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{series(name, labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(h.bounds, h.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{series(name + '_bucket', labels, [('le', f'{bound:.6g}')])} {cumulative}")
+                lines.append(f"{series(name + '_bucket', labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{series(name + '_sum', labels)} {h.sum:.6f}")
+                lines.append(f"{series(name + '_count', labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def timed_stage(stage):
+    """Decorator recording the wall time of every call under stage_seconds{stage=...}"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.observe("stage_seconds", time.perf_counter() - t0, stage=stage)
+        return wrapper
+    return decorator
+
+
+class MetricsReporter:
+    """Background thread writing metrics.json / metrics.prom every interval seconds and logging a short summary"""
+    def __init__(self, metrics_dir, interval, registry=METRICS):
+        self.metrics_dir = metrics_dir
+        self.interval = interval
+        self.registry = registry
+        self.stopped = threading.Event()
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def _write(self, file_name, text):
+        path = os.path.join(self.metrics_dir, file_name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def dump(self, log_summary=True):
+        try:
+            snapshot = self.registry.snapshot()
+            self._write("metrics.json", json.dumps(snapshot, indent=2))
+            self._write("metrics.prom", self.registry.to_prometheus())
+        except Exception as e:
+            logging.warning(f"Metrics dump failed: {e}")
+            return
+        if log_summary:
+            for line in summary_lines(snapshot):
+                logging.info(line)
+
+    def stop(self):
+        if not self.stopped.is_set():
+            self.stopped.set()
+            self.dump()
+
+
+def summary_lines(snapshot):
+    """One line per LLM purpose and per pipeline stage"""
+    counters = {}
+    for c in snapshot["counters"]:
+        series = (c["labels"].get("purpose"), c["labels"].get("model"))
+        counters.setdefault(series, {})[c["name"]] = c["value"]
+    lines = []
+    parse_outcomes = {}
+    for c in snapshot["counters"]:
+        if c["name"] == "llm_output_parse_total":
+            parse_outcomes.setdefault(c["labels"]["prompt_type"], {})[c["labels"]["outcome"]] = c["value"]
+    for prompt_type, outcomes in sorted(parse_outcomes.items()):
+        lines.append(f"[METRICS] output {prompt_type:20}: " + ", ".join(f"{k} {v}" for k, v in sorted(outcomes.items()))
+                     + f", parse failure rate {outcomes.get('failed', 0) / sum(outcomes.values()):.1%}")
+    vf_cache = {c["name"]: c["value"] for c in snapshot["counters"] if not c["labels"] and c["name"].startswith("vf_")}
+    if vf_cache:
+        lookups = vf_cache.get("vf_cache_hits_total", 0) + vf_cache.get("vf_cache_misses_total", 0)
+        lines.append(f"[METRICS] vf cache: {lookups} lookups, hit rate {vf_cache.get('vf_cache_hits_total', 0) / max(lookups, 1):.1%}, "
+                     f"compile failures {vf_cache.get('vf_compile_failures_total', 0)}")
+    vf_runs = [h for h in snapshot["histograms"] if h["name"] == "vf_exec_seconds"]
+    if vf_runs:
+        slowest = max(vf_runs, key=lambda h: h["p95"])
+        restarts = sum(c["value"] for c in snapshot["counters"] if c["name"] == "vf_sandbox_restarts_total")
+        errors = sum(c["value"] for c in snapshot["counters"] if c["name"] == "vf_exec_errors_total")
+        lines.append(f"[METRICS] vf sandbox: {sum(h['count'] for h in vf_runs)} runs, {errors} errors, {restarts} worker restarts, "
+                     f"slowest p95 {slowest['p95']:.3f}s ({slowest['labels'].get('vf_id')} {slowest['labels'].get('op')})")
+    for h in snapshot["histograms"]:
+        if h["name"] == "llm_latency_seconds":
+            purpose = h["labels"].get("purpose")
+            c = dict(counters.get((purpose, None), {}), **counters.get((purpose, h["labels"].get("model")), {}))
+            lines.append(f"[METRICS] {purpose:12} {h['labels'].get('model')}: {h['count']} calls, "
+                         f"tokens in:{c.get('llm_prompt_tokens_total', 0)}/out:{c.get('llm_completion_tokens_total', 0)}, "
+                         f"latency p50/p95/p99 {h['p50']:.2f}/{h['p95']:.2f}/{h['p99']:.2f}s, "
+                         f"cache hit/miss/rejected:{c.get('llm_cache_hits_total', 0)}/{c.get('llm_cache_misses_total', 0)}"
+                         f"/{c.get('llm_cache_rejects_total', 0)}, "
+                         f"encoding saved ~{c.get('llm_encoding_saved_tokens_total', 0)} tok"
+                         + (f", escalated {c.get('llm_cascade_escalations_total', 0)}/{c['llm_cascade_attempts_total']}"
+                            if c.get('llm_cascade_attempts_total') else ""))
+        elif h["name"] == "stage_seconds":
+            lines.append(f"[METRICS] stage {h['labels'].get('stage'):26}: {h['count']} runs, "
+                         f"p50/p95/p99 {h['p50']:.2f}/{h['p95']:.2f}/{h['p99']:.2f}s, total {h['sum']:.1f}s")
+    return lines
+
+
+def start_metrics_reporter(args):
+    """Start (once per experiment) the periodic dump to results/<exp>/metrics; --metrics_interval 0 disables it"""
+    if not args.metrics_interval:
+        return None
+    metrics_dir = os.path.join(get_root_path(), 'results', args.exp_name, 'metrics')
+    with _reporters_lock:
+        reporter = _reporters.get(metrics_dir)
+        if reporter is None:
+            reporter = MetricsReporter(metrics_dir, args.metrics_interval)
+            atexit.register(reporter.stop)
+            _reporters[metrics_dir] = reporter
+    return reporter
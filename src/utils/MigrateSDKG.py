@@ -0,0 +1,135 @@
+import os
+import re
+import sys
+import glob
+import json
+import logging
+import argparse
+from src.utils.utils import get_root_path
+from src.modules.M0_SDKG import vb_node_id, vf_node_id
+
+# Legacy JSON checkpoint files (<name>_<n>.json) holding node ids, still read by SDKG.load_SDKG. Current
+# checkpoints are the SDKG_snapshot_<n>.pkl / SDKG_log_<n>.bin files that SDKG.save_SDKG writes through
+# src.utils.ChangeLog; they carry whatever ids the graph held, so migrate JSON checkpoints before resuming from them
+GRAPH_FILES = ["SDK_graph_vs", "SDK_graph_vb", "SDK_graph_vb_node", "SDK_graph_vf", "SDK_graph_vf_node"]
+
+
+def content_id_map(vb_nodes, vf_nodes):
+    """
+    Map the ids of saved nodes to their content-addressed ids
+
+    Returns:
+        dict: {old id: new id}, including nodes whose id is already content-addressed
+    """
+    id_map = {vb_id: vb_node_id(node) for vb_id, node in vb_nodes.items()}
+    id_map.update({vf_id: vf_node_id(node.get("code", "")) for vf_id, node in vf_nodes.items()})
+    return id_map
+
+
+def _merge(kept, other):
+    if isinstance(kept, dict) and isinstance(other, dict):
+        merged = dict(kept)
+        for key, value in other.items():
+            merged[key] = _merge(merged[key], value) if key in merged else value
+        return merged
+    if isinstance(kept, (int, float)) and isinstance(other, (int, float)):
+        return kept + other
+    return kept
+
+
+def remap_ids(obj, id_map):
+    """
+    Replace old ids in keys and string values; entries whose ids now coincide are merged
+    (edge weights summed, the first node kept)
+    """
+    if isinstance(obj, list):
+        return [remap_ids(item, id_map) for item in obj]
+    if isinstance(obj, str):
+        return id_map.get(obj, obj)
+    if not isinstance(obj, dict):
+        return obj
+    remapped = {}
+    for key, value in obj.items():
+        new_key, new_value = id_map.get(key, key), remap_ids(value, id_map)
+        remapped[new_key] = _merge(remapped[new_key], new_value) if new_key in remapped else new_value
+    return remapped
+
+
+def _load(path, key):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)[key]
+
+
+def _dump(path, key, value):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({key: value}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def migrate_checkpoint(sdkg_dir, checkpoint, backup=True):
+    """
+    Rewrite one SDKG checkpoint with content-addressed node ids
+
+    Returns:
+        dict: {old id: new id} of the ids that changed
+    """
+    paths = {name: os.path.join(sdkg_dir, f"{name}_{checkpoint}.json") for name in GRAPH_FILES}
+    graph = {name: _load(path, name) if os.path.exists(path) else None for name, path in paths.items()}
+    id_map = content_id_map(graph["SDK_graph_vb_node"] or {}, graph["SDK_graph_vf_node"] or {})
+    changed = {old: new for old, new in id_map.items() if old != new}
+    if not changed:
+        logging.info(f"SDKG checkpoint {checkpoint}: ids already content-addressed")
+        return changed
+    for name, value in graph.items():
+        if value is None:
+            continue
+        if backup:
+            os.replace(paths[name], f"{paths[name]}.bak")
+        _dump(paths[name], name, remap_ids(value, changed))
+    with open(os.path.join(sdkg_dir, f"id_map_{checkpoint}.json"), "w", encoding="utf-8") as f:
+        json.dump(changed, f, indent=2)
+    merged = len(id_map) - len(set(id_map.values()))
+    logging.info(f"SDKG checkpoint {checkpoint}: {len(changed)} ids rewritten, {merged} nodes merged")
+    return changed
+
+
+def migrate_results(results_dir, id_map, backup=True):
+    """Rewrite the vb/vf ids referenced by saved imputation results (e.g. selected_function_id)"""
+    for path in sorted(glob.glob(os.path.join(results_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f)
+        remapped = remap_ids(results, id_map)
+        if remapped == results:
+            continue
+        if backup:
+            os.replace(path, f"{path}.bak")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(remapped, f, indent=2, ensure_ascii=False)
+        logging.info(f"Rewrote ids in {os.path.basename(path)}")
+
+
+def migrate_experiment(exp_name, checkpoints=None, backup=True):
+    """Migrate the SDKG checkpoints (default: all) and the imputation results of results/<exp_name>"""
+    exp_dir = os.path.join(get_root_path(), "results", exp_name)
+    sdkg_dir = os.path.join(exp_dir, "SDKG")
+    if not checkpoints:
+        checkpoints = sorted({re.match(r"SDK_graph_vb_node_(.+)\.json$", os.path.basename(path)).group(1)
+                              for path in glob.glob(os.path.join(sdkg_dir, "SDK_graph_vb_node_*.json"))})
+    id_map = {}
+    for checkpoint in checkpoints:
+        id_map.update(migrate_checkpoint(sdkg_dir, checkpoint, backup))
+    if id_map:
+        migrate_results(os.path.join(exp_dir, "ImputationResults"), id_map, backup)
+    return id_map
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rewrite saved SDKG checkpoints with content-addressed vb/vf ids")
+    parser.add_argument("--exp_name", type=str, required=True, help="Experiment under results/")
+    parser.add_argument("--checkpoints", type=str, nargs="*", default=None, help="Checkpoint numbers (default: all)")
+    parser.add_argument("--no_backup", action="store_true", help="Do not keep the original files as *.json.bak")
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    migrate_experiment(cli_args.exp_name, cli_args.checkpoints, backup=not cli_args.no_backup)
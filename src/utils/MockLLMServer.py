@@ -0,0 +1,297 @@
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+import collections
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.utils.StructuredOutput import render_text
+
+SPEED_PROFILES = ["stable", "accelerating", "decelerating", "slow steaming", "stationary"]
+COURSE_CHANGES = ["stable", "gradual turn", "sharp turn", "zigzag"]
+HEADING_FLUCTUATIONS = ["stable", "minor fluctuation", "strong fluctuation"]
+INTENTS = ["navigating", "approaching port", "departing port", "maneuvering", "anchoring"]
+
+# Interchangeable linear interpolations written differently, so that redundancy analysis has work to do
+SPATIAL_FUNCTIONS = [
+    "def spatial_function(start, end, Time_interval): return [(start[0] + (end[0] - start[0]) * t / (Time_interval[-1] or 1), start[1] + (end[1] - start[1]) * t / (Time_interval[-1] or 1)) for t in Time_interval]",
+    "def spatial_function(start, end, Time_interval): return [(start[0] * (1 - t / (Time_interval[-1] or 1)) + end[0] * t / (Time_interval[-1] or 1), start[1] * (1 - t / (Time_interval[-1] or 1)) + end[1] * t / (Time_interval[-1] or 1)) for t in Time_interval]",
+    "def spatial_function(start, end, Time_interval): return [tuple(a + (b - a) * t / (Time_interval[-1] or 1) for a, b in zip(start, end)) for t in Time_interval]",
+]
+
+
+def _rng(prompt):
+    """Per-prompt generator, so that the same prompt always gets the same answer"""
+    return random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+
+def _pattern_fields(rng):
+    return {
+        "speed_pattern": f"{rng.choice(SPEED_PROFILES)} (scripted speed profile)",
+        "course_pattern": f"{rng.choice(COURSE_CHANGES)} (scripted course change)",
+        "heading_pattern": f"{rng.choice(HEADING_FLUCTUATIONS)} (scripted heading fluctuation)",
+        "intent": f"{rng.choice(INTENTS)} (scripted maneuver intention)",
+    }
+
+
+def respond_pattern(prompt, rng):
+    return _pattern_fields(rng)
+
+
+def respond_pattern_batch(prompt, rng):
+    match = re.search(r"for each of the (\d+) trajectory segments", prompt)
+    num_segments = int(match.group(1)) if match else 1
+    return {"segments": [dict(segment=i, **_pattern_fields(rng)) for i in range(1, num_segments + 1)]}
+
+
+def respond_function(prompt, rng):
+    return (f"Function:''' {rng.choice(SPATIAL_FUNCTIONS)} '''\n"
+            "Description:Linear interpolation between start and end in proportion to the elapsed time of each point.")
+
+
+def _first_id(prompt, prefix, after):
+    """First vb_/vf_ node ID listed after the `after` marker of the prompt"""
+    section = prompt.split(after, 1)[-1]
+    match = re.search(rf"\b{prefix}_[-\w]+", section)
+    return match.group(0) if match else "None"
+
+
+def respond_behavior_estimator(prompt, rng):
+    movement_id = _first_id(prompt, "vb", "Candidate movements")
+    return {
+        "selected_movement_id": movement_id,
+        "graph_support": f"vessel -> {movement_id} carries the largest weight among the candidates",
+        "contextual_justification": "consistent with the boundary movement patterns on both sides of the gap",
+    }
+
+
+def respond_method_selector(prompt, rng):
+    return {
+        "selected_function_id": _first_id(prompt, "vf", "**Functions with detailed information**"),
+        "statistical_support": "1. The function handled most of the similar segments (1/1 = 100%). 2. Its linear model matches the movement.",
+        "reasoning": "the movement keeps a steady course, which linear interpolation reproduces",
+        "imputation_action": "interpolate latitude and longitude between the boundary points over the time offsets",
+    }
+
+
+def respond_explanation_composer(prompt, rng):
+    return {
+        "regulatory_rule_cue": "Undetermined",
+        "operational_protocol_rationale": "the vessel keeps a steady speed and course typical of transit in open water",
+    }
+
+
+def respond_redundancy_analysis(prompt, rng):
+    """Merge new vocabulary values that only differ in case from a listed value, and functions with identical code"""
+    behavior_redundancy = {}
+    for attribute, current, values in re.findall(
+            r"Attribute: (\w+)\n\s*Current value: (.*?)\n\s*Dictionary values[^\n]*\n((?:\s*- .*\n)*)", prompt):
+        listed = [value.strip()[2:].strip() for value in values.strip().split("\n") if value.strip()]
+        current_clean = re.split(r"[(:]", current, 1)[0].strip()
+        duplicate = next((value for value in listed if value.lower() == current_clean.lower() and value != current_clean), None)
+        if duplicate:
+            behavior_redundancy.setdefault(attribute, []).append({"primary": duplicate, "redundant": [current_clean]})
+    by_code = collections.OrderedDict()
+    for function_id, code in re.findall(r"Function ID: (\S+) \(from \w+\):\n```python\n(.*?)\n```", prompt, re.S):
+        by_code.setdefault(re.sub(r"\s+", "", code), []).append(function_id)
+    return {
+        "behavior_redundancy": behavior_redundancy,
+        "keep_unique_terms": [],
+        "function_redundancy": [{"primary": ids[0], "redundant": ids[1:]} for ids in by_code.values() if len(ids) > 1],
+        "keep_unique_functions": [ids[0] for ids in by_code.values()],
+    }
+
+
+def respond_followup(prompt, rng):
+    """Fill the fields a structured-output follow-up asks for, reusing IDs of the previous answer"""
+    schema = json.loads(prompt[prompt.rindex("JSON schema:") + len("JSON schema:"):].strip())
+    answer = prompt.split("Your previous answer was:", 1)[-1]
+    fields = {}
+    for field in schema.get("required", []):
+        field_type = schema["properties"][field].get("type")
+        if field_type == "array":
+            fields[field] = []
+        elif field_type == "object":
+            fields[field] = {}
+        elif field.endswith("_id"):
+            match = re.search(r"\b(vb|vf)_[-\w]+", answer)
+            fields[field] = match.group(0) if match else "None"
+        else:
+            fields[field] = "scripted"
+    return fields
+
+
+# (marker of the prompt template, prompt type, responder); the first match wins. Prompts embed
+# earlier answers (pattern blocks, function code), so templates are tried from the most specific.
+# Responders return the fields of OUTPUT_SCHEMAS[prompt type], or text for prompts without a schema
+RESPONDERS = [
+    ("Your previous answer was:", "followup", respond_followup),
+    ("BEHAVIOR_REDUNDANCY", "redundancy_analysis", respond_redundancy_analysis),
+    ("Regulatory Rule Cue", "explanation_composer", respond_explanation_composer),
+    ("Selected Function ID", "method_selector", respond_method_selector),
+    ("Selected Movement ID", "behavior_estimator", respond_behavior_estimator),
+    ("Analyze every segment independently", "pattern_batch", respond_pattern_batch),
+    ("generate a spatial_function that estimates missing", "function", respond_function),
+    ("**speed_pattern**", "pattern", respond_pattern),
+]
+
+
+def scripted_response(prompt, sloppy_json=False):
+    """
+    Returns: (prompt type, response text) for a prompt built from Prompt.py, as JSON when the prompt
+    asks for structured output (fenced and with a trailing comma when sloppy_json)
+    """
+    for marker, prompt_type, responder in RESPONDERS:
+        if marker in prompt:
+            fields = responder(prompt, _rng(prompt))
+            if isinstance(fields, str):
+                return prompt_type, fields
+            if "[JSON OUTPUT]" not in prompt and prompt_type != "followup":
+                return prompt_type, render_text(prompt_type, fields)
+            text = json.dumps(fields, ensure_ascii=False)
+            if sloppy_json:
+                text = "```json\n" + text[:-1] + ",}\n```"
+            return prompt_type, text
+    return "unknown", "I cannot answer this request."
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """
+    OpenAI-compatible /chat/completions endpoint answering VISTA prompts with scripted responses
+
+    Latency is lognormal around `latency` seconds (spread `latency_sigma`), plus `tail_latency`
+    seconds with probability `tail_rate`. Requests fail with HTTP 429 (`throttle_rate`), HTTP 500
+    (`error_rate`), or get an unparsable answer (`malformed_rate`). JSON answers come fenced and with
+    a trailing comma at `sloppy_json_rate`.
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, latency=0.0, latency_sigma=0.0, tail_rate=0.0, tail_latency=0.0,
+                 error_rate=0.0, throttle_rate=0.0, malformed_rate=0.0, sloppy_json_rate=0.0, seed=None):
+        super().__init__(address, MockLLMHandler)
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.malformed_rate = malformed_rate
+        self.sloppy_json_rate = sloppy_json_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def draw(self):
+        """Returns: (delay in seconds, outcome) with outcome one of ok / throttle / error / malformed / sloppy"""
+        with self.lock:
+            delay = self.latency * self.random.lognormvariate(0, self.latency_sigma) if self.latency else 0.0
+            if self.random.random() < self.tail_rate:
+                delay += self.tail_latency
+            roll = self.random.random()
+        for outcome, rate in (("throttle", self.throttle_rate), ("error", self.error_rate),
+                              ("malformed", self.malformed_rate), ("sloppy", self.sloppy_json_rate)):
+            if roll < rate:
+                return delay, outcome
+            roll -= rate
+        return delay, "ok"
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except OSError:
+            # The client gave up (e.g. a cancelled hedge)
+            pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        delay, outcome = self.server.draw()
+        prompt_type, content = scripted_response(prompt, sloppy_json=outcome == "sloppy")
+        self.server.count(f"{prompt_type}:{outcome}")
+        time.sleep(delay)
+        if outcome == "throttle":
+            self._send_json(429, {"error": {"message": "Mock rate limit", "type": "rate_limit"}}, [("Retry-After", "1")])
+            return
+        if outcome == "error":
+            self._send_json(500, {"error": {"message": "Mock server error", "type": "server_error"}})
+            return
+        if outcome == "malformed":
+            content = "Sorry, I could not follow the requested format."
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        self._send_json(200, {
+            "id": f"mock-{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+def start_mock_server(host="127.0.0.1", port=0, **behavior):
+    """Serve in a background thread; Returns: the server, with base URL http://<host>:<server.server_port>/v1"""
+    server = MockLLMServer((host, port), **behavior)
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible stand-in for the VISTA LLM calls")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Median response latency in seconds")
+    parser.add_argument("--latency_sigma", type=float, default=0.0, help="Lognormal spread of the latency")
+    parser.add_argument("--tail_rate", type=float, default=0.0, help="Share of responses delayed by --tail_latency")
+    parser.add_argument("--tail_latency", type=float, default=0.0, help="Extra seconds of a tail response")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Share of HTTP 500 responses")
+    parser.add_argument("--throttle_rate", type=float, default=0.0, help="Share of HTTP 429 responses")
+    parser.add_argument("--malformed_rate", type=float, default=0.0, help="Share of answers ignoring the format")
+    parser.add_argument("--sloppy_json_rate", type=float, default=0.0, help="Share of JSON answers needing local repair")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the latency / error draws")
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    behavior = {k: v for k, v in vars(cli_args).items() if k not in ("host", "port")}
+    server = MockLLMServer((cli_args.host, cli_args.port), **behavior)
+    logging.info(f"Mock LLM server on http://{cli_args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info(f"Served: {dict(server.stats)}")
+        server.server_close()
@@ -0,0 +1,65 @@
+import logging
+from src.utils.CallApi import call_qwen_api, reject_llm_response
+from src.utils.Metrics import METRICS
+from src.utils.StructuredOutput import json_output_enabled, with_output_schema, structured_text
+
+
+def cascade_models(setting):
+    """
+    Ordered models of a role setting (--mining_llm / --coding_llm / --analysis_llm)
+
+    Args:
+        setting: one model name, comma-separated names (cheapest first), or a list from config.yaml
+
+    Returns:
+        list: model names
+    """
+    names = setting if isinstance(setting, (list, tuple)) else str(setting).split(",")
+    models = [name.strip() for name in names if name and name.strip()]
+    if not models:
+        raise ValueError(f"No LLM model configured in '{setting}'")
+    return models
+
+
+def record_cascade_attempt(llm_purpose, llm_model, accepted, escalated):
+    """Count an answer of one cascade level; rejected answers that move to the next model count as escalations"""
+    METRICS.inc("llm_cascade_attempts_total", purpose=llm_purpose, model=llm_model)
+    if not accepted:
+        METRICS.inc("llm_cascade_rejects_total", purpose=llm_purpose, model=llm_model)
+    if escalated:
+        METRICS.inc("llm_cascade_escalations_total", purpose=llm_purpose, model=llm_model)
+
+
+def cascade_call(args, prompt, setting, llm_purpose, parse, is_valid, prompt_type=None):
+    """
+    Ask the models of a role in order until one answer parses into a valid result
+
+    Args:
+        prompt: prompt text
+        setting: role setting, see cascade_models
+        llm_purpose: usage statistics bucket ('pattern', 'function', 'selection', 'explanation')
+        parse: raw answer -> parsed result
+        is_valid: parsed result -> bool
+        prompt_type: key of OUTPUT_SCHEMAS; with --llm_output_format json the answer is requested as JSON
+            and rendered back into the text layout that parse reads
+
+    Returns:
+        (parsed result, model): the first valid result, or the last model's result when none is valid
+    """
+    models = cascade_models(setting)
+    json_output = prompt_type is not None and json_output_enabled(args)
+    if json_output:
+        prompt = with_output_schema(args, prompt, prompt_type)
+    for level, llm_model in enumerate(models):
+        raw_output = call_qwen_api(args, prompt, llm_model, llm_purpose, json_output=json_output)
+        if json_output:
+            raw_output = structured_text(args, prompt, raw_output, prompt_type, llm_model, llm_purpose)
+        result = parse(raw_output)
+        accepted = bool(is_valid(result))
+        escalated = not accepted and level + 1 < len(models)
+        record_cascade_attempt(llm_purpose, llm_model, accepted, escalated)
+        if not accepted:
+            reject_llm_response(args, prompt, llm_model, llm_purpose)
+        if not escalated:
+            return result, llm_model
+        logging.info(f"[{llm_purpose.upper()}] {llm_model} answer rejected, escalating to {models[level + 1]}")
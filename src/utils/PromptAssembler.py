@@ -0,0 +1,68 @@
+import logging
+
+# Vocabulary dictionaries passed to the pattern prompts and the vb attribute they hold
+VOCABULARY_ATTRIBUTES = {
+    "speed_dict": "speed_profile",
+    "course_dict": "course_change",
+    "heading_dict": "heading_fluctuation",
+    "intent_dict": "intent",
+}
+
+
+def estimate_tokens(text):
+    """Rough token count of a prompt fragment (4 characters per token)"""
+    return len(text) / 4.0
+
+
+def take_within_budget(ranked_items, budget, render):
+    """
+    Keep the leading items of a ranked list while their rendered text fits in the budget
+
+    Args:
+        ranked_items: items, most relevant first
+        budget: token budget, 0 keeps everything
+        render: item -> text that the item adds to the prompt
+
+    Returns:
+        list: kept items, in rank order
+    """
+    if not budget:
+        return list(ranked_items)
+    kept, used = [], 0.0
+    for item in ranked_items:
+        cost = estimate_tokens(render(item))
+        if used + cost > budget:
+            break
+        kept.append(item)
+        used += cost
+    return kept
+
+
+def rank_by_weight(items, weights):
+    """Sort by descending weight; ties keep their original order"""
+    return sorted(items, key=lambda item: -weights.get(item, 0))
+
+
+def budget_vocabulary_dicts(args, SDKG):
+    """
+    Vocabulary dictionaries for Pattern_Prompt / Pattern_Batch_Prompt within --pattern_prompt_budget
+
+    The budget is shared evenly by the four dictionaries; each keeps its values with the most graph support.
+    """
+    field_dicts = SDKG.get_vb_attributes_dicts()
+    budget = args.pattern_prompt_budget
+    if not budget:
+        return field_dicts
+
+    weights = SDKG.get_vocabulary_weights()
+    per_dict_budget = budget / len(field_dicts)
+    budgeted, truncated = {}, []
+    for name, vocabulary in field_dicts.items():
+        ranked = rank_by_weight(list(vocabulary), weights.get(VOCABULARY_ATTRIBUTES.get(name), {}))
+        kept = take_within_budget(ranked, per_dict_budget, lambda value: f"{value!r}: True, ")
+        budgeted[name] = {value: True for value in kept}
+        if len(kept) < len(ranked):
+            truncated.append(f"{name} {len(ranked)}->{len(kept)}")
+    if truncated:
+        logging.info(f"[PATTERN] prompt vocabulary truncated to budget {budget}: {', '.join(truncated)}")
+    return budgeted
@@ -0,0 +1,226 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import openai
+from src.utils.Metrics import METRICS
+
+# Errors worth retrying; the first group also means the provider wants less concurrency
+THROTTLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError)
+RETRYABLE_ERRORS = THROTTLE_ERRORS + (openai.APIConnectionError, openai.InternalServerError)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Refills at rate_per_min / 60 units per second up to rate_per_min; a rate of 0 means unlimited"""
+    def __init__(self, rate_per_min):
+        self.capacity = float(rate_per_min)
+        self.level = float(rate_per_min)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (0 when they already are)"""
+        if not self.capacity or self.level >= min(amount, self.capacity):
+            return 0.0
+        return (min(amount, self.capacity) - self.level) * 60.0 / self.capacity
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+
+class LLMRateLimiter:
+    """
+    Shared admission control for LLM requests to one endpoint
+
+    Requests wait for a slot under the adaptive concurrency limit and for budget in the
+    requests-per-minute and tokens-per-minute buckets. The concurrency limit grows by about one
+    slot per limit's worth of successes and halves on throttling (AIMD). Throttled or transient
+    failures are retried with exponential backoff and full jitter.
+    """
+    def __init__(self, rpm=0, tpm=0, max_concurrency=16, min_concurrency=1,
+                 backoff_base=1.0, backoff_max=60.0, max_attempts=6):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        self.in_flight = 0
+        self.waiting = 0
+        self.throttled = 0
+        self.last_decrease = 0.0
+        self.completion_estimate = 256.0
+        self.cond = threading.Condition()
+
+    def estimate_tokens(self, prompt):
+        """Rough prompt size (4 characters per token) plus the running mean completion size"""
+        return len(prompt) / 4.0 + self.completion_estimate
+
+    def _try_acquire(self, tokens):
+        """Take a slot and bucket budget; Returns: 0 on success, otherwise seconds to wait"""
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        if self.in_flight >= int(self.concurrency_limit):
+            return None
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        return 0
+
+    def acquire(self, tokens):
+        with self.cond:
+            self.waiting += 1
+            try:
+                while True:
+                    wait = self._try_acquire(tokens)
+                    if wait == 0:
+                        return
+                    # None: blocked on concurrency, woken up by release()
+                    self.cond.wait(timeout=wait)
+            finally:
+                self.waiting -= 1
+
+    async def aacquire(self, tokens):
+        with self.cond:
+            self.waiting += 1
+        try:
+            while True:
+                with self.cond:
+                    wait = self._try_acquire(tokens)
+                if wait == 0:
+                    return
+                await asyncio.sleep(min(wait or 0.05, 1.0))
+        finally:
+            with self.cond:
+                self.waiting -= 1
+
+    def release(self, estimated_tokens, usage=None, throttled=False, succeeded=False):
+        with self.cond:
+            self.in_flight -= 1
+            if usage is not None:
+                completion = getattr(usage, "completion_tokens", 0) or 0
+                total = getattr(usage, "total_tokens", 0) or 0
+                self.completion_estimate = 0.9 * self.completion_estimate + 0.1 * completion
+                # Settle the bucket with the real token count
+                self.tokens.take(total - estimated_tokens)
+            if throttled:
+                self.throttled += 1
+                # A burst of throttled in-flight requests counts as one congestion signal
+                now = time.monotonic()
+                if now - self.last_decrease >= self.backoff_base:
+                    self.last_decrease = now
+                    self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+                    logging.warning(f"LLM throttled, concurrency limit -> {int(self.concurrency_limit)}")
+            elif succeeded:
+                self.concurrency_limit = min(float(self.max_concurrency), self.concurrency_limit + 1.0 / self.concurrency_limit)
+            self.cond.notify_all()
+
+    def backoff(self, attempt, error):
+        """Full-jitter exponential delay, never shorter than a Retry-After hint"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    def call(self, request_fn, prompt):
+        """Run request_fn under the limiter; Returns: (completion, elapsed seconds of the successful attempt)"""
+        tokens = self.estimate_tokens(prompt)
+        for attempt in range(self.max_attempts):
+            self.acquire(tokens)
+            t0 = time.time()
+            try:
+                completion = request_fn()
+            except RETRYABLE_ERRORS as e:
+                self.release(tokens, throttled=isinstance(e, THROTTLE_ERRORS))
+                if attempt + 1 == self.max_attempts:
+                    raise
+                delay = self.backoff(attempt, e)
+                logging.warning(f"LLM request failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except Exception:
+                self.release(tokens)
+                raise
+            elapsed = time.time() - t0
+            self.release(tokens, usage=getattr(completion, "usage", None), succeeded=True)
+            return completion, elapsed
+
+    async def acall(self, request_fn, prompt):
+        """asyncio variant of call; request_fn returns an awaitable"""
+        tokens = self.estimate_tokens(prompt)
+        for attempt in range(self.max_attempts):
+            await self.aacquire(tokens)
+            t0 = time.time()
+            try:
+                completion = await request_fn()
+            except RETRYABLE_ERRORS as e:
+                self.release(tokens, throttled=isinstance(e, THROTTLE_ERRORS))
+                if attempt + 1 == self.max_attempts:
+                    raise
+                delay = self.backoff(attempt, e)
+                logging.warning(f"LLM request failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.release(tokens)
+                raise
+            elapsed = time.time() - t0
+            self.release(tokens, usage=getattr(completion, "usage", None), succeeded=True)
+            return completion, elapsed
+
+    def snapshot(self):
+        """Current limits and queue state"""
+        with self.cond:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                "concurrency_limit": int(self.concurrency_limit),
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "throttled": self.throttled,
+                "rpm_limit": self.requests.capacity,
+                "rpm_available": round(self.requests.level, 1),
+                "tpm_limit": self.tokens.capacity,
+                "tpm_available": round(self.tokens.level, 1),
+            }
+
+
+def get_rate_limiter(args):
+    """Return the process-wide limiter of the configured endpoint"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(args.llm_base_url)
+        if limiter is None:
+            limiter = LLMRateLimiter(
+                rpm=args.llm_rpm,
+                tpm=args.llm_tpm,
+                max_concurrency=args.llm_max_concurrency,
+                backoff_base=args.llm_backoff_base,
+                backoff_max=args.llm_backoff_max,
+                max_attempts=args.llm_max_attempts,
+            )
+            _rate_limiters[args.llm_base_url] = limiter
+            METRICS.register_collector(lambda: [
+                (f"llm_limiter_{name}", value, {"endpoint": args.llm_base_url})
+                for name, value in limiter.snapshot().items()
+            ])
+    return limiter
@@ -0,0 +1,184 @@
+import threading
+import numpy as np
+
+
+def _gather_rows(indptr, rows):
+    """Indices of the entries of the given CSR rows, and how many each row has"""
+    lengths = indptr[rows + 1] - indptr[rows]
+    starts = np.repeat(indptr[rows] - np.cumsum(lengths) + lengths, lengths)
+    return starts + np.arange(int(lengths.sum())), lengths
+
+
+class SparseWeights:
+    """
+    Edge weights row key -> column key kept as a CSR matrix
+
+    Updates append (row, column, delta) triplets in O(1). Queries read the CSR arrays through a small
+    overlay of the pending triplets, which are folded into the CSR arrays only once there are more than
+    max(COMPACT_MIN_PENDING, nnz / COMPACT_RATIO) of them, so interleaved updates and queries do not
+    rebuild the whole matrix each time. Queries score every column by the sum of log(1 + weight) over
+    the query rows, i.e. the log of the product of (weight + 1) used by the SDKG candidate selection,
+    without overflowing. Each entry remembers when it was first added, so that tied columns keep the
+    order of the dict-based selection.
+    """
+    COMPACT_MIN_PENDING = 1024
+    COMPACT_RATIO = 64
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.row_index, self.col_index, self.col_keys = {}, {}, []
+            self.indptr = np.zeros(1, dtype=np.int64)
+            self.indices = np.zeros(0, dtype=np.int64)
+            self.weights = np.zeros(0, dtype=np.float64)
+            self.log_weights = np.zeros(0, dtype=np.float64)
+            # (row << 32) | column of every entry, sorted, to find the entries the pending triplets update
+            self.entry_keys = np.zeros(0, dtype=np.int64)
+            # sequence number of the first add() of each entry, i.e. its insertion order within the row
+            self.order = np.zeros(0, dtype=np.int64)
+            self.next_order = 0
+            self.pending = ([], [], [], [])
+            self.overlay = None
+
+    def add(self, row_key, col_key, delta=1.0):
+        with self.lock:
+            row = self.row_index.setdefault(row_key, len(self.row_index))
+            col = self.col_index.get(col_key)
+            if col is None:
+                col = self.col_index[col_key] = len(self.col_keys)
+                self.col_keys.append(col_key)
+            self.pending[0].append(row)
+            self.pending[1].append(col)
+            self.pending[2].append(delta)
+            self.pending[3].append(self.next_order)
+            self.next_order += 1
+            self.overlay = None
+
+    def _pending_cells(self):
+        """Pending triplets summed per (row, column) cell: (cell keys, deltas, first orders), sorted by key"""
+        keys = (np.asarray(self.pending[0], dtype=np.int64) << 32) | np.asarray(self.pending[1], dtype=np.int64)
+        cells, inverse = np.unique(keys, return_inverse=True)
+        deltas = np.bincount(inverse, weights=np.asarray(self.pending[2], dtype=np.float64), minlength=len(cells))
+        order = np.full(len(cells), self.next_order, dtype=np.int64)
+        np.minimum.at(order, inverse, np.asarray(self.pending[3], dtype=np.int64))
+        return cells, deltas, order
+
+    def _compact(self):
+        """Fold the pending triplets into the CSR arrays (lock held)"""
+        if not self.pending[0]:
+            return
+        n_rows = len(self.row_index)
+        pending_cells, deltas, pending_order = self._pending_cells()
+        keys = np.concatenate([self.entry_keys, pending_cells])
+        cells, inverse = np.unique(keys, return_inverse=True)
+        self.weights = np.bincount(inverse, weights=np.concatenate([self.weights, deltas]), minlength=len(cells))
+        order = np.full(len(cells), self.next_order, dtype=np.int64)
+        np.minimum.at(order, inverse, np.concatenate([self.order, pending_order]))
+        self.order = order
+        self.entry_keys = cells
+        self.indices = cells & 0xFFFFFFFF
+        self.indptr = np.searchsorted(cells >> 32, np.arange(n_rows + 1))
+        self.log_weights = np.log1p(np.maximum(self.weights, 0.0))
+        self.pending = ([], [], [], [])
+        self.overlay = None
+
+    def _get_overlay(self):
+        """
+        View of the pending triplets on top of the CSR arrays (lock held)
+
+        Returns:
+            (sorted indices of the updated entries, their new log weights, indptr / indices / log weights /
+            order of the cells without a CSR entry yet); cached until the next add()
+        """
+        if self.overlay is None:
+            cells, deltas, order = self._pending_cells()
+            # both key arrays are sorted, so the updated entries come out sorted
+            found = np.searchsorted(self.entry_keys, cells)
+            found[found == len(self.entry_keys)] = 0
+            existing = self.entry_keys[found] == cells if len(self.entry_keys) else np.zeros(len(cells), dtype=bool)
+            updated = found[existing]
+            updated_log_weights = np.log1p(np.maximum(self.weights[updated] + deltas[existing], 0.0))
+            new_cells = cells[~existing]
+            self.overlay = (updated, updated_log_weights,
+                            np.searchsorted(new_cells >> 32, np.arange(len(self.row_index) + 1)),
+                            new_cells & 0xFFFFFFFF, np.log1p(np.maximum(deltas[~existing], 0.0)), order[~existing])
+        return self.overlay
+
+    def top_k(self, queries, k):
+        """
+        Args:
+            queries: list of row key iterables; unknown row keys are ignored
+            k: candidates kept per query
+
+        Returns:
+            list: per query, [(column key, log score), ...] by decreasing score; only columns with a
+                positive weight from some query row are candidates. Ties keep the order in which the
+                columns are first reached going through the query rows in order, and the entries of
+                each row in insertion order
+        """
+        with self.lock:
+            if len(self.pending[0]) > max(self.COMPACT_MIN_PENDING, len(self.indices) // self.COMPACT_RATIO):
+                self._compact()
+            updated, updated_log_weights, new_indptr, new_indices, new_log_weights, new_order = self._get_overlay()
+            indptr, indices, log_weights, order = self.indptr, self.indices, self.log_weights, self.order
+            row_index, col_keys, next_order = self.row_index, list(self.col_keys), self.next_order
+        results = [[] for _ in queries]
+        n_cols = len(col_keys)
+        if not n_cols or k <= 0:
+            return results
+        k = min(k, n_cols)
+
+        query_ids, rows, positions = [], [], []
+        for query_id, row_keys in enumerate(queries):
+            # rows added by a concurrent add() after the snapshot have no entries yet
+            query_rows = dict.fromkeys(row_index[key] for key in row_keys if key in row_index)
+            for position, row in enumerate(query_rows):
+                if row < len(new_indptr) - 1:
+                    query_ids.append(query_id)
+                    rows.append(row)
+                    positions.append(position)
+        query_ids, rows = np.asarray(query_ids, dtype=np.int64), np.asarray(rows, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+
+        # rows created since the last compaction only have overlay entries
+        in_csr = rows < len(indptr) - 1
+        entries, lengths = _gather_rows(indptr, rows[in_csr])
+        entry_log_weights = log_weights[entries]
+        if len(updated):
+            # pending deltas to existing entries replace their log weights
+            at = np.minimum(np.searchsorted(updated, entries), len(updated) - 1)
+            hit = updated[at] == entries
+            entry_log_weights[hit] = updated_log_weights[at[hit]]
+        new_entries, new_lengths = _gather_rows(new_indptr, rows)
+        entry_queries = np.concatenate([np.repeat(query_ids[in_csr], lengths), np.repeat(query_ids, new_lengths)])
+        entry_cols = np.concatenate([indices[entries], new_indices[new_entries]])
+        entry_log_weights = np.concatenate([entry_log_weights, new_log_weights[new_entries]])
+        # rank of first encounter: position of the row in the query, then insertion order within the row
+        entry_ranks = np.concatenate([np.repeat(positions[in_csr], lengths) * (next_order + 1) + order[entries],
+                                      np.repeat(positions, new_lengths) * (next_order + 1) + new_order[new_entries]])
+
+        # sum the log weights per (query, column) cell; cells come out grouped by query
+        cells, inverse = np.unique(entry_queries * n_cols + entry_cols, return_inverse=True)
+        cell_scores = np.bincount(inverse, weights=entry_log_weights, minlength=len(cells))
+        cell_ranks = np.full(len(cells), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(cell_ranks, inverse, entry_ranks)
+        # log sums of equal products may differ in the last bits; compare them rounded
+        cell_ties = np.round(cell_scores, 9)
+        cell_queries, cell_cols = cells // n_cols, cells % n_cols
+        bounds = np.searchsorted(cell_queries, np.arange(len(queries) + 1))
+        for query_id in range(len(queries)):
+            scores = cell_scores[bounds[query_id]:bounds[query_id + 1]]
+            ties = cell_ties[bounds[query_id]:bounds[query_id + 1]]
+            ranks = cell_ranks[bounds[query_id]:bounds[query_id + 1]]
+            cols = cell_cols[bounds[query_id]:bounds[query_id + 1]]
+            if len(scores) > k:
+                # every column tied with the k-th score competes for the last places
+                top = np.flatnonzero(ties >= np.partition(ties, len(ties) - k)[len(ties) - k])
+            else:
+                top = np.arange(len(scores))
+            top = top[np.lexsort((ranks[top], -ties[top]))][:k]
+            results[query_id] = [(col_keys[cols[j]], float(scores[j])) for j in top if scores[j] > 0]
+        return results
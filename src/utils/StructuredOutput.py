@@ -0,0 +1,230 @@
+import re
+import ast
+import json
+import logging
+from src.utils.CallApi import call_qwen_api, reject_llm_response
+from src.utils.Metrics import METRICS
+
+OUTPUT_FORMATS = ["text", "json"]
+
+_PATTERN_FIELDS = {
+    "speed_pattern": {"type": "string", "description": "speed profile term without numbers (short description in parentheses)"},
+    "course_pattern": {"type": "string", "description": "course over ground change term without numbers (short description in parentheses)"},
+    "heading_pattern": {"type": "string", "description": "heading fluctuation term without numbers (short description in parentheses)"},
+    "intent": {"type": "string", "description": "maneuver intention term without numbers (short description in parentheses)"},
+}
+_REDUNDANCY_GROUP = {
+    "type": "object",
+    "properties": {"primary": {"type": "string"}, "redundant": {"type": "array", "items": {"type": "string"}}},
+    "required": ["primary", "redundant"],
+}
+
+# JSON schema of the answer of every prompt of Prompt.py whose output is parsed into fields
+OUTPUT_SCHEMAS = {
+    "pattern": {"type": "object", "properties": _PATTERN_FIELDS, "required": list(_PATTERN_FIELDS)},
+    "pattern_batch": {
+        "type": "object",
+        "properties": {"segments": {"type": "array", "items": {
+            "type": "object",
+            "properties": dict({"segment": {"type": "integer", "description": "segment number <i>"}}, **_PATTERN_FIELDS),
+            "required": ["segment"] + list(_PATTERN_FIELDS),
+        }}},
+        "required": ["segments"],
+    },
+    "behavior_estimator": {
+        "type": "object",
+        "properties": {
+            "selected_movement_id": {"type": "string"},
+            "graph_support": {"type": "string", "description": "edges and weights you rely on"},
+            "contextual_justification": {"type": "string", "description": "why consistent with boundary context"},
+        },
+        "required": ["selected_movement_id", "graph_support", "contextual_justification"],
+    },
+    "method_selector": {
+        "type": "object",
+        "properties": {
+            "selected_function_id": {"type": "string"},
+            "statistical_support": {"type": "string"},
+            "reasoning": {"type": "string"},
+            "imputation_action": {"type": "string"},
+        },
+        "required": ["selected_function_id", "statistical_support", "reasoning", "imputation_action"],
+    },
+    "explanation_composer": {
+        "type": "object",
+        "properties": {
+            "regulatory_rule_cue": {"type": "string"},
+            "operational_protocol_rationale": {"type": "string"},
+        },
+        "required": ["regulatory_rule_cue", "operational_protocol_rationale"],
+    },
+    "redundancy_analysis": {
+        "type": "object",
+        "properties": {
+            "behavior_redundancy": {"type": "object", "description": "attribute name -> list of groups",
+                                    "additionalProperties": {"type": "array", "items": _REDUNDANCY_GROUP}},
+            "keep_unique_terms": {"type": "array", "items": {"type": "string"}},
+            "function_redundancy": {"type": "array", "items": _REDUNDANCY_GROUP},
+            "keep_unique_functions": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["behavior_redundancy", "function_redundancy"],
+    },
+}
+
+JSON_OUTPUT_SECTION = """
+[JSON OUTPUT]
+Ignore the text layout requested above and answer with a single JSON object (no other text) that follows this JSON schema:
+{schema}
+"""
+
+FOLLOWUP_PROMPT = """Your previous answer was:
+{answer}
+
+It {problem}. Answer with a single JSON object (no other text) that follows this JSON schema:
+{schema}
+"""
+
+# An answer that is not JSON at all has no usable content, so the model is given the task again
+FOLLOWUP_TASK_PROMPT = """{prompt}
+
+""" + FOLLOWUP_PROMPT
+
+
+def json_output_enabled(args):
+    return getattr(args, "llm_output_format", "text") == "json"
+
+
+def with_output_schema(args, prompt, prompt_type):
+    """Append the JSON schema of prompt_type in --llm_output_format json; the prompt is unchanged otherwise"""
+    if not json_output_enabled(args):
+        return prompt
+    return prompt + JSON_OUTPUT_SECTION.format(schema=json.dumps(OUTPUT_SCHEMAS[prompt_type], ensure_ascii=False))
+
+
+def repair_json(text):
+    """
+    Local repair of near-valid JSON: code fences or quotes around it, text before / after it,
+    trailing commas, single quotes and Python literals
+
+    Returns:
+        (dict or None, repaired): the decoded object and whether it needed repairs
+    """
+    try:
+        data = json.loads(text)
+        return (data, False) if isinstance(data, dict) else (None, False)
+    except ValueError:
+        pass
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None, False
+    candidate = text[start:end + 1]
+    candidate = candidate.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'")
+    candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        try:
+            data = ast.literal_eval(re.sub(r"\btrue\b", "True", re.sub(r"\bfalse\b", "False", re.sub(r"\bnull\b", "None", candidate))))
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None, False
+    return (data, True) if isinstance(data, dict) else (None, False)
+
+
+def missing_fields(data, schema):
+    """Required fields that are absent, or empty strings"""
+    missing = []
+    for field in schema.get("required", []):
+        value = data.get(field)
+        if value is None or (schema["properties"][field].get("type") == "string" and not str(value).strip()):
+            missing.append(field)
+    return missing
+
+
+def _pattern_block(fields):
+    return ("'''\nPattern:\n"
+            f"- **speed_pattern**: {fields.get('speed_pattern', '')}\n"
+            f"- **course_pattern**: {fields.get('course_pattern', '')}\n"
+            f"- **heading_pattern**: {fields.get('heading_pattern', '')}\n"
+            f"- **intent**: {fields.get('intent', '')}\n'''")
+
+
+def _redundancy_lines(groups):
+    lines = []
+    for group in groups or []:
+        if isinstance(group, dict) and group.get("primary"):
+            lines.append(f"- {group['primary']} | [{', '.join(str(term) for term in group.get('redundant') or [])}]")
+    return lines
+
+
+def render_text(prompt_type, data):
+    """Render a JSON answer in the text layout of the prompt, which the module parsers already read"""
+    if prompt_type == "pattern":
+        return _pattern_block(data)
+    if prompt_type == "pattern_batch":
+        return "\n\n".join(f"=== Segment {segment.get('segment', i + 1)} ===\n{_pattern_block(segment)}"
+                           for i, segment in enumerate(data.get("segments") or []) if isinstance(segment, dict))
+    if prompt_type == "behavior_estimator":
+        return (f"Selected Movement ID: {data.get('selected_movement_id', '')}\n"
+                f"Graph Support: {data.get('graph_support', '')}\n"
+                f"Contextual Justification: {data.get('contextual_justification', '')}")
+    if prompt_type == "method_selector":
+        return (f"Selected Function ID: {data.get('selected_function_id', '')}\n"
+                f"Statistical Support: {data.get('statistical_support', '')}\n"
+                f"Reasoning: {data.get('reasoning', '')}\n"
+                f"Imputation Action: {data.get('imputation_action', '')}")
+    if prompt_type == "explanation_composer":
+        return (f"Regulatory Rule Cue: {data.get('regulatory_rule_cue', '')}\n"
+                f"Operational Protocol Rationale: {data.get('operational_protocol_rationale', '')}")
+    if prompt_type == "redundancy_analysis":
+        lines = ["BEHAVIOR_REDUNDANCY:"]
+        for attribute, groups in (data.get("behavior_redundancy") or {}).items():
+            lines += [f"{attribute}:"] + _redundancy_lines(groups)
+        lines += [f"KEEP_UNIQUE: [{', '.join(map(str, data.get('keep_unique_terms') or []))}]", "", "FUNCTION_REDUNDANCY:"]
+        lines += _redundancy_lines(data.get("function_redundancy"))
+        lines.append(f"KEEP_UNIQUE: [{', '.join(map(str, data.get('keep_unique_functions') or []))}]")
+        return "\n".join(lines)
+    raise ValueError(f"Unknown prompt type {prompt_type}")
+
+
+def structured_text(args, prompt, raw_output, prompt_type, llm_model, llm_purpose):
+    """
+    Turn a JSON answer into the text layout of its prompt, repairing it locally or asking only
+    for what is missing (--llm_repair_followups times) when needed; an answer that is not JSON
+    is followed up with the original prompt
+
+    Returns:
+        str: rendered text, or raw_output unchanged in text mode or when no JSON could be recovered
+    """
+    if not json_output_enabled(args):
+        return raw_output
+    schema = OUTPUT_SCHEMAS[prompt_type]
+    data, repaired = repair_json(raw_output)
+    missing = missing_fields(data, schema) if data is not None else list(schema["required"])
+    outcome = "repaired" if repaired else "ok"
+
+    answer = raw_output
+    for _ in range(args.llm_repair_followups):
+        if data is not None and not missing:
+            break
+        outcome = "followup"
+        if data is None:
+            template, problem, followup_schema = FOLLOWUP_TASK_PROMPT, "is not valid JSON", schema
+        else:
+            template, problem = FOLLOWUP_PROMPT, f"misses the fields {', '.join(missing)}"
+            followup_schema = dict(schema, properties={f: schema["properties"][f] for f in missing}, required=missing)
+        followup = template.format(prompt=prompt, answer=answer, problem=problem,
+                                   schema=json.dumps(followup_schema, ensure_ascii=False))
+        answer = call_qwen_api(args, followup, llm_model, llm_purpose, json_output=True)
+        followup_data, _ = repair_json(answer)
+        if followup_data is None:
+            reject_llm_response(args, followup, llm_model, llm_purpose)
+        else:
+            data = dict(data or {}, **{k: v for k, v in followup_data.items() if v not in (None, "")})
+            missing = missing_fields(data, schema)
+
+    if data is None or missing:
+        outcome = "failed"
+        logging.warning(f"[{llm_purpose.upper()}] {prompt_type} answer unusable as JSON"
+                        + (f", missing {', '.join(missing)}" if data is not None else ""))
+    METRICS.inc("llm_output_parse_total", prompt_type=prompt_type, outcome=outcome)
+    return render_text(prompt_type, data) if data is not None else raw_output
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+from src.utils.CallApi import record_encoding_savings
+
+TRAJECTORY_ENCODINGS = ["verbose", "compact"]
+
+# Kinematic columns each prompt needs next to the time / position offsets
+PATTERN_COLUMNS = ['sog', 'cog', 'heading']
+FUNCTION_COLUMNS = ['sog', 'cog', 'heading']
+IMPUTATION_COLUMNS = ['segment_id', 'sog', 'cog', 'heading']
+
+
+def _format_number(value, decimals):
+    if pd.isna(value):
+        return "NA"
+    # Adding 0.0 turns a rounded -0.0 into 0.0
+    text = f"{round(float(value), decimals) + 0.0:.{decimals}f}"
+    return text.rstrip('0').rstrip('.') if '.' in text else text
+
+
+def encode_trajectory(segment, columns=PATTERN_COLUMNS, precision=5):
+    """
+    Compact relative encoding of a trajectory segment: one header with the base time and
+    position, then per point the time offset (s) and position offsets in 1e-precision degrees
+
+    Args:
+        segment: DataFrame with timestamp, latitude and longitude columns
+        columns: extra columns to keep, rounded to one decimal
+        precision: decimal places kept for latitude / longitude
+
+    Returns:
+        str: encoded segment, missing values written as NA
+    """
+    timestamps = pd.to_datetime(segment['timestamp'], errors='coerce')
+    latitudes = segment['latitude'].to_numpy(dtype=float)
+    longitudes = segment['longitude'].to_numpy(dtype=float)
+
+    # Position offsets are taken from the first point with a known position
+    known = np.flatnonzero(~np.isnan(latitudes) & ~np.isnan(longitudes))
+    base_lat, base_lon = (latitudes[known[0]], longitudes[known[0]]) if len(known) else (0.0, 0.0)
+    base_time = timestamps.iloc[0]
+    scale = 10 ** precision
+
+    dt = (timestamps - base_time).dt.total_seconds().to_numpy()
+    dlat = np.round((latitudes - base_lat) * scale)
+    dlon = np.round((longitudes - base_lon) * scale)
+    columns = [col for col in columns if col in segment.columns]
+    extra = [segment[col].to_numpy() for col in columns]
+
+    lines = [
+        f"base time={base_time}, lat={base_lat:.{precision}f}, lon={base_lon:.{precision}f}; "
+        f"dt in s, dlat/dlon in 1e-{precision} deg",
+        ",".join(['dt', 'dlat', 'dlon'] + columns),
+    ]
+    for i in range(len(segment)):
+        values = [_format_number(dt[i], 0), _format_number(dlat[i], 0), _format_number(dlon[i], 0)]
+        values += [_format_number(values_col[i], 1) for values_col in extra]
+        lines.append(",".join(values))
+    return "\n".join(lines)
+
+
+def trajectory_text(args, segment, llm_purpose, verbose_text, columns=PATTERN_COLUMNS):
+    """
+    Trajectory text for a prompt: verbose_text as before, or the compact encoding with
+    --traj_encoding compact, in which case the estimated token savings are recorded for llm_purpose
+    """
+    if args.traj_encoding != "compact":
+        return verbose_text
+    text = encode_trajectory(segment, columns, args.traj_precision)
+    record_encoding_savings(llm_purpose, verbose_text, text)
+    return text
@@ -0,0 +1,4 @@
+import sys, os
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_path)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.utils.ais_data_storage import mmsi_hash_bucket, save_ais_data, load_ais_data, iter_ais_data_chunks
+
+pytest.importorskip("pyarrow")
+
+
+def make_frame(n=400):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "mmsi": 219000000 + rng.integers(0, 40, n),
+        "timestamp": pd.Timestamp("2024-03-01") + pd.to_timedelta(rng.integers(0, 86400 * 2, n), unit="s"),
+        "latitude": rng.uniform(54, 58, n),
+        "navigational_status": rng.choice(["Moored", "Under way using engine"], n),
+        "TrajID": rng.integers(0, 10, n),
+    }).sort_values(["mmsi", "timestamp"], kind="mergesort").reset_index(drop=True)
+
+
+def test_hash_buckets_spread_mmsis_sharing_a_country_prefix():
+    # consecutive MMSIs of one MID, in steps of 16: a plain modulo puts them all in one bucket
+    mmsi = 219000000 + 16 * np.arange(1600)
+    counts = np.bincount(mmsi_hash_bucket(mmsi, 16), minlength=16)
+    assert counts.min() > 50
+
+
+def test_hash_buckets_agree_between_int_and_float_and_mark_missing():
+    mmsi = np.array([219000001, 219000002, 366000003])
+    as_float = np.append(mmsi.astype(float), np.nan)
+    np.testing.assert_array_equal(mmsi_hash_bucket(as_float, 8)[:3], mmsi_hash_bucket(mmsi, 8))
+    assert mmsi_hash_bucket(as_float, 8)[3] == -1
+
+
+@pytest.mark.parametrize("partition_by", ["mmsi_hash", "date"])
+def test_parquet_round_trip_keeps_dtypes(tmp_path, partition_by):
+    df = make_frame()
+    file_path = str(tmp_path / "tier.csv")
+    save_ais_data(df, file_path, "parquet", partition_by, 4)
+    loaded = load_ais_data(file_path, "parquet", sort_by=["mmsi", "timestamp"])
+    assert not any(isinstance(dtype, pd.CategoricalDtype) for dtype in loaded.dtypes)
+    pd.testing.assert_frame_equal(loaded[df.columns], df, check_dtype=False)
+    assert loaded["navigational_status"].dtype == df["navigational_status"].dtype
+    for chunk in iter_ais_data_chunks(file_path, "parquet", 100):
+        assert not any(isinstance(dtype, pd.CategoricalDtype) for dtype in chunk.dtypes)
+
+
+@pytest.mark.parametrize("storage_format", ["csv", "parquet"])
+def test_column_projection_skips_missing_columns(tmp_path, storage_format):
+    df = make_frame()
+    file_path = str(tmp_path / "tier.csv")
+    save_ais_data(df, file_path, storage_format)
+    loaded = load_ais_data(file_path, storage_format, columns={"mmsi", "latitude", "not_stored"})
+    assert set(loaded.columns) == {"mmsi", "latitude"}
+    assert len(loaded) == len(df)
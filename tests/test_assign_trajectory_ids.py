@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.utils.ais_data_filter import assign_trajectory_ids
+
+
+def reference_trajectory_ids(df, min_time_interval, max_time_interval):
+    """The per-row loop prepare_filtered_data used before assign_trajectory_ids"""
+    df = df.copy()
+    df['TrajID'] = -1
+    traj_id = 0
+
+    for mmsi, group in df.groupby('mmsi'):
+        group_indices = group.index.tolist()
+        if len(group_indices) == 0:
+            continue
+
+        current_traj_start_idx = group_indices[0]
+        df.loc[current_traj_start_idx, 'TrajID'] = traj_id
+        last_selected_time = df.loc[current_traj_start_idx, 'timestamp']
+
+        for idx in group_indices[1:]:
+            current_time = df.loc[idx, 'timestamp']
+            time_diff = (current_time - last_selected_time).total_seconds()
+
+            if time_diff > max_time_interval:
+                traj_id += 1
+                df.loc[idx, 'TrajID'] = traj_id
+                last_selected_time = current_time
+            elif time_diff >= min_time_interval:
+                df.loc[idx, 'TrajID'] = traj_id
+                last_selected_time = current_time
+
+        traj_id += 1
+    return df['TrajID'].to_numpy()
+
+
+def make_frame(mmsi, seconds):
+    """Sorted frame like prepare_filtered_data builds; None seconds become NaT"""
+    timestamps = [pd.NaT if s is None else pd.Timestamp("2024-01-01") + pd.Timedelta(seconds=s) for s in seconds]
+    df = pd.DataFrame({'mmsi': mmsi, 'timestamp': pd.to_datetime(pd.Series(timestamps))})
+    return df.sort_values(['mmsi', 'timestamp']).reset_index(drop=True)
+
+
+def assert_parity(df, min_time_interval, max_time_interval):
+    expected = reference_trajectory_ids(df, min_time_interval, max_time_interval)
+    actual = assign_trajectory_ids(df['mmsi'].to_numpy(), df['timestamp'].to_numpy(),
+                                   min_time_interval, max_time_interval)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def random_frame(rng, n_rows):
+    mmsi = rng.integers(0, max(1, n_rows // 8), n_rows).astype(np.float64)
+    mmsi[rng.random(n_rows) < 0.05] = np.nan
+    # whole seconds on a coarse grid, so gaps often land exactly on the thresholds
+    seconds = (rng.integers(0, 200, n_rows) * 10).tolist()
+    seconds = [None if nat else s for s, nat in zip(seconds, rng.random(n_rows) < 0.05)]
+    return make_frame(mmsi, seconds)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_matches_loop_on_random_data(seed):
+    rng = np.random.default_rng(seed)
+    df = random_frame(rng, int(rng.integers(1, 120)))
+    min_time_interval = int(rng.choice([0, 10, 30, 60]))
+    max_time_interval = int(rng.choice([5, 60, 300, 900]))
+    assert_parity(df, min_time_interval, max_time_interval)
+
+
+def test_nat_timestamps():
+    df = make_frame([1, 1, 1, 1, 2, 2, 3], [0, 60, None, None, None, None, 30])
+    assert_parity(df, 30, 300)
+
+
+def test_nan_mmsi():
+    df = make_frame([1.0, np.nan, 1.0, np.nan, 2.0], [0, 10, 60, 20, 5])
+    assert_parity(df, 30, 300)
+    ids = assign_trajectory_ids(df['mmsi'].to_numpy(), df['timestamp'].to_numpy(), 30, 300)
+    assert (ids[df['mmsi'].isna().to_numpy()] == -1).all()
+
+
+def test_gaps_exactly_at_thresholds():
+    # 30 s gaps equal the minimum (kept), the 300 s gap equals the maximum (same trajectory),
+    # 301 s exceeds it (new trajectory) and the final 29 s gap is thinned out
+    df = make_frame([7] * 6, [0, 30, 330, 631, 661, 690])
+    assert_parity(df, 30, 300)
+    ids = assign_trajectory_ids(df['mmsi'].to_numpy(), df['timestamp'].to_numpy(), 30, 300)
+    np.testing.assert_array_equal(ids, [0, 0, 0, 1, 1, -1])
+
+
+def test_single_row_groups():
+    df = make_frame([5, 6, 6, 9], [100, 0, 10, 50])
+    assert_parity(df, 30, 300)
+    assert_parity(make_frame([5], [0]), 30, 300)
+
+
+def test_empty_input():
+    ids = assign_trajectory_ids(np.array([], dtype=np.int64), np.array([], dtype="datetime64[ns]"), 30, 300)
+    assert ids.shape == (0,)
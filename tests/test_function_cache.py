@@ -0,0 +1,46 @@
+import pytest
+
+from src.utils.FunctionCache import CompiledFunctionCache
+from src.utils.FunctionSandbox import FunctionSandbox, SandboxCodeError, SandboxedFunction
+
+CODE = "def spatial_function(start, end, Time_interval): return [start for _ in Time_interval]"
+
+
+class ScriptedSandbox:
+    """Sandbox double whose compile answers are taken from a list (exceptions are raised)"""
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.compiles = 0
+
+    def run(self, op, vf_id, code, call_args=()):
+        self.compiles += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def test_sandbox_infrastructure_errors_are_not_cached():
+    sandbox = ScriptedSandbox(RuntimeError("VF sandbox worker unavailable: broken pipe"), True)
+    cache = CompiledFunctionCache(sandbox=sandbox)
+    with pytest.raises(RuntimeError, match="unavailable"):
+        cache.get(CODE, "vf_1")
+    assert isinstance(cache.get(CODE, "vf_1"), SandboxedFunction)
+    assert sandbox.compiles == 2
+
+
+def test_code_errors_are_cached():
+    sandbox = ScriptedSandbox(SandboxCodeError("SyntaxError: invalid syntax"))
+    cache = CompiledFunctionCache(sandbox=sandbox)
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="Function compilation failed: SyntaxError"):
+            cache.get(CODE, "vf_1")
+    assert sandbox.compiles == 1
+
+
+def test_sandbox_reports_code_errors_distinctly():
+    sandbox = FunctionSandbox(workers=1, cpu_seconds=5.0, memory_mb=0)
+    with pytest.raises(SandboxCodeError, match="SyntaxError"):
+        sandbox.run("compile", "vf_broken", "def spatial_function(:")
+    assert sandbox.run("compile", "vf_ok", CODE) is True
+    assert sandbox.run("call", "vf_ok", CODE, ((1, 2), (3, 4), [0, 1])) == [(1, 2), (1, 2)]
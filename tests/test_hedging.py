@@ -0,0 +1,75 @@
+import time
+import asyncio
+import threading
+
+from src.utils.Hedging import HedgePolicy
+
+
+def warmed_policy(latency=0.01, **kwargs):
+    policy = HedgePolicy(percentile=50, max_rate=1.0, min_samples=4, **kwargs)
+    for _ in range(4):
+        policy._start("test")
+        policy._record("test", latency)
+    return policy
+
+
+def scripted_requests(durations):
+    """request_fn whose n-th call sleeps durations[n] and returns (n, thread name)"""
+    calls, lock = [], threading.Lock()
+
+    def request_fn():
+        with lock:
+            n = len(calls)
+            calls.append(n)
+        time.sleep(durations[n])
+        return n, threading.current_thread().name
+    return request_fn
+
+
+def test_unhedged_call_runs_on_caller_thread():
+    policy = HedgePolicy(min_samples=4)
+    assert policy.call("test", scripted_requests([0.0])) == (0, threading.current_thread().name)
+    assert list(policy.latencies["test"]) and policy.latencies["test"][0] < 0.05
+
+
+def test_hedge_wins_and_losing_response_is_discarded_not_lost():
+    policy = warmed_policy()
+    discarded = []
+    t0 = time.time()
+    result = policy.call("test", scripted_requests([0.5, 0.0]), on_discard=discarded.append)
+    assert result[0] == 1 and time.time() - t0 < 0.3
+    assert discarded == []
+    time.sleep(0.6)
+    assert [n for n, _ in discarded] == [0]
+    # the primary's own service time is recorded once it ends, not the hedged latency
+    assert max(policy.latencies["test"]) >= 0.5
+
+
+def test_losing_requests_do_not_hold_slots_needed_by_primaries():
+    policy = warmed_policy(max_workers=1)
+    # the hedge of the first call wins; its primary keeps running for a while
+    policy.call("test", scripted_requests([0.5, 0.0]))
+    # a loser is still running, yet the next primary starts at once
+    t0 = time.time()
+    policy.call("test", scripted_requests([0.005]))
+    assert time.time() - t0 < 0.2
+
+
+def test_async_hedge_wins_and_primary_is_cancelled():
+    policy = warmed_policy()
+    cancelled = []
+
+    def request_fn(durations=iter([0.5, 0.0]), n=iter(range(2))):
+        index, duration = next(n), next(durations)
+
+        async def request():
+            try:
+                await asyncio.sleep(duration)
+            except asyncio.CancelledError:
+                cancelled.append(index)
+                raise
+            return index
+        return request()
+
+    assert asyncio.run(policy.acall("test", request_fn)) == 1
+    assert cancelled == [0]
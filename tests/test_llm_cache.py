@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+import src.utils.CallApi as CallApi
+from src.utils.LLMCache import LLMResponseCache
+from src.utils.ModelCascade import cascade_call
+
+
+class ScriptedClient:
+    """Chat client answering each request with the next scripted response"""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        self.requests += 1
+        message = SimpleNamespace(content=self.responses.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class PassThroughLimiter:
+    def call(self, fn, prompt):
+        return fn(), 0.0
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    """Route call_qwen_api to a scripted client and a cache under tmp_path"""
+    cache = LLMResponseCache(str(tmp_path / "LLMCache"))
+    state = SimpleNamespace(cache=cache, client=ScriptedClient([]))
+    args = SimpleNamespace(llm_cache_mode="record")
+    state.args = args
+    monkeypatch.setattr(CallApi, "get_llm_cache", lambda a: None if a.llm_cache_mode == "off" else cache)
+    monkeypatch.setattr(CallApi, "get_llm_client", lambda a: state.client)
+    monkeypatch.setattr(CallApi, "get_rate_limiter", lambda a: PassThroughLimiter())
+    monkeypatch.setattr(CallApi, "get_hedge_policy", lambda a: None)
+    return state
+
+
+def ask(args):
+    return cascade_call(args, "prompt", "model-a", "pattern",
+                        parse=lambda raw: raw, is_valid=lambda raw: raw.startswith("good"))[0]
+
+
+def test_rejected_response_is_requested_again(llm):
+    llm.client = ScriptedClient(["malformed", "good answer"])
+    assert ask(llm.args) == "malformed"
+    # the retry of the task sends the same prompt and must not replay the rejected answer
+    assert ask(llm.args) == "good answer"
+    assert llm.client.requests == 2
+    # accepted answers are served from the cache
+    assert ask(llm.args) == "good answer"
+    assert llm.client.requests == 2
+
+
+def test_replay_reproduces_rejected_responses(llm):
+    llm.client = ScriptedClient(["malformed"])
+    assert ask(llm.args) == "malformed"
+    llm.args.llm_cache_mode = "replay"
+    assert ask(llm.args) == "malformed"
+    assert llm.client.requests == 1
+
+
+def test_reject_unknown_key(tmp_path):
+    cache = LLMResponseCache(str(tmp_path))
+    assert not cache.reject("0" * 64)
+    cache.put("1" * 64, "answer")
+    assert cache.reject("1" * 64)
+    assert cache.get("1" * 64) is None
+    assert cache.get("1" * 64, include_rejected=True) == "answer"
@@ -0,0 +1,50 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.utils.MockLLMServer import start_mock_server
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**behavior):
+        servers.append(start_mock_server(port=0, seed=0, **behavior))
+        return f"http://127.0.0.1:{servers[-1].server_port}/v1"
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def chat(base_url, prompt):
+    request = urllib.request.Request(
+        base_url + "/chat/completions",
+        data=json.dumps({"model": "mock", "messages": [{"role": "user", "content": prompt}]}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_scripted_pattern_answer(serve):
+    base_url = serve()
+    prompt = "Describe the segment with **speed_pattern** and the other fields.\n[JSON OUTPUT]"
+    completion = chat(base_url, prompt)
+    fields = json.loads(completion["choices"][0]["message"]["content"])
+    assert set(fields) == {"speed_pattern", "course_pattern", "heading_pattern", "intent"}
+    assert completion["usage"]["total_tokens"] > 0
+    # the same prompt always gets the same answer
+    assert chat(base_url, prompt)["choices"] == completion["choices"]
+
+
+def test_throttled_request_gets_429_with_retry_after(serve):
+    base_url = serve(throttle_rate=1.0)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        chat(base_url, "**speed_pattern**")
+    assert error.value.code == 429
+    assert error.value.headers["Retry-After"] == "1"
+    assert json.loads(error.value.read())["error"]["type"] == "rate_limit"
@@ -0,0 +1,58 @@
+import time
+import threading
+
+from src.modules.M2_BehaviorAbstraction import PatternBatcher
+
+
+class SlowBatcher(PatternBatcher):
+    """PatternBatcher whose LLM call is replaced by a slow labeller echoing each segment"""
+    def __init__(self, max_batch, token_budget, max_wait, label_seconds):
+        super().__init__(max_batch, token_budget, max_wait)
+        self.label_seconds = label_seconds
+        self.batches = []
+
+    def _label(self, args, SDKG, batch):
+        self.batches.append([entry['text'] for entry in batch])
+        time.sleep(self.label_seconds)
+        return {i: f"block of {entry['text']}" for i, entry in enumerate(batch)}
+
+
+def run_submitters(batcher, texts, timeout):
+    results = {}
+
+    def submit(text):
+        results[text] = batcher.submit(None, None, text)
+
+    threads = [threading.Thread(target=submit, args=(text,), daemon=True) for text in texts]
+    for thread in threads:
+        thread.start()
+    end = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(timeout=max(0.0, end - time.monotonic()))
+    assert not any(thread.is_alive() for thread in threads), "submitters did not finish"
+    return results
+
+
+def test_concurrent_submitters_with_slow_labeller_finish():
+    texts = [f"segment {i}" for i in range(3)]
+    batcher = SlowBatcher(max_batch=2, token_budget=1e9, max_wait=0.2, label_seconds=1.0)
+    results = run_submitters(batcher, texts, timeout=10)
+    assert results == {text: f"block of {text}" for text in texts}
+    assert sorted(text for batch in batcher.batches for text in batch) == texts
+
+
+def test_many_submitters_each_labelled_once():
+    texts = [f"segment {i}" for i in range(9)]
+    batcher = SlowBatcher(max_batch=2, token_budget=1e9, max_wait=0.1, label_seconds=0.3)
+    results = run_submitters(batcher, texts, timeout=20)
+    assert results == {text: f"block of {text}" for text in texts}
+    assert sorted(text for batch in batcher.batches for text in batch) == sorted(texts)
+    assert all(len(batch) <= 2 for batch in batcher.batches)
+
+
+def test_token_budget_splits_batches():
+    texts = [f"segment {i}" + "x" * 400 for i in range(4)]
+    batcher = SlowBatcher(max_batch=4, token_budget=150, max_wait=0.1, label_seconds=0.2)
+    results = run_submitters(batcher, texts, timeout=20)
+    assert results == {text: f"block of {text}" for text in texts}
+    assert all(len(batch) == 1 for batch in batcher.batches)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from src.utils.SparseWeights import SparseWeights
+
+
+def reference_top_k(graph, row_keys, k):
+    """Dict-based selection of SDKG.select_Cb before the sparse weights: stable sort on the product"""
+    candidates = {}
+    for row_key in dict.fromkeys(row_keys):
+        for col_key, weight in graph.get(row_key, {}).items():
+            candidates[col_key] = candidates.get(col_key, 1.0) * (float(weight) + 1.0)
+    scored = sorted(candidates.items(), key=lambda item: item[1], reverse=True)
+    return [col_key for col_key, _ in scored[:k]]
+
+
+def build(rng, n_rows, n_cols, n_adds):
+    """Random graph with small weights (many ties) as SparseWeights and as nested dicts"""
+    weights, graph = SparseWeights(), {}
+    for _ in range(n_adds):
+        row, col = f"r{rng.integers(n_rows)}", f"c{rng.integers(n_cols)}"
+        weights.add(row, col)
+        graph.setdefault(row, {})[col] = graph.get(row, {}).get(col, 0) + 1
+    return weights, graph
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_top_k_matches_dict_selection_including_ties(seed):
+    rng = np.random.default_rng(seed)
+    weights, graph = build(rng, n_rows=12, n_cols=40, n_adds=int(rng.integers(20, 300)))
+    queries = [[f"r{i}" for i in rng.integers(0, 14, int(rng.integers(1, 6)))] for _ in range(20)]
+    for k in (1, 3, 10, 100):
+        results = weights.top_k(queries, k)
+        for row_keys, scored in zip(queries, results):
+            assert [col_key for col_key, _ in scored] == reference_top_k(graph, row_keys, k)
+
+
+def test_ties_keep_insertion_order_within_row():
+    weights = SparseWeights()
+    # c1 is created first globally, but row b reaches c2 before c1
+    weights.add("a", "c1")
+    weights.add("b", "c2")
+    weights.add("b", "c1")
+    assert [col for col, _ in weights.top_k([["b"]], 2)[0]] == ["c2", "c1"]
+    # a later add to an existing entry does not move it
+    weights.add("b", "c2")
+    weights.add("b", "c1")
+    assert [col for col, _ in weights.top_k([["b"]], 2)[0]] == ["c2", "c1"]
+    # the tie at the cut-off goes to the first reached column
+    assert [col for col, _ in weights.top_k([["b"]], 1)[0]] == ["c2"]
+
+
+def test_ties_between_equal_products_with_different_factors():
+    weights = SparseWeights()
+    # (2 + 1) * (1 + 1) == (5 + 1): equal products, log sums may differ in the last bits
+    weights.add("x", "late", 5)
+    for delta, row in ((2, "x"), (1, "y")):
+        weights.add(row, "early", delta)
+    assert [col for col, _ in weights.top_k([["y", "x"]], 2)[0]] == ["early", "late"]
+
+
+@pytest.mark.parametrize("compact_min, compact_ratio", [(1024, 64), (3, 4), (0, 1)])
+@pytest.mark.parametrize("seed", range(10))
+def test_interleaved_adds_and_queries(seed, compact_min, compact_ratio):
+    rng = np.random.default_rng(seed)
+    weights, graph = SparseWeights(), {}
+    weights.COMPACT_MIN_PENDING, weights.COMPACT_RATIO = compact_min, compact_ratio
+    for _ in range(200):
+        for _ in range(int(rng.integers(0, 4))):
+            row, col, delta = f"r{rng.integers(10)}", f"c{rng.integers(30)}", int(rng.integers(1, 3))
+            weights.add(row, col, delta)
+            graph.setdefault(row, {})[col] = graph.get(row, {}).get(col, 0) + delta
+        queries = [[f"r{i}" for i in rng.integers(0, 12, int(rng.integers(1, 5)))] for _ in range(3)]
+        k = int(rng.integers(1, 8))
+        for row_keys, scored in zip(queries, weights.top_k(queries, k)):
+            assert [col_key for col_key, _ in scored] == reference_top_k(graph, row_keys, k)
+
+
+def test_query_after_a_few_adds_does_not_compact():
+    weights = SparseWeights()
+    for i in range(5000):
+        weights.add(f"r{i % 50}", f"c{i % 700}")
+    weights.top_k([["r0"]], 5)
+    compacted = weights.indices
+    weights.add("r0", "c1")
+    weights.add("r_new", "c_new", 100)
+    assert [col for col, _ in weights.top_k([["r_new", "r0"]], 1)[0]] == ["c_new"]
+    assert weights.indices is compacted and len(weights.pending[0]) == 2
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data import AISDataset as ais_dataset
+from src.data.AISDataset import AISDataset, write_spill_run, merge_spill_runs
+from src.data.utils.ais_data_storage import load_ais_data, ais_data_exists
+
+
+def random_run(rng, n):
+    run = pd.DataFrame({
+        "mmsi": rng.integers(0, 6, n).astype(float),
+        "timestamp": pd.Timestamp("2024-03-01") + pd.to_timedelta(rng.integers(0, 5, n), unit="min"),
+        "row": np.arange(n),
+    })
+    run.loc[rng.random(n) < 0.1, "timestamp"] = pd.NaT
+    return run.sort_values(["mmsi", "timestamp"], kind="mergesort")
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_merge_matches_stable_sort_of_concatenated_runs(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    runs = [random_run(rng, int(rng.integers(1, 40))).assign(run=i) for i in range(int(rng.integers(1, 6)))]
+    run_files = []
+    for i, run in enumerate(runs):
+        run_files.append(str(tmp_path / f"run_{i}.pkl"))
+        write_spill_run(run, run_files[-1], block_rows=int(rng.integers(1, 8)))
+
+    merged = pd.concat(list(merge_spill_runs(run_files)), ignore_index=True)
+    expected = pd.concat(runs, ignore_index=True).sort_values(["mmsi", "timestamp"], kind="mergesort")
+    pd.testing.assert_frame_equal(merged, expected.reset_index(drop=True))
+
+
+def clean_standard_columns(df, is_aisdk):
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df
+
+
+def make_dataset(tmp_path, storage_format, partition_by="mmsi_hash", chunk_size=7, name="streamed"):
+    dataset = AISDataset.__new__(AISDataset)
+    dataset.dataset_identifier = name
+    dataset.min_time_interval, dataset.max_time_interval = 30, 600
+    dataset.storage_format, dataset.partition_by, dataset.num_partitions = storage_format, partition_by, 4
+    dataset.ingest_chunk_size, dataset.ingest_workers = chunk_size, 1
+    dataset.CleanedFiltered_data_dir = str(tmp_path) + "/"
+    dataset.cleaned_data_file = dataset.CleanedFiltered_data_dir + name + "_cleaned.csv"
+    dataset.filtered_data_file = dataset.CleanedFiltered_data_dir + name + "_filtered.csv"
+    dataset.cleaned_data_statistics_file = dataset.CleanedFiltered_data_dir + "cleaned_data_statistics.csv"
+    dataset.filtered_data_statistics_file = dataset.CleanedFiltered_data_dir + "filtered_data_statistics.csv"
+    return dataset
+
+
+@pytest.fixture
+def raw_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(ais_dataset, "clean_and_standardize_ais_data", clean_standard_columns)
+    rng = np.random.default_rng(0)
+    csv_files = []
+    for i in range(2):
+        n = 60
+        mmsi = (rng.integers(0, 8, n) + 219000000).astype(float)
+        mmsi[rng.random(n) < 0.1] = np.nan
+        raw = pd.DataFrame({
+            "mmsi": mmsi,
+            "timestamp": (pd.Timestamp("2024-03-01") + pd.to_timedelta(rng.integers(0, 3600, n), unit="s")).astype(str),
+            "sog": rng.uniform(0, 20, n).round(1),
+        })
+        csv_files.append(str(tmp_path / f"raw_{i}.csv"))
+        raw.to_csv(csv_files[-1], index=False)
+    return csv_files
+
+
+def load_sorted(dataset, file_path):
+    df = load_ais_data(file_path, dataset.storage_format)
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df.sort_values(["mmsi", "timestamp", "sog"], kind="mergesort").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("storage_format", ["csv", "parquet"])
+def test_streaming_ingestion_matches_in_memory(tmp_path, raw_files, storage_format):
+    if storage_format == "parquet":
+        pytest.importorskip("pyarrow")
+    streamed = make_dataset(tmp_path, storage_format, name="streamed")
+    in_memory = make_dataset(tmp_path, storage_format, chunk_size=0, name="in_memory")
+    for dataset in (streamed, in_memory):
+        dataset.prepare_clean_and_standardize_data(raw_files)
+        dataset.prepare_filtered_data()
+
+    # the streaming path drops (and counts) records without MMSI
+    expected = load_sorted(in_memory, in_memory.cleaned_data_file).dropna(subset=["mmsi"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(load_sorted(streamed, streamed.cleaned_data_file), expected, check_dtype=False)
+    stats = pd.read_csv(streamed.cleaned_data_statistics_file)
+    raw_missing = sum(pd.read_csv(csv_file)["mmsi"].isna().sum() for csv_file in raw_files)
+    assert stats["Records without MMSI (dropped)"].sum() == raw_missing > 0
+    summary = stats[stats["Dataset Identifier"] == "streamed_cleaned.csv"].iloc[0]
+    assert summary["Number of unique MMSI"] == expected["mmsi"].nunique()
+    assert summary["Total number of records"] == len(expected)
+
+    filtered, expected = load_sorted(streamed, streamed.filtered_data_file), load_sorted(in_memory, in_memory.filtered_data_file)
+    expected = expected.dropna(subset=["mmsi"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(filtered.drop(columns="TrajID"), expected.drop(columns="TrajID"), check_dtype=False)
+    # TrajIDs are numbered in storage order, but cut the same trajectories
+    np.testing.assert_array_equal(pd.factorize(filtered["TrajID"])[0], pd.factorize(expected["TrajID"])[0])
+
+
+def test_streaming_filter_rejects_date_partitions_before_writing(tmp_path, raw_files):
+    pytest.importorskip("pyarrow")
+    dataset = make_dataset(tmp_path, "parquet", partition_by="date")
+    dataset.prepare_clean_and_standardize_data(raw_files)
+    with pytest.raises(ValueError):
+        dataset.prepare_filtered_data_streaming()
+    assert not ais_data_exists(dataset.filtered_data_file, "parquet")
+
+    dataset.prepare_filtered_data()
+    assert len(load_ais_data(dataset.filtered_data_file, "parquet")) > 0
+
+
+def test_streaming_filter_rejects_interleaved_mmsis_before_writing(tmp_path):
+    dataset = make_dataset(tmp_path, "csv", chunk_size=2)
+    pd.DataFrame({"mmsi": [1, 1, 2, 2, 1], "timestamp": pd.date_range("2024-03-01", periods=5, freq="min"),
+                  "sog": 1.0}).to_csv(dataset.cleaned_data_file, index=False)
+    with pytest.raises(ValueError):
+        dataset.prepare_filtered_data_streaming()
+    assert not ais_data_exists(dataset.filtered_data_file, "csv")
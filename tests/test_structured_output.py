@@ -0,0 +1,40 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils import StructuredOutput
+from src.utils.StructuredOutput import structured_text
+
+TASK = "Explain the maneuver of vessel 219000001 near the harbour entrance."
+
+
+@pytest.fixture
+def followups(monkeypatch):
+    sent = []
+
+    def answer(args, prompt, llm_model, llm_purpose, json_output=False):
+        sent.append(prompt)
+        return json.dumps({"regulatory_rule_cue": "Undetermined", "operational_protocol_rationale": "steady transit"})
+    monkeypatch.setattr(StructuredOutput, "call_qwen_api", answer)
+    monkeypatch.setattr(StructuredOutput, "reject_llm_response", lambda *args: None)
+    return sent
+
+
+def json_args():
+    return SimpleNamespace(llm_output_format="json", llm_repair_followups=1)
+
+
+def test_invalid_json_followup_repeats_the_task(followups):
+    text = structured_text(json_args(), TASK, "I think the vessel is turning.", "explanation_composer", "mock", "explanation")
+    assert len(followups) == 1 and TASK in followups[0]
+    assert "is not valid JSON" in followups[0] and "I think the vessel is turning." in followups[0]
+    assert "Operational Protocol Rationale: steady transit" in text
+
+
+def test_missing_fields_followup_stays_short(followups):
+    raw_output = json.dumps({"regulatory_rule_cue": "COLREG rule 9"})
+    text = structured_text(json_args(), TASK, raw_output, "explanation_composer", "mock", "explanation")
+    assert len(followups) == 1 and TASK not in followups[0]
+    assert "misses the fields operational_protocol_rationale" in followups[0]
+    assert "Operational Protocol Rationale: steady transit" in text